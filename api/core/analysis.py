@@ -0,0 +1,111 @@
+"""
+Analyse de texte partagée (index vectoriel, workers d'ingestion, analyse d'intention).
+
+Chaîne : repli des accents (NFKD), minuscules, découpage, mots vides français,
+racinisation légère (pluriels et suffixes courants). Les textes courts (requêtes,
+champs de métadonnées) sont mémorisés dans un cache borné.
+"""
+from __future__ import annotations
+
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Version de la chaîne d'analyse : un index construit avec une autre version est ré-analysé.
+VERSION = 2
+
+CACHE_SIZE = max(0, int(os.getenv("ELYON_ANALYSIS_CACHE_SIZE", "4096")))
+# Au-delà de cette taille, le texte (document complet) n'est pas mis en cache.
+CACHE_MAX_CHARS = 2048
+
+_WORD_REGEX = re.compile(r"[^\W_]+(?:_[^\W_]+)*")
+_LIGATURES = str.maketrans({"œ": "oe", "Œ": "oe", "æ": "ae", "Æ": "ae", "ß": "ss"})
+
+STOP_WORDS = frozenset(
+    """
+    au aux avec ce ces cet cette dans de des du elle elles en et eux il ils je la le les leur
+    leurs lui ma mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se
+    ses son sur ta te tes toi ton tu un une vos votre vous ete etre avoir ai as avons avez ont
+    peux peut peuvent pouvez pouvons
+    est sont suis es etes etait etaient sera seront fait ca cela ceci celui celle ceux celles
+    donc or ni car si sans sous comme tres plus moins aussi alors ainsi tout tous toute toutes
+    deja encore ici quel quelle quels quelles dont lequel laquelle lesquels lesquelles
+    """.split()
+)
+
+# Suffixes retirés par la racinisation légère, du plus long au plus court.
+SUFFIXES = tuple(
+    sorted(
+        """
+        issements issement atrices atrice ateurs ateur ations ation ements ement ances ance
+        ences ence ismes isme istes iste ables able ites ite euses euse eux ives ive ifs if
+        eraient erions eriez erons eront erais erait erai erez iez ees ee es er ez e s x
+        """.split(),
+        key=len,
+        reverse=True,
+    )
+)
+_MIN_STEM = 3
+
+
+def fold(text: str) -> str:
+    """Minuscules sans accents : ``"Résumé"`` -> ``"resume"``."""
+    decomposed = unicodedata.normalize("NFKD", (text or "").translate(_LIGATURES))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Racinisation légère d'un mot déjà replié (les mots courts ou numériques sont conservés)."""
+    if len(word) < 5 or not word.isalpha():
+        return word
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            return word[: -len(suffix)]
+    return word
+
+
+def _analyze(text: str) -> Tuple[Tuple[str, str], ...]:
+    pairs = []
+    for match in _WORD_REGEX.finditer(fold(text)):
+        word = match.group(0)
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        pairs.append((word, stem(word)))
+    return tuple(pairs)
+
+
+_analyze_cached = lru_cache(maxsize=CACHE_SIZE)(_analyze) if CACHE_SIZE else _analyze
+
+
+def analyze(text: str) -> Tuple[Tuple[str, str], ...]:
+    """Paires ``(mot replié, terme indexé)`` du texte, stop-words exclus."""
+    text = text or ""
+    if len(text) > CACHE_MAX_CHARS:
+        return _analyze(text)
+    return _analyze_cached(text)
+
+
+def tokenize(text: str) -> List[str]:
+    """Termes indexés du texte (ceux stockés dans l'index et comparés aux requêtes)."""
+    return [term for _, term in analyze(text)]
+
+
+def surface(text: str) -> List[Tuple[str, str]]:
+    """Paires ``(mot tel qu'écrit, en minuscules ; terme indexé)`` du texte, stop-words exclus."""
+    pairs = []
+    for match in _WORD_REGEX.finditer((text or "").lower()):
+        indexed = term(match.group(0))
+        if indexed is not None:
+            pairs.append((match.group(0), indexed))
+    return pairs
+
+
+def term(word: str) -> Optional[str]:
+    """Terme indexé d'un mot isolé (``None`` pour un mot vide ou trop court)."""
+    folded = fold(word).strip()
+    if len(folded) < 2 or folded in STOP_WORDS or not _WORD_REGEX.fullmatch(folded):
+        return None
+    return stem(folded)
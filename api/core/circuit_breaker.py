@@ -0,0 +1,232 @@
+"""
+Disjoncteur par backend LLM (``lmstudio``, ``openai``, ``external``...).
+
+États : ``closed`` (appels normaux), ``open`` (appels refusés aussitôt par
+``BreakerOpenError``, le repli local prend le relais sans attendre de timeout) et
+``half_open`` (un seul appel d'essai après ``ELYON_BREAKER_OPEN_SECONDS`` : succès,
+le disjoncteur se referme ; échec, il se rouvre).
+Il s'ouvre quand, sur la fenêtre glissante ``ELYON_BREAKER_WINDOW`` (secondes),
+au moins ``ELYON_BREAKER_MIN_CALLS`` appels ont échoué à ``ELYON_BREAKER_FAILURE_RATE``
+ou plus. Une sonde de fond (``GET /v1/models``) met en cache la santé de chaque
+backend enregistré : disjoncteur fermé, chaque sonde compte dans la fenêtre comme un
+appel ; ouvert, il se referme dès que le backend répond de nouveau.
+Seules les erreurs de transport, les timeouts et les réponses 5xx comptent comme échecs.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+try:
+    from . import http_pool
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import http_pool  # type: ignore[import]
+
+WINDOW = max(1.0, float(os.getenv("ELYON_BREAKER_WINDOW", "30")))
+MIN_CALLS = max(1, int(os.getenv("ELYON_BREAKER_MIN_CALLS", "4")))
+FAILURE_RATE = min(1.0, max(0.0, float(os.getenv("ELYON_BREAKER_FAILURE_RATE", "0.5"))))
+OPEN_SECONDS = max(0.5, float(os.getenv("ELYON_BREAKER_OPEN_SECONDS", "15")))
+PROBE_INTERVAL = float(os.getenv("ELYON_BREAKER_PROBE_INTERVAL", "10"))  # 0 = pas de sonde
+PROBE_TIMEOUT = 2.0
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class BreakerOpenError(RuntimeError):
+    """Appel refusé : le disjoncteur du backend est ouvert."""
+
+    def __init__(self, backend: str) -> None:
+        super().__init__(f"backend {backend} indisponible (disjoncteur ouvert)")
+        self.backend = backend
+
+
+class _Breaker:
+    __slots__ = ("state", "calls", "opened_at", "trial", "probe_url", "healthy", "probed_at", "trips")
+
+    def __init__(self) -> None:
+        self.state = CLOSED
+        self.calls: Deque[Tuple[float, bool]] = deque()  # (horodatage, succès) sur la fenêtre
+        self.opened_at = 0.0
+        self.trial = False  # appel d'essai en cours (half_open)
+        self.probe_url: Optional[str] = None
+        self.healthy: Optional[bool] = None  # dernier résultat de sonde
+        self.probed_at = 0.0
+        self.trips = 0
+
+
+_LOCK = threading.Lock()
+_breakers: Dict[str, _Breaker] = {}
+_probe_thread: Optional[threading.Thread] = None
+
+
+def _get_locked(backend: str) -> _Breaker:
+    breaker = _breakers.get(backend)
+    if breaker is None:
+        breaker = _breakers[backend] = _Breaker()
+    return breaker
+
+
+def _open_locked(breaker: _Breaker, now: float) -> None:
+    if breaker.state != OPEN:
+        breaker.trips += 1
+    breaker.state = OPEN
+    breaker.opened_at = now
+    breaker.trial = False
+
+
+def _close_locked(breaker: _Breaker) -> None:
+    breaker.state = CLOSED
+    breaker.calls.clear()
+    breaker.trial = False
+
+
+def allow(backend: str) -> bool:
+    """Le backend peut-il être appelé ? (en half_open, un seul appel d'essai à la fois)"""
+    backend = backend.lower()
+    now = time.monotonic()
+    with _LOCK:
+        breaker = _get_locked(backend)
+        if breaker.state == OPEN and now - breaker.opened_at >= OPEN_SECONDS:
+            breaker.state = HALF_OPEN
+        if breaker.state == CLOSED:
+            return True
+        if breaker.state == HALF_OPEN and not breaker.trial:
+            breaker.trial = True
+            return True
+        return False
+
+
+def record(backend: str, success: Optional[bool]) -> None:
+    """Résultat d'un appel autorisé par ``allow`` (``None`` : appel abandonné, sans verdict)."""
+    backend = backend.lower()
+    now = time.monotonic()
+    with _LOCK:
+        breaker = _get_locked(backend)
+        if breaker.state == HALF_OPEN:
+            breaker.trial = False
+            if success:
+                _close_locked(breaker)
+            elif success is not None:
+                _open_locked(breaker, now)
+            return
+        if success is None or breaker.state != CLOSED:
+            return
+        _record_window_locked(breaker, success, now)
+
+
+def _record_window_locked(breaker: _Breaker, success: bool, now: float) -> None:
+    """Ajoute un résultat à la fenêtre glissante (disjoncteur fermé) ; l'ouvre au-delà du seuil."""
+    calls = breaker.calls
+    calls.append((now, success))
+    while calls and now - calls[0][0] > WINDOW:
+        calls.popleft()
+    failures = sum(1 for _, ok in calls if not ok)
+    if not success and failures >= MIN_CALLS and failures >= FAILURE_RATE * len(calls):
+        _open_locked(breaker, now)
+
+
+def is_failure(exc: BaseException) -> bool:
+    """Erreur imputable au backend (transport, timeout, 5xx) et non à la requête (4xx)."""
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return not isinstance(status, int) or status >= 500
+
+
+@contextmanager
+def guard(backend: str) -> Iterator[None]:
+    """
+    Encadre un appel au backend : ``BreakerOpenError`` immédiate si le disjoncteur est
+    ouvert, résultat enregistré sinon. Utilisable dans du code synchrone ou asynchrone.
+    """
+    if not allow(backend):
+        raise BreakerOpenError(backend)
+    outcome: Optional[bool] = None
+    try:
+        yield
+        outcome = True
+    except Exception as exc:
+        outcome = not is_failure(exc)
+        raise
+    finally:
+        record(backend, outcome)
+
+
+def state(backend: str) -> str:
+    with _LOCK:
+        breaker = _breakers.get(backend.lower())
+        if breaker is None:
+            return CLOSED
+        if breaker.state == OPEN and time.monotonic() - breaker.opened_at >= OPEN_SECONDS:
+            return HALF_OPEN
+        return breaker.state
+
+
+def _probe_once() -> None:
+    with _LOCK:
+        targets = [(name, breaker.probe_url) for name, breaker in _breakers.items() if breaker.probe_url]
+    for name, url in targets:
+        try:
+            response = http_pool.client(name).get(url, timeout=PROBE_TIMEOUT)
+            healthy = response.status_code < 500
+        except Exception:
+            healthy = False
+        with _LOCK:
+            breaker = _get_locked(name)
+            breaker.healthy = healthy
+            breaker.probed_at = time.time()
+            if breaker.state == CLOSED:
+                # une sonde compte comme un appel : une seule sonde en échec n'ouvre pas le disjoncteur
+                _record_window_locked(breaker, healthy, time.monotonic())
+            elif healthy:
+                _close_locked(breaker)  # backend revenu : inutile d'attendre un appel d'essai
+
+
+def _probe_loop() -> None:
+    while True:
+        _probe_once()
+        time.sleep(PROBE_INTERVAL)
+
+
+def register_probe(backend: str, url: str) -> None:
+    """Sonde périodiquement ``url`` (``GET``) pour ``backend`` ; démarre le thread de sonde au besoin."""
+    global _probe_thread
+    if PROBE_INTERVAL <= 0 or not http_pool.enabled():
+        return
+    with _LOCK:
+        _get_locked(backend.lower()).probe_url = url
+        if _probe_thread is not None:
+            return
+        _probe_thread = threading.Thread(target=_probe_loop, name="breaker-probe", daemon=True)
+    _probe_thread.start()
+
+
+def models_url(chat_url: str) -> str:
+    """URL ``/models`` d'un backend compatible OpenAI à partir de son URL ``/chat/completions``."""
+    base = chat_url.rstrip("/")
+    if base.endswith("/chat/completions"):
+        base = base[: -len("/chat/completions")]
+    return base + "/models"
+
+
+def snapshot() -> Dict[str, Dict[str, object]]:
+    """État de chaque backend connu, pour ``/self`` et la trace de /chat."""
+    now = time.monotonic()
+    with _LOCK:
+        out: Dict[str, Dict[str, object]] = {}
+        for name, breaker in _breakers.items():
+            current = breaker.state
+            if current == OPEN and now - breaker.opened_at >= OPEN_SECONDS:
+                current = HALF_OPEN
+            failures = sum(1 for ts, ok in breaker.calls if not ok and now - ts <= WINDOW)
+            out[name] = {
+                "state": current,
+                "failures": failures,
+                "calls": sum(1 for ts, _ in breaker.calls if now - ts <= WINDOW),
+                "trips": breaker.trips,
+                "healthy": breaker.healthy,
+                "probed_at": breaker.probed_at or None,
+            }
+        return out
@@ -0,0 +1,248 @@
+"""
+Préparation des documents du corpus (lecture, décodage, tokenisation), en série
+ou répartie sur un pool de processus pour les réindexations complètes.
+
+Lancement (réindexation complète, ou synchronisation incrémentale) :
+    python -m api.core.corpus_ingest --workers 8
+    python -m api.core.corpus_ingest --sync
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from . import analysis
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import analysis  # type: ignore[import]
+
+# (doc_id éventuel, texte, métadonnées, fréquences des termes, longueur en tokens)
+PreparedDoc = Tuple[Optional[str], str, Dict[str, object], Dict[str, int], int]
+
+DEFAULT_EXTENSIONS: Tuple[str, ...] = (".txt", ".md", ".json")
+
+# Découpage des fichiers en passages : "size" (fenêtres glissantes), "headings"
+# (sections markdown, redécoupées si trop longues) ou "none" (fichier entier).
+CHUNK_MODE = os.getenv("ELYON_INDEX_CHUNK_MODE", "size").strip().lower() or "size"
+CHUNK_SIZE = max(100, int(os.getenv("ELYON_INDEX_CHUNK_SIZE", "800")))
+CHUNK_OVERLAP = max(0, int(os.getenv("ELYON_INDEX_CHUNK_OVERLAP", "120")))
+PASSAGE_SEP = "#"
+
+_HEADING_REGEX = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+
+def prepare(text: str, doc_id: Optional[str] = None, metadata: Optional[Dict[str, object]] = None) -> Optional[PreparedDoc]:
+    """Tokenise un texte ; retourne ``None`` s'il ne contient aucun token."""
+    tokens = analysis.tokenize(text)
+    if not tokens:
+        return None
+    meta = dict(metadata) if isinstance(metadata, dict) else {}
+    return (doc_id or None, text, meta, dict(Counter(tokens)), len(tokens))
+
+
+def _size_windows(text: str, start: int, end: int, size: int, overlap: int) -> List[Tuple[int, int]]:
+    """Fenêtres ``[start, end)`` d'environ ``size`` caractères, coupées sur un blanc."""
+    windows: List[Tuple[int, int]] = []
+    pos = start
+    while pos < end:
+        stop = min(end, pos + size)
+        if stop < end:
+            cut = text.rfind(" ", pos + size // 2, stop)
+            cut = max(cut, text.rfind("\n", pos + size // 2, stop))
+            if cut > pos:
+                stop = cut
+        windows.append((pos, stop))
+        if stop >= end:
+            break
+        next_pos = max(pos + 1, stop - overlap)
+        # repartir au début d'un mot
+        while next_pos < stop and not text[next_pos - 1].isspace():
+            next_pos += 1
+        pos = next_pos if next_pos < stop else stop
+    return windows
+
+
+def chunk_text(
+    text: str,
+    mode: Optional[str] = None,
+    size: Optional[int] = None,
+    overlap: Optional[int] = None,
+) -> List[Tuple[int, int, Optional[str]]]:
+    """Découpe ``text`` en passages ``(début, fin, titre de section)`` selon le mode configuré."""
+    mode = (mode or CHUNK_MODE).lower()
+    size = size or CHUNK_SIZE
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    overlap = min(overlap, size // 2)
+    if mode == "none" or not text:
+        return [(0, len(text), None)]
+    sections: List[Tuple[int, int, Optional[str]]] = []
+    if mode == "headings":
+        matches = list(_HEADING_REGEX.finditer(text))
+        if matches and matches[0].start() > 0:
+            sections.append((0, matches[0].start(), None))
+        for idx, match in enumerate(matches):
+            stop = matches[idx + 1].start() if idx + 1 < len(matches) else len(text)
+            sections.append((match.start(), stop, match.group(1)))
+    if not sections:
+        sections = [(0, len(text), None)]
+    chunks: List[Tuple[int, int, Optional[str]]] = []
+    for start, end, heading in sections:
+        for w_start, w_end in _size_windows(text, start, end, size, overlap):
+            if text[w_start:w_end].strip():
+                chunks.append((w_start, w_end, heading))
+    return chunks or [(0, len(text), None)]
+
+
+def prepare_passages(
+    text: str,
+    doc_id: str,
+    metadata: Optional[Dict[str, object]] = None,
+    mode: Optional[str] = None,
+) -> List[PreparedDoc]:
+    """
+    Découpe un document en passages indexables ``<doc_id>#<n>`` portant
+    ``parent_id``, ``start`` et ``end`` dans leurs métadonnées.
+    En mode ``none``, le document est préparé tel quel.
+    """
+    mode = (mode or CHUNK_MODE).lower()
+    if mode == "none":
+        doc = prepare(text, doc_id=doc_id, metadata=metadata)
+        return [doc] if doc is not None else []
+    passages: List[PreparedDoc] = []
+    for idx, (start, end, heading) in enumerate(chunk_text(text, mode)):
+        meta = dict(metadata) if isinstance(metadata, dict) else {}
+        meta.update({"parent_id": doc_id, "start": start, "end": end})
+        if heading:
+            meta["heading"] = heading
+        doc = prepare(text[start:end], doc_id=f"{doc_id}{PASSAGE_SEP}{idx}", metadata=meta)
+        if doc is not None:
+            passages.append(doc)
+    return passages
+
+
+def read_file(path: Path, metadata: Optional[Dict[str, object]] = None) -> List[PreparedDoc]:
+    return read_file_with_fingerprint(path, metadata)[0]
+
+
+def fingerprint(path: Path, data: Optional[bytes] = None) -> Dict[str, object]:
+    """Empreinte d'un fichier pour la synchronisation incrémentale (mtime, taille, SHA-256)."""
+    stat = path.stat()
+    entry: Dict[str, object] = {"doc_id": path.stem, "mtime": stat.st_mtime, "size": stat.st_size}
+    if data is not None:
+        entry["sha256"] = hashlib.sha256(data).hexdigest()
+    return entry
+
+
+def read_file_with_fingerprint(
+    path: Path, metadata: Optional[Dict[str, object]] = None
+) -> Tuple[List[PreparedDoc], Optional[Dict[str, object]]]:
+    """Lit un fichier et retourne ses passages préparés avec son empreinte."""
+    try:
+        data = path.read_bytes()
+        text = data.decode("utf-8")
+        entry = fingerprint(path, data)
+    except Exception:
+        return [], None
+    meta = metadata.copy() if isinstance(metadata, dict) else {}
+    meta.setdefault("path", str(path))
+    meta.setdefault("title", re.sub(r"[_\-]+", " ", path.stem).strip())
+    return prepare_passages(text, path.stem, metadata=meta), entry
+
+
+def list_files(folder: Path, extensions: Tuple[str, ...] = DEFAULT_EXTENSIONS) -> List[Path]:
+    return [p for p in folder.rglob("*") if p.is_file() and p.suffix.lower() in extensions]
+
+
+PreparedBatch = Tuple[List[PreparedDoc], Dict[str, int], Dict[str, Dict[str, object]]]
+
+
+def _prepare_batch(paths: Sequence[str], metadata: Optional[Dict[str, object]]) -> PreparedBatch:
+    """Worker : prépare un lot de fichiers, calcule le DF partiel et les empreintes du lot."""
+    docs: List[PreparedDoc] = []
+    df: Counter = Counter()
+    fingerprints: Dict[str, Dict[str, object]] = {}
+    for raw_path in paths:
+        passages, entry = read_file_with_fingerprint(Path(raw_path), metadata)
+        if entry is not None:
+            fingerprints[raw_path] = entry
+        for doc in passages:
+            docs.append(doc)
+            df.update(doc[3].keys())
+    return docs, dict(df), fingerprints
+
+
+def prepare_files(
+    paths: Iterable[Path],
+    metadata: Optional[Dict[str, object]] = None,
+    workers: int = 1,
+) -> PreparedBatch:
+    """
+    Prépare tous les fichiers et retourne ``(documents, df, empreintes)``. Avec ``workers > 1``,
+    la lecture et la tokenisation sont réparties sur un ``ProcessPoolExecutor`` et
+    les DF partiels sont fusionnés dans le processus parent (ordre des fichiers conservé).
+    """
+    path_list = [str(p) for p in paths]
+    if workers <= 1 or len(path_list) < 2:
+        return _prepare_batch(path_list, metadata)
+    batch_size = max(1, len(path_list) // (workers * 4))
+    batches = [path_list[i : i + batch_size] for i in range(0, len(path_list), batch_size)]
+    docs: List[PreparedDoc] = []
+    df: Counter = Counter()
+    fingerprints: Dict[str, Dict[str, object]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch_docs, batch_df, batch_fp in pool.map(_prepare_batch, batches, [metadata] * len(batches)):
+            docs.extend(batch_docs)
+            df.update(batch_df)
+            fingerprints.update(batch_fp)
+    return docs, dict(df), fingerprints
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Réindexation complète du corpus ÉlyonEU")
+    parser.add_argument("--folder", type=Path, default=None, help="Dossier du corpus (défaut : data/corpus)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Nombre de processus")
+    parser.add_argument(
+        "--ext", action="append", default=None, help="Extension à indexer (répétable, défaut : .txt .md .json)"
+    )
+    parser.add_argument(
+        "--sync", action="store_true", help="Synchronisation incrémentale (fichiers nouveaux/modifiés/supprimés)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        from . import vector_index
+    except ImportError:  # pragma: no cover - exécution directe du module
+        from api.core import vector_index  # type: ignore[import]
+
+    extensions = tuple(e if e.startswith(".") else f".{e}" for e in args.ext) if args.ext else DEFAULT_EXTENSIONS
+    started = time.perf_counter()
+    if args.sync:
+        summary = vector_index.sync_corpus(args.folder, extensions=extensions)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(
+            f"[index] sync en {elapsed:.2f}s : +{len(summary['added'])} ajoutés, "
+            f"~{len(summary['updated'])} modifiés, -{len(summary['removed'])} supprimés, "
+            f"{summary['unchanged']} inchangés",
+            flush=True,
+        )
+        return 0
+    totals = vector_index.reindex_corpus(args.folder, extensions=extensions, workers=max(1, args.workers))
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(
+        f"[index] {totals['documents']} documents ({totals['passages']} passages) réindexés en {elapsed:.2f}s "
+        f"({totals['documents'] / elapsed:.1f} docs/s, {args.workers} workers)",
+        flush=True,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
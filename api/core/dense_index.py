@@ -0,0 +1,338 @@
+"""
+Index dense optionnel (embeddings) pour la recherche hybride de ``vector_index``.
+
+Les embeddings sont calculés par un modèle local exposé via un endpoint
+``/embeddings`` compatible OpenAI (LM Studio). Les vecteurs normalisés sont
+stockés dans une matrice NumPy float32, avec un partitionnement IVF optionnel
+(k-means) ; le calcul des scores est entièrement vectorisé.
+Sans NumPy ou sans ``ELYON_EMBEDDINGS_URL``, le module reste inactif.
+Pendant une réindexation complète, ``stage()`` fait construire une nouvelle matrice à
+part (la recherche garde la matrice courante) que ``publish()`` installe avec le snapshot.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, TypedDict
+
+if TYPE_CHECKING:
+    import httpx
+    import numpy as np
+else:
+    try:
+        import numpy as np
+    except Exception:  # pragma: no cover - dépendance optionnelle
+        np = None
+
+    try:
+        import httpx
+    except Exception:  # pragma: no cover - dépendance optionnelle
+        httpx = None
+
+try:
+    from . import http_pool
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import http_pool  # type: ignore[import]
+
+EMBEDDINGS_URL = os.getenv("ELYON_EMBEDDINGS_URL", "").strip()
+EMBEDDINGS_MODEL = os.getenv("ELYON_EMBEDDINGS_MODEL", "text-embedding-nomic-embed-text-v1.5")
+EMBEDDINGS_BATCH = max(1, int(os.getenv("ELYON_EMBEDDINGS_BATCH", "32")))
+EMBEDDINGS_TIMEOUT = float(os.getenv("ELYON_EMBEDDINGS_TIMEOUT", "30"))
+# Nombre de partitions IVF (0 = recherche exacte sur toute la matrice) et partitions sondées.
+IVF_LISTS = max(0, int(os.getenv("ELYON_DENSE_IVF_LISTS", "0")))
+IVF_NPROBE = max(1, int(os.getenv("ELYON_DENSE_NPROBE", "4")))
+
+MATRIX_FILE = "dense.npy"
+IDS_FILE = "dense_ids.json"
+CENTROIDS_FILE = "dense_ivf.npy"
+
+_LOCK = threading.Lock()
+
+
+class _DenseState(TypedDict):
+    ids: List[str]  # ligne -> doc_id
+    rows: Dict[str, int]  # doc_id -> ligne
+    matrix: Optional[np.ndarray]  # (n, d) float32, lignes normalisées
+    alive: Optional[np.ndarray]  # (n,) bool, False pour les lignes supprimées
+    centroids: Optional[np.ndarray]  # (k, d) float32 (IVF)
+    assign: Optional[np.ndarray]  # (n,) int32, partition de chaque ligne
+
+
+class Stats(TypedDict):
+    enabled: bool
+    vectors: int
+    dim: int
+    ivf_lists: int
+
+
+def _empty() -> _DenseState:
+    return {"ids": [], "rows": {}, "matrix": None, "alive": None, "centroids": None, "assign": None}
+
+
+_state: _DenseState = _empty()  # état interrogé par la recherche
+_staged: Optional[_DenseState] = None  # état en construction (réindexation), cf. ``stage()``
+
+
+def enabled() -> bool:
+    return np is not None and httpx is not None and bool(EMBEDDINGS_URL)
+
+
+def _target() -> _DenseState:
+    """État modifié par l'ingestion : l'état en construction s'il existe, sinon l'état publié."""
+    return _staged if _staged is not None else _state
+
+
+def stage() -> None:
+    """Démarre un index vide, construit à part jusqu'à ``publish()`` (réindexation complète)."""
+    global _staged
+    with _LOCK:
+        _staged = _empty()
+
+
+def publish() -> None:
+    """Installe l'index en construction, s'il y en a un."""
+    global _state, _staged
+    with _LOCK:
+        if _staged is not None:
+            _state, _staged = _staged, None
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def embed(texts: Sequence[str]) -> np.ndarray:
+    """Calcule les embeddings par lots (un appel HTTP par lot) ; retourne une matrice normalisée."""
+    if not enabled():
+        raise RuntimeError("Index dense désactivé (NumPy ou ELYON_EMBEDDINGS_URL manquant)")
+    vectors: List[List[float]] = []
+    client = http_pool.client("embeddings")
+    for start in range(0, len(texts), EMBEDDINGS_BATCH):
+        batch = [t or " " for t in texts[start : start + EMBEDDINGS_BATCH]]
+        response = client.post(
+            EMBEDDINGS_URL, json={"model": EMBEDDINGS_MODEL, "input": batch}, timeout=EMBEDDINGS_TIMEOUT
+        )
+        response.raise_for_status()
+        data = sorted(response.json().get("data", []), key=lambda item: item.get("index", 0))
+        if len(data) != len(batch):
+            raise RuntimeError("Réponse /embeddings incomplète")
+        vectors.extend(item["embedding"] for item in data)
+    return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _kmeans(matrix: np.ndarray, k: int, iterations: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    centroids = matrix[rng.choice(len(matrix), size=k, replace=False)].copy()
+    assign = np.zeros(len(matrix), dtype=np.int32)
+    for _ in range(iterations):
+        assign = np.argmax(matrix @ centroids.T, axis=1).astype(np.int32)
+        for idx in range(k):
+            members = matrix[assign == idx]
+            if len(members):
+                centroids[idx] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids, assign
+
+
+def _retrain_locked(state: _DenseState) -> None:
+    matrix = state["matrix"]
+    if IVF_LISTS <= 0 or matrix is None or len(matrix) < IVF_LISTS * 8:
+        state["centroids"] = None
+        state["assign"] = None
+        return
+    centroids, assign = _kmeans(matrix, IVF_LISTS)
+    state["centroids"] = centroids
+    state["assign"] = assign
+
+
+def add(doc_ids: Sequence[str], texts: Sequence[str]) -> int:
+    """Embarque et ajoute (ou remplace) des documents ; retourne le nombre de vecteurs ajoutés."""
+    if not enabled() or not doc_ids:
+        return 0
+    return add_vectors(doc_ids, embed(texts))
+
+
+def add_vectors(doc_ids: Sequence[str], vectors: np.ndarray) -> int:
+    """Ajoute (ou remplace) des vecteurs déjà calculés par ``embed()``."""
+    if np is None or not len(doc_ids):
+        return 0
+    with _LOCK:
+        state = _target()
+        _remove_locked(state, doc_ids)
+        matrix = state["matrix"]
+        alive = state["alive"]
+        if matrix is None or alive is None or len(matrix) == 0 or matrix.shape[1] != vectors.shape[1]:
+            state["matrix"] = vectors
+            state["alive"] = np.ones(len(vectors), dtype=bool)
+            state["ids"] = list(doc_ids)
+            state["rows"] = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+            _retrain_locked(state)
+            return len(doc_ids)
+        base = len(matrix)
+        matrix = state["matrix"] = np.vstack([matrix, vectors])
+        state["alive"] = np.concatenate([alive, np.ones(len(vectors), dtype=bool)])
+        for offset, doc_id in enumerate(doc_ids):
+            state["ids"].append(doc_id)
+            state["rows"][doc_id] = base + offset
+        centroids = state["centroids"]
+        assign = state["assign"]
+        if centroids is not None and assign is not None:
+            new_assign = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+            state["assign"] = np.concatenate([assign, new_assign])
+        elif IVF_LISTS > 0 and len(matrix) >= IVF_LISTS * 8:
+            _retrain_locked(state)
+    return len(doc_ids)
+
+
+def _remove_locked(state: _DenseState, doc_ids: Sequence[str]) -> None:
+    rows = state["rows"]
+    alive = state["alive"]
+    for doc_id in doc_ids:
+        row = rows.pop(doc_id, None)
+        if row is not None and alive is not None:
+            alive[row] = False
+
+
+def remove(doc_ids: Sequence[str]) -> None:
+    if np is None:
+        return
+    with _LOCK:
+        _remove_locked(_target(), doc_ids)
+
+
+def clear() -> None:
+    global _state, _staged
+    with _LOCK:
+        _state = _empty()
+        _staged = None
+
+
+def search(query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+    """Plus proches voisins (produit scalaire sur vecteurs normalisés), sondage IVF si entraîné."""
+    if not enabled():
+        return []
+    matrix = _state["matrix"]
+    if matrix is None or not len(matrix):
+        return []
+    query_vec = embed([query])[0]
+    with _LOCK:
+        matrix = _state["matrix"]
+        alive = _state["alive"]
+        if matrix is None or alive is None:
+            return []
+        alive = alive.copy()
+        ids = list(_state["ids"])
+        centroids = _state["centroids"]
+        assign = _state["assign"]
+    if matrix.shape[1] != query_vec.shape[0]:
+        return []
+    if centroids is not None and assign is not None:
+        probes = np.argsort(-(centroids @ query_vec))[:IVF_NPROBE]
+        alive &= np.isin(assign, probes)
+    candidates = np.flatnonzero(alive)
+    if not len(candidates):
+        return []
+    scores = matrix[candidates] @ query_vec
+    k = min(top_k, len(candidates))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(ids[int(candidates[i])], float(scores[i])) for i in best]
+
+
+def vectors(doc_ids: Sequence[str]) -> Optional[np.ndarray]:
+    """Vecteurs normalisés des documents demandés (``None`` si l'un d'eux n'a pas d'embedding)."""
+    if np is None:
+        return None
+    with _LOCK:
+        rows = _state["rows"]
+        matrix = _state["matrix"]
+        if matrix is None or any(doc_id not in rows for doc_id in doc_ids):
+            return None
+        return np.asarray(matrix[[rows[doc_id] for doc_id in doc_ids]])
+
+
+def save(directory: Path) -> None:
+    """
+    Persiste la matrice compactée (lignes supprimées retirées) et la table des identifiants
+    de l'index modifié par l'ingestion (celui que publiera le prochain snapshot).
+    """
+    if np is None:
+        return
+    with _LOCK:
+        state = _target()
+        matrix = state["matrix"]
+        alive = state["alive"]
+        if matrix is None or alive is None:
+            for name in (MATRIX_FILE, IDS_FILE, CENTROIDS_FILE):
+                (directory / name).unlink(missing_ok=True)
+            return
+        keep = np.flatnonzero(alive)
+        ids = [state["ids"][int(i)] for i in keep]
+        compact = np.ascontiguousarray(matrix[keep])
+        state["matrix"] = compact
+        state["alive"] = np.ones(len(ids), dtype=bool)
+        state["ids"] = ids
+        state["rows"] = {doc_id: row for row, doc_id in enumerate(ids)}
+        assign = state["assign"]
+        if assign is not None:
+            state["assign"] = assign[keep]
+        directory.mkdir(parents=True, exist_ok=True)
+        with (directory / (MATRIX_FILE + ".tmp")).open("wb") as fh:
+            np.save(fh, compact)
+        os.replace(directory / (MATRIX_FILE + ".tmp"), directory / MATRIX_FILE)
+        (directory / IDS_FILE).write_text(json.dumps(ids, ensure_ascii=False), encoding="utf-8")
+        if state["centroids"] is not None:
+            with (directory / CENTROIDS_FILE).open("wb") as fh:
+                np.save(fh, state["centroids"])
+        else:
+            (directory / CENTROIDS_FILE).unlink(missing_ok=True)
+
+
+def load(directory: Path) -> None:
+    """Recharge la matrice (lecture mappée en mémoire) si elle existe."""
+    clear()
+    if np is None:
+        return
+    matrix_path = directory / MATRIX_FILE
+    ids_path = directory / IDS_FILE
+    if not matrix_path.exists() or not ids_path.exists():
+        return
+    try:
+        matrix = np.load(matrix_path, mmap_mode="r")
+        ids = [str(i) for i in json.loads(ids_path.read_text(encoding="utf-8"))]
+        if len(ids) != len(matrix):
+            return
+        centroids = None
+        assign = None
+        if (directory / CENTROIDS_FILE).exists() and len(matrix):
+            centroids = np.load(directory / CENTROIDS_FILE)
+            assign = np.argmax(matrix @ centroids.T, axis=1).astype(np.int32)
+    except Exception:
+        return
+    with _LOCK:
+        _state.update(
+            {
+                "ids": ids,
+                "rows": {doc_id: row for row, doc_id in enumerate(ids)},
+                "matrix": matrix,
+                "alive": np.ones(len(ids), dtype=bool),
+                "centroids": centroids,
+                "assign": assign,
+            }
+        )
+
+
+def stats() -> Stats:
+    state = _state
+    matrix = state["matrix"]
+    centroids = state["centroids"]
+    return {
+        "enabled": enabled(),
+        "vectors": len(state["rows"]),
+        "dim": int(matrix.shape[1]) if matrix is not None and len(matrix) else 0,
+        "ivf_lists": 0 if centroids is None else int(len(centroids)),
+    }
@@ -0,0 +1,145 @@
+"""
+Clients HTTP partagés (pool de connexions keep-alive) pour les backends LLM.
+
+Un client ``httpx.Client`` par backend (``lmstudio``, ``openai``, ``embeddings``...),
+créé à la première utilisation et réutilisé ensuite : plus de poignée de main TCP/TLS
+par appel. La variante asynchrone (``async_client``) est liée à la boucle d'événements
+qui l'a créée ; ses clients sont oubliés avec la boucle (référence faible).
+HTTP/2 est activé si le paquet ``h2`` est installé.
+Limites : ``ELYON_HTTP_MAX_CONNECTIONS`` par défaut, ``ELYON_HTTP_POOL_LIMITS``
+(``lmstudio=32,openai=8``) par backend. ``close_all`` / ``aclose_all`` à l'arrêt.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, Dict
+
+if TYPE_CHECKING:
+    import httpx
+else:
+    try:
+        import httpx
+    except Exception:  # pragma: no cover - dépendance optionnelle
+        httpx = None
+
+try:
+    import h2  # type: ignore[import]  # noqa: F401  (support HTTP/2 de httpx)
+
+    HTTP2 = os.getenv("ELYON_HTTP2", "1").strip().lower() not in {"0", "false", "no"}
+except Exception:  # pragma: no cover - dépendance optionnelle
+    HTTP2 = False
+
+
+def _parse_limits(raw: str) -> Dict[str, int]:
+    limits: Dict[str, int] = {}
+    for chunk in raw.split(","):
+        if "=" not in chunk:
+            continue
+        name, _, value = chunk.partition("=")
+        try:
+            limits[name.strip().lower()] = max(1, int(value))
+        except ValueError:
+            continue
+    return limits
+
+
+MAX_CONNECTIONS = max(1, int(os.getenv("ELYON_HTTP_MAX_CONNECTIONS", "20")))
+POOL_LIMITS = _parse_limits(os.getenv("ELYON_HTTP_POOL_LIMITS", ""))
+KEEPALIVE_EXPIRY = float(os.getenv("ELYON_HTTP_KEEPALIVE_EXPIRY", "30"))
+# Délai par défaut (les appels passent en général leur propre ``timeout``).
+DEFAULT_TIMEOUT = float(os.getenv("ELYON_HTTP_TIMEOUT", "30"))
+
+_LOCK = threading.Lock()
+_clients: Dict[str, "httpx.Client"] = {}
+# boucle -> {backend: client} ; l'entrée disparaît quand la boucle est libérée.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def enabled() -> bool:
+    return httpx is not None
+
+
+def _options(backend: str) -> Dict[str, object]:
+    size = POOL_LIMITS.get(backend, MAX_CONNECTIONS)
+    return {
+        "limits": httpx.Limits(
+            max_connections=size, max_keepalive_connections=size, keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+        "timeout": httpx.Timeout(DEFAULT_TIMEOUT, connect=min(5.0, DEFAULT_TIMEOUT)),
+        "http2": HTTP2,
+    }
+
+
+def client(backend: str = "default") -> "httpx.Client":
+    """Client synchrone partagé du backend (créé au premier appel)."""
+    if httpx is None:
+        raise RuntimeError("httpx indisponible")
+    backend = backend.lower()
+    current = _clients.get(backend)
+    if current is not None and not current.is_closed:
+        return current
+    with _LOCK:
+        current = _clients.get(backend)
+        if current is None or current.is_closed:
+            current = httpx.Client(**_options(backend))  # type: ignore[arg-type]
+            _clients[backend] = current
+    return current
+
+
+def async_client(backend: str = "default") -> "httpx.AsyncClient":
+    """Client asynchrone partagé du backend pour la boucle d'événements courante."""
+    if httpx is None:
+        raise RuntimeError("httpx indisponible")
+    backend = backend.lower()
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        clients = _async_clients.get(loop)
+        if clients is None:
+            clients = _async_clients[loop] = {}
+        current = clients.get(backend)
+        if current is None or current.is_closed:
+            current = clients[backend] = httpx.AsyncClient(**_options(backend))  # type: ignore[arg-type]
+    return current
+
+
+def close_all() -> None:
+    """Ferme les clients synchrones (arrêt de l'application)."""
+    with _LOCK:
+        clients = list(_clients.values())
+        _clients.clear()
+    for current in clients:
+        try:
+            current.close()
+        except Exception:
+            pass
+
+
+async def aclose_all() -> None:
+    """Ferme les clients asynchrones de la boucle courante puis les clients synchrones."""
+    with _LOCK:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for current in clients.values():
+        try:
+            await current.aclose()
+        except Exception:
+            pass
+    close_all()
+
+
+def stats() -> Dict[str, object]:
+    with _LOCK:
+        return {
+            "http2": HTTP2,
+            "max_connections": MAX_CONNECTIONS,
+            "pool_limits": dict(POOL_LIMITS),
+            "sync_clients": sorted(name for name, c in _clients.items() if not c.is_closed),
+            "async_clients": sorted(
+                {name for clients in _async_clients.values() for name, c in clients.items() if not c.is_closed}
+            ),
+        }
+
@@ -0,0 +1,351 @@
+"""
+Format binaire segmenté de l'index vectoriel (chargement via mmap).
+
+Un segment de base (``segment.json`` + ``terms/postings/docs.<gen>.bin``) peut être suivi
+de segments delta (``delta.<gen>.json`` + mêmes fichiers) qui ne contiennent que les
+documents ajoutés ou remplacés depuis la sauvegarde précédente et les identifiants
+retirés : une petite ingestion n'écrit plus tout l'index. Au-delà de
+``ELYON_INDEX_MAX_DELTAS`` deltas, ``write_delta`` refuse et l'appelant fusionne en
+réécrivant un segment de base complet.
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, TypedDict, cast
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "segment.json"
+DELTA_PREFIX = "delta."
+MAX_DELTAS = max(0, int(os.getenv("ELYON_INDEX_MAX_DELTAS", "8")))
+_TERMS_MAGIC = b"EVTD\x01"
+_POSTINGS_MAGIC = b"EVPS\x01"
+
+# (doc_id, texte, métadonnées, longueur en tokens, fréquences des termes)
+SegmentDoc = Tuple[str, str, Dict[str, object], int, Dict[str, int]]
+
+
+class TextRef:
+    """Référence paresseuse vers le texte d'un document dans le fichier ``docs.<gen>.bin``."""
+
+    __slots__ = ("_buf", "offset", "size")
+
+    def __init__(self, buf: mmap.mmap, offset: int, size: int) -> None:
+        self._buf = buf
+        self.offset = offset
+        self.size = size
+
+    def read(self) -> str:
+        return self._buf[self.offset : self.offset + self.size].decode("utf-8")
+
+
+class _DocFields(TypedDict):
+    metadata: Dict[str, object]
+    term_freq: Dict[str, int]
+    length: int
+
+
+class StoredDoc(_DocFields, total=False):
+    """Document de l'index : texte en mémoire (``text``) ou dans le segment mappé (``text_ref``)."""
+
+    text: str
+    text_ref: TextRef
+    fields: Dict[str, Tuple[Dict[str, int], int]]  # champs tokenisés (BM25F), recalculés au chargement
+
+
+class Segment(TypedDict):
+    docs: Dict[str, StoredDoc]
+    df: Dict[str, int]
+    analyzer: int
+
+
+class _ManifestDoc(TypedDict):
+    id: str
+    metadata: Dict[str, object]
+    length: int
+    offset: int
+    size: int
+
+
+class Manifest(TypedDict):
+    format: int
+    generation: int
+    analyzer: int
+    doc_count: int
+    term_count: int
+    docs: List[_ManifestDoc]
+
+
+class _DeltaManifest(TypedDict):
+    format: int
+    generation: int
+    base: int  # génération du segment de base auquel le delta s'applique
+    analyzer: int
+    docs: List[_ManifestDoc]
+    deleted: List[str]
+
+
+def _encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(buf, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _segment_paths(directory: Path, generation: int) -> Dict[str, Path]:
+    return {
+        "terms": directory / f"terms.{generation}.bin",
+        "postings": directory / f"postings.{generation}.bin",
+        "docs": directory / f"docs.{generation}.bin",
+    }
+
+
+def _map_file(path: Path) -> Optional[mmap.mmap]:
+    if path.stat().st_size == 0:
+        return None
+    with path.open("rb") as fh:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_manifest(directory: Path) -> Optional[Manifest]:
+    manifest_path = directory / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    data = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if not isinstance(data, dict) or int(data.get("format", 0)) != FORMAT_VERSION:
+        return None
+    return cast(Manifest, data)
+
+
+def _write_files(paths: Dict[str, Path], docs: Iterable[SegmentDoc]) -> Tuple[List[_ManifestDoc], int]:
+    """Écrit dictionnaire de termes, postings delta-encodés et magasin de documents ; ``(entrées, nb termes)``."""
+    doc_entries: List[_ManifestDoc] = []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    with paths["docs"].open("wb") as docs_fh:
+        offset = 0
+        for ordinal, (doc_id, text, metadata, length, term_freq) in enumerate(docs):
+            raw = text.encode("utf-8")
+            docs_fh.write(raw)
+            doc_entries.append(
+                {"id": doc_id, "metadata": metadata, "length": length, "offset": offset, "size": len(raw)}
+            )
+            offset += len(raw)
+            for term, count in term_freq.items():
+                postings.setdefault(term, []).append((ordinal, count))
+
+    terms_buf = bytearray(_TERMS_MAGIC)
+    postings_buf = bytearray(_POSTINGS_MAGIC)
+    for term in sorted(postings):
+        plist = postings[term]
+        start = len(postings_buf)
+        previous_ordinal = 0
+        for ordinal, count in plist:  # ordinaux déjà croissants
+            _encode_varint(ordinal - previous_ordinal, postings_buf)
+            _encode_varint(count, postings_buf)
+            previous_ordinal = ordinal
+        raw_term = term.encode("utf-8")
+        _encode_varint(len(raw_term), terms_buf)
+        terms_buf += raw_term
+        _encode_varint(len(plist), terms_buf)
+        _encode_varint(start, terms_buf)
+    paths["terms"].write_bytes(bytes(terms_buf))
+    paths["postings"].write_bytes(bytes(postings_buf))
+    return doc_entries, len(postings)
+
+
+def _write_json(path: Path, data: object) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _text_refs(path: Path, entries: List[_ManifestDoc]) -> List[TextRef]:
+    docs_map = _map_file(path)
+    if docs_map is None:
+        return [TextRef(mmap.mmap(-1, 1), 0, 0) for _ in entries]
+    return [TextRef(docs_map, entry["offset"], entry["size"]) for entry in entries]
+
+
+def _read_deltas(directory: Path, base: int) -> List[_DeltaManifest]:
+    """Deltas du segment de base ``base``, par génération croissante (les autres sont périmés)."""
+    deltas: List[_DeltaManifest] = []
+    for path in directory.glob(f"{DELTA_PREFIX}*.json"):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if isinstance(data, dict) and data.get("format") == FORMAT_VERSION and data.get("base") == base:
+            deltas.append(cast(_DeltaManifest, data))
+    return sorted(deltas, key=lambda delta: int(delta["generation"]))
+
+
+def write_segment(directory: Path, docs: Iterable[SegmentDoc], analyzer: int = 1) -> List[TextRef]:
+    """
+    Écrit un nouveau segment de base complet (qui remplace aussi les deltas) puis publie
+    le manifeste de façon atomique.
+    ``analyzer`` : version de la chaîne d'analyse ayant produit les termes.
+    Retourne les références texte vers le nouveau segment, dans l'ordre des documents.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    previous = read_manifest(directory)
+    generation = 1
+    if previous:
+        deltas = _read_deltas(directory, int(previous["generation"]))
+        generation = max([int(previous["generation"]), *(int(d["generation"]) for d in deltas)]) + 1
+    paths = _segment_paths(directory, generation)
+    doc_entries, term_count = _write_files(paths, docs)
+    manifest: Manifest = {
+        "format": FORMAT_VERSION,
+        "generation": generation,
+        "analyzer": analyzer,
+        "doc_count": len(doc_entries),
+        "term_count": term_count,
+        "docs": doc_entries,
+    }
+    _write_json(directory / MANIFEST_NAME, manifest)
+    cleanup_stale(directory, generation)
+    return _text_refs(paths["docs"], doc_entries)
+
+
+def write_delta(
+    directory: Path, docs: Iterable[SegmentDoc], deleted: Iterable[str], analyzer: int = 1
+) -> Optional[List[TextRef]]:
+    """
+    Ajoute un segment delta (documents ajoutés ou remplacés, identifiants retirés) au segment
+    de base courant, sans réécrire ce dernier. Retourne les références texte des documents
+    écrits, ou ``None`` s'il faut plutôt écrire un segment complet (pas de base, autre
+    version d'analyse ou ``MAX_DELTAS`` atteint : fusion).
+    """
+    manifest = read_manifest(directory)
+    if manifest is None or int(manifest.get("analyzer", 1)) != analyzer:
+        return None
+    base = int(manifest["generation"])
+    deltas = _read_deltas(directory, base)
+    if len(deltas) >= MAX_DELTAS:
+        return None
+    generation = max([base, *(int(d["generation"]) for d in deltas)]) + 1
+    paths = _segment_paths(directory, generation)
+    doc_entries, _ = _write_files(paths, docs)
+    delta: _DeltaManifest = {
+        "format": FORMAT_VERSION,
+        "generation": generation,
+        "base": base,
+        "analyzer": analyzer,
+        "docs": doc_entries,
+        "deleted": sorted(set(deleted)),
+    }
+    _write_json(directory / f"{DELTA_PREFIX}{generation}.json", delta)
+    return _text_refs(paths["docs"], doc_entries)
+
+
+def _read_files(paths: Dict[str, Path], entries: List[_ManifestDoc]) -> Tuple[Dict[str, StoredDoc], Dict[str, int]]:
+    """Documents (textes laissés dans le fichier mappé) et DF d'un segment de base ou delta."""
+    docs_map = _map_file(paths["docs"])
+    empty_map = docs_map or mmap.mmap(-1, 1)
+
+    ordinals: List[str] = []
+    docs: Dict[str, StoredDoc] = {}
+    for entry in entries:
+        doc_id = str(entry["id"])
+        ordinals.append(doc_id)
+        metadata = entry.get("metadata")
+        docs[doc_id] = {
+            "text_ref": TextRef(empty_map, int(entry["offset"]), int(entry["size"])),
+            "metadata": metadata if isinstance(metadata, dict) else {},
+            "term_freq": {},
+            "length": int(entry.get("length", 0)),
+        }
+
+    df: Dict[str, int] = {}
+    terms_map = _map_file(paths["terms"])
+    postings_map = _map_file(paths["postings"])
+    if terms_map is not None and postings_map is not None:
+        try:
+            if terms_map[: len(_TERMS_MAGIC)] != _TERMS_MAGIC or postings_map[: len(_POSTINGS_MAGIC)] != _POSTINGS_MAGIC:
+                raise ValueError("Segment d'index illisible (signature invalide)")
+            pos = len(_TERMS_MAGIC)
+            end = len(terms_map)
+            while pos < end:
+                size, pos = _decode_varint(terms_map, pos)
+                term = terms_map[pos : pos + size].decode("utf-8")
+                pos += size
+                count, pos = _decode_varint(terms_map, pos)
+                p_pos, pos = _decode_varint(terms_map, pos)
+                df[term] = count
+                ordinal = 0
+                for _ in range(count):
+                    delta, p_pos = _decode_varint(postings_map, p_pos)
+                    tf, p_pos = _decode_varint(postings_map, p_pos)
+                    ordinal += delta
+                    docs[ordinals[ordinal]]["term_freq"][term] = tf
+        finally:
+            terms_map.close()
+            postings_map.close()
+    return docs, df
+
+
+def _add_df(df: Dict[str, int], terms: Iterable[str], delta: int) -> None:
+    for term in terms:
+        count = df.get(term, 0) + delta
+        if count > 0:
+            df[term] = count
+        else:
+            df.pop(term, None)
+
+
+def read_segment(directory: Path) -> Optional[Segment]:
+    """
+    Ouvre le segment courant et applique ses deltas dans l'ordre : les postings sont
+    décodés en mémoire, les textes restent dans les fichiers mappés (``TextRef``).
+    Retourne ``{"docs": {doc_id: {...}}, "df": {...}, "analyzer": n}`` ou ``None`` si absent.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    generation = int(manifest["generation"])
+    docs, df = _read_files(_segment_paths(directory, generation), manifest.get("docs") or [])
+    for delta in _read_deltas(directory, generation):
+        for doc_id in delta.get("deleted") or []:
+            removed = docs.pop(doc_id, None)
+            if removed is not None:
+                _add_df(df, removed["term_freq"], -1)
+        added, _ = _read_files(_segment_paths(directory, int(delta["generation"])), delta.get("docs") or [])
+        for doc_id, doc in added.items():
+            previous = docs.get(doc_id)
+            if previous is not None:
+                _add_df(df, previous["term_freq"], -1)
+            docs[doc_id] = doc
+            _add_df(df, doc["term_freq"], 1)
+    cleanup_stale(directory, generation)
+    return {"docs": docs, "df": df, "analyzer": int(manifest.get("analyzer", 1))}
+
+
+def cleanup_stale(directory: Path, generation: int) -> None:
+    """
+    Supprime les fichiers des générations qui ne sont ni le segment de base ``generation``
+    ni l'un de ses deltas (ignoré s'ils sont encore mappés).
+    """
+    live = {generation, *(int(delta["generation"]) for delta in _read_deltas(directory, generation))}
+    for path in [*directory.glob("*.bin"), *directory.glob(f"{DELTA_PREFIX}*.json")]:
+        parts = path.name.split(".")
+        if len(parts) != 3 or parts[0] not in {"terms", "postings", "docs", DELTA_PREFIX[:-1]}:
+            continue
+        try:
+            if int(parts[1]) not in live:
+                path.unlink()
+        except (ValueError, OSError):
+            continue
@@ -4,6 +4,11 @@ import re
 from collections import Counter
 from typing import Dict, List
 
+try:
+    from . import analysis
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import analysis  # type: ignore[import]
+
 _QUESTION_WORDS = {
     "qui",
     "quoi",
@@ -74,9 +79,22 @@ _GREETINGS = {
     "bien le bonjour",
 }
 
+# comparaison sans accents : "resume" déclenche comme "résume"
+_QUESTION_WORDS, _CREATIVE_TRIGGERS, _SUMMARY_TRIGGERS, _ACTION_TRIGGERS, _URGENCY_WORDS, _GREETINGS = (
+    {analysis.fold(word) for word in words}
+    for words in (
+        _QUESTION_WORDS,
+        _CREATIVE_TRIGGERS,
+        _SUMMARY_TRIGGERS,
+        _ACTION_TRIGGERS,
+        _URGENCY_WORDS,
+        _GREETINGS,
+    )
+)
+
 
 def _intent_from_text(text: str) -> str:
-    low = text.lower()
+    low = analysis.fold(text)
     if not low.strip():
         return "empty"
     if any(word in low for word in _GREETINGS):
@@ -95,15 +113,20 @@ def _intent_from_text(text: str) -> str:
 
 
 def _detect_urgency(text: str) -> bool:
-    low = text.lower()
+    low = analysis.fold(text)
     return any(word in low for word in _URGENCY_WORDS)
 
 
 def _extract_keywords(text: str) -> List[str]:
-    words = re.findall(r"[a-zA-ZÀ-ÖØ-öø-ÿ0-9]{3,}", text.lower())
-    counter = Counter(words)
-    common = [w for w, count in counter.most_common(6) if count >= 1]
-    return common
+    """Mots-clés (formes sans accents) regroupés par terme racinisé, mots vides exclus."""
+    counter: Counter = Counter()
+    surface: Dict[str, str] = {}
+    for word, term in analysis.analyze(text):
+        if len(word) < 3:
+            continue
+        counter[term] += 1
+        surface.setdefault(term, word)
+    return [surface[term] for term, _ in counter.most_common(6)]
 
 
 def _extract_entities(text: str) -> Dict[str, List[str]]:
@@ -0,0 +1,208 @@
+"""
+Latences observées des backends LLM, délais adaptatifs et requêtes « couvertes » (hedging).
+
+Chaque appel réussi est mesuré par backend, par taille de prompt (``BUCKETS``, en
+caractères) et par longueur de réponse demandée (``OUTPUT_BUCKETS``, ``max_tokens``) sur
+les ``WINDOW`` derniers appels. Dès ``MIN_SAMPLES`` mesures, le délai d'un appel vaut
+``p99 x ELYON_LLM_TIMEOUT_FACTOR`` (borné par ``ELYON_LLM_TIMEOUT_MIN`` et
+``ELYON_LLM_TIMEOUT_MAX``) au lieu du délai fixe de l'appelant.
+Un appel expiré est compté comme mesure censurée (sa durée est un minorant de la latence
+réelle) et impose un plancher ``durée x ELYON_LLM_TIMEOUT_FACTOR`` jusqu'au prochain
+succès : les délais s'allongent après des timeouts au lieu de rester au minimum.
+Avec ``ELYON_LLM_HEDGE=1``, ``hedged()`` relance la même requête vers un backend de
+secours si la réponse n'est pas arrivée au p95 : le premier résultat gagne, l'autre
+est annulé. Seuls les ~5 % d'appels les plus lents paient un second appel.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Bornes supérieures (caractères du prompt) des tranches de taille ; au-delà : dernière tranche.
+BUCKETS = (1000, 4000, 16000)
+_BUCKET_NAMES = ("<1k", "<4k", "<16k", "16k+")
+# Bornes supérieures (``max_tokens``) des tranches de réponse ; ``max_tokens`` absent : tranche « - ».
+OUTPUT_BUCKETS = (256, 1024)
+_OUTPUT_NAMES = ("256t", "1kt", "1kt+")
+WINDOW = 256
+MIN_SAMPLES = max(1, int(os.getenv("ELYON_LLM_LATENCY_MIN_SAMPLES", "20")))
+TIMEOUT_FACTOR = max(1.0, float(os.getenv("ELYON_LLM_TIMEOUT_FACTOR", "1.5")))
+TIMEOUT_MIN = max(0.1, float(os.getenv("ELYON_LLM_TIMEOUT_MIN", "2")))
+TIMEOUT_MAX = max(TIMEOUT_MIN, float(os.getenv("ELYON_LLM_TIMEOUT_MAX", "120")))
+HEDGE = os.getenv("ELYON_LLM_HEDGE", "0").strip().lower() in {"1", "true", "yes", "on"}
+
+_LOCK = threading.Lock()
+_samples: Dict[Tuple[str, str], Deque[float]] = {}  # (backend, tranche) -> durées (s)
+_floors: Dict[Tuple[str, str], float] = {}  # (backend, tranche) -> délai minimal après un timeout
+_hedges: Dict[str, int] = {"fired": 0, "won": 0}
+
+
+def bucket(size: int, max_tokens: Optional[int] = None) -> str:
+    """Tranche ``taille du prompt/longueur de réponse``, p. ex. ``<4k/1kt``."""
+    output = "-" if not max_tokens else _OUTPUT_NAMES[bisect_right(OUTPUT_BUCKETS, max_tokens - 1)]
+    return f"{_BUCKET_NAMES[bisect_right(BUCKETS, max(0, size))]}/{output}"
+
+
+def _key(backend: str, size: int, max_tokens: Optional[int]) -> Tuple[str, str]:
+    return backend.lower(), bucket(size, max_tokens)
+
+
+def prompt_size(messages: Iterable[dict]) -> int:
+    """Taille d'un prompt au format chat (somme des contenus, en caractères)."""
+    return sum(len(str(message.get("content") or "")) for message in messages)
+
+
+def _append_locked(key: Tuple[str, str], seconds: float) -> None:
+    samples = _samples.get(key)
+    if samples is None:
+        samples = _samples[key] = deque(maxlen=WINDOW)
+    samples.append(seconds)
+
+
+def record(backend: str, size: int, seconds: float, max_tokens: Optional[int] = None) -> None:
+    """Mesure d'un appel réussi ; lève le plancher posé par un timeout précédent."""
+    key = _key(backend, size, max_tokens)
+    with _LOCK:
+        _append_locked(key, seconds)
+        _floors.pop(key, None)
+
+
+def record_timeout(backend: str, size: int, seconds: float, max_tokens: Optional[int] = None) -> None:
+    """
+    Appel expiré après ``seconds`` : mesure censurée (la latence réelle est au moins
+    ``seconds``) et plancher ``seconds x TIMEOUT_FACTOR`` jusqu'au prochain succès, qui
+    croît à chaque timeout consécutif.
+    """
+    key = _key(backend, size, max_tokens)
+    with _LOCK:
+        _append_locked(key, seconds)
+        _floors[key] = min(TIMEOUT_MAX, max(_floors.get(key, 0.0), seconds * TIMEOUT_FACTOR))
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    # httpx.TimeoutException, requests.Timeout... sans importer les clients HTTP
+    return isinstance(exc, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(exc).__name__
+
+
+@contextmanager
+def measure(backend: str, size: int, max_tokens: Optional[int] = None) -> Iterator[None]:
+    """
+    Enregistre la durée du bloc s'il se termine sans erreur ; un timeout est enregistré
+    comme mesure censurée (``record_timeout``), les autres échecs sont ignorés (une
+    connexion refusée aussitôt ferait baisser les percentiles).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as exc:
+        if _is_timeout(exc):
+            record_timeout(backend, size, time.perf_counter() - start, max_tokens)
+        raise
+    record(backend, size, time.perf_counter() - start, max_tokens)
+
+
+def _percentile(ordered: list, q: float) -> float:
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def percentile(backend: str, size: int, q: float, max_tokens: Optional[int] = None) -> Optional[float]:
+    """Percentile ``q`` (0-1) des latences du backend pour cette tranche ; ``None`` sans assez de mesures."""
+    with _LOCK:
+        samples = _samples.get(_key(backend, size, max_tokens))
+        if samples is None or len(samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+    return _percentile(ordered, q)
+
+
+def timeout(backend: str, size: int, default: float, max_tokens: Optional[int] = None) -> float:
+    """
+    Délai d'attente de la réponse : dérivé du p99 observé pour cette taille de prompt et
+    cette longueur de réponse, ``default`` tant qu'il manque des mesures ; jamais sous le
+    plancher posé par un timeout récent.
+    """
+    p99 = percentile(backend, size, 0.99, max_tokens)
+    value = default if p99 is None else min(TIMEOUT_MAX, max(TIMEOUT_MIN, p99 * TIMEOUT_FACTOR))
+    with _LOCK:
+        floor = _floors.get(_key(backend, size, max_tokens), 0.0)
+    return max(value, floor)
+
+
+def timeout_for(backend: str, messages: Iterable[dict], default: float, max_tokens: Optional[int] = None) -> float:
+    """``timeout()`` pour un prompt au format chat (taille mesurée par ``prompt_size``)."""
+    return timeout(backend, prompt_size(messages), default, max_tokens)
+
+
+def hedge_delay(backend: str, size: int, max_tokens: Optional[int] = None) -> Optional[float]:
+    """Attente avant la requête de secours (p95) ; ``None`` si le hedging est désactivé ou sans mesures."""
+    return percentile(backend, size, 0.95, max_tokens) if HEDGE else None
+
+
+async def hedged(
+    primary: Callable[[], Awaitable[T]],
+    secondary: Optional[Callable[[], Awaitable[T]]],
+    delay: Optional[float],
+) -> Tuple[T, bool]:
+    """
+    ``(résultat, secours)`` : lance ``primary`` puis, s'il n'a pas répondu après ``delay``
+    secondes, ``secondary`` en parallèle. Le premier succès l'emporte et l'autre appel est
+    annulé ; l'erreur n'est propagée que si les deux échouent.
+    """
+    first = asyncio.ensure_future(primary())
+    pending = {first}
+    try:
+        if secondary is None or delay is None:
+            return await first, False
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result(), False
+        second = asyncio.ensure_future(secondary())
+        pending.add(second)
+        with _LOCK:
+            _hedges["fired"] += 1
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        with _LOCK:
+                            _hedges["won"] += 1
+                    return task.result(), task is second
+                error = error or task.exception()
+        raise error  # type: ignore[misc]
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def snapshot() -> Dict[str, object]:
+    """Percentiles et délai courant par backend et tranche, compteurs de hedging (pour ``/self``)."""
+    with _LOCK:
+        copies = {key: sorted(samples) for key, samples in _samples.items()}
+        hedges = dict(_hedges)
+        floors = dict(_floors)
+    backends: Dict[str, Dict[str, object]] = {}
+    for (backend, name), ordered in sorted(copies.items()):
+        p99 = _percentile(ordered, 0.99)
+        floor = floors.get((backend, name), 0.0)
+        backends.setdefault(backend, {})[name] = {
+            "n": len(ordered),
+            "p50": round(_percentile(ordered, 0.5), 3),
+            "p95": round(_percentile(ordered, 0.95), 3),
+            "p99": round(p99, 3),
+            "timeout": round(max(floor, min(TIMEOUT_MAX, max(TIMEOUT_MIN, p99 * TIMEOUT_FACTOR))), 3)
+            if len(ordered) >= MIN_SAMPLES
+            else None,
+            "floor": round(floor, 3) if floor else None,
+        }
+    return {"hedge": HEDGE, "hedges": hedges, "backends": backends}
@@ -5,7 +5,7 @@ import os
 from dataclasses import dataclass
 from typing import Iterable, List, Tuple
 
-import httpx
+from . import circuit_breaker, http_pool, latency
 
 
 @dataclass
@@ -27,14 +27,17 @@ class LLMService:
             "temperature": 0.3,
         }
         try:
-            with httpx.Client(timeout=self._timeout) as client:
-                response = client.post(self._lm_url, json=payload)
+            # disjoncteur ouvert : BreakerOpenError immédiate, repli sans attendre le timeout
+            size = latency.prompt_size(payload["messages"])
+            timeout = latency.timeout("lmstudio", size, self._timeout)  # p99 observé, LM_TIMEOUT sans mesures
+            with circuit_breaker.guard("lmstudio"), latency.measure("lmstudio", size):
+                response = http_pool.client("lmstudio").post(self._lm_url, json=payload, timeout=timeout)
                 response.raise_for_status()
-                data = response.json()
-                choice = data.get("choices", [{}])[0]
-                reply = choice.get("message", {}).get("content", "")
-                if reply:
-                    return reply, "lmstudio"
+            data = response.json()
+            choice = data.get("choices", [{}])[0]
+            reply = choice.get("message", {}).get("content", "")
+            if reply:
+                return reply, "lmstudio"
         except Exception:
             pass
         return self._fallback(messages)
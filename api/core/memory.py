@@ -1,51 +1,260 @@
+"""
+Mémoire conversationnelle par session (ou par utilisateur).
+
+Chaque session a son journal JSONL en ajout seul (``sessions/<hash>.jsonl``), compacté
+aux ``_MAX_HISTORY`` derniers échanges quand il dépasse ``COMPACT_EVERY`` lignes.
+Les sessions actives restent en mémoire dans un LRU borné (``ELYON_MEMORY_SESSIONS``) ;
+une session évincée est relue depuis son journal à la demande. Une session en cours
+d'utilisation n'est jamais évincée : sinon une seconde copie relue du journal
+écrirait et compacterait le même fichier en parallèle.
+L'ancien ``conversation_state.json`` (historique unique) alimente la session par défaut.
+
+Les échanges sortis de l'historique récent sont archivés (``<hash>.archive.jsonl``,
+``ELYON_MEMORY_ARCHIVE_MAX`` derniers) et indexés (``memory_index``) : ``recall()``
+retrouve les plus pertinents pour le message courant, à taille de prompt constante.
+"""
 from __future__ import annotations
 
+import hashlib
 import json
+import os
 import threading
 import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Deque, Dict, Iterator, List, Optional
+
+try:
+    from . import memory_index
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import memory_index  # type: ignore[import]
 
 ROOT = Path(__file__).resolve().parents[2]
 MEMORY_DIR = ROOT / "data" / "_memory"
 MEMORY_FILE = MEMORY_DIR / "conversation_state.json"
+SESSIONS_DIR = MEMORY_DIR / "sessions"
 _MAX_HISTORY = 5
-_LOCK = threading.Lock()
+
+DEFAULT_SESSION = "default"
+MAX_SESSIONS = max(1, int(os.getenv("ELYON_MEMORY_SESSIONS", "256")))
+# Nombre de lignes du journal d'une session au-delà duquel il est réécrit (compaction).
+COMPACT_EVERY = max(_MAX_HISTORY + 1, int(os.getenv("ELYON_MEMORY_COMPACT_EVERY", "50")))
+# Échanges anciens conservés (et indexés) par session pour le rappel ; 0 = pas d'archive.
+ARCHIVE_MAX = max(0, int(os.getenv("ELYON_MEMORY_ARCHIVE_MAX", "500")))
+# Score cosinus minimal d'un échange rappelé.
+RECALL_MIN_SCORE = float(os.getenv("ELYON_MEMORY_RECALL_MIN_SCORE", "0.15"))
+
+_LOCK = threading.Lock()  # protège le LRU (les sessions ont chacune leur verrou)
+
+
+class _Session:
+    __slots__ = (
+        "session_id",
+        "history",
+        "lines",
+        "loaded",
+        "summary",
+        "lock",
+        "users",
+        "archive",
+        "archived",
+        "archive_lines",
+    )
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.history: Deque[Dict[str, object]] = deque(maxlen=_MAX_HISTORY)
+        self.lines = 0  # lignes du journal sur disque
+        self.loaded = False  # journal relu (sous ``lock``, au premier accès)
+        self.summary: Optional[str] = None  # résumé formaté, invalidé à chaque échange
+        self.lock = threading.Lock()
+        self.users = 0  # appels en cours (sous ``_LOCK``) : la session ne peut pas être évincée
+        self.archive: Optional[memory_index.MemoryIndex] = None  # index des échanges archivés (paresseux)
+        self.archived: Deque[str] = deque()  # identifiants archivés, du plus ancien au plus récent
+        self.archive_lines = 0
+
+
+_sessions: "OrderedDict[str, _Session]" = OrderedDict()
 
 
 def _ensure_dir() -> None:
-    MEMORY_DIR.mkdir(parents=True, exist_ok=True)
+    SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def _load_raw() -> Dict[str, List[Dict[str, object]]]:
-    _ensure_dir()
+def _session_key(session_id: Optional[str]) -> str:
+    return str(session_id).strip() if session_id is not None and str(session_id).strip() else DEFAULT_SESSION
+
+
+def _log_path(session_id: str, suffix: str = ".jsonl") -> Path:
+    digest = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:20]
+    return SESSIONS_DIR / f"{digest}{suffix}"
+
+
+def _archive_path(session_id: str) -> Path:
+    return _log_path(session_id, ".archive.jsonl")
+
+
+def _load_legacy() -> List[Dict[str, object]]:
+    """Historique de l'ancien fichier unique (``{"history": [...]}``)."""
     if not MEMORY_FILE.exists():
-        return {"history": []}
+        return []
     try:
         data = json.loads(MEMORY_FILE.read_text(encoding="utf-8"))
-        if not isinstance(data, dict):
-            return {"history": []}
-        hist = data.get("history", [])
-        if not isinstance(hist, list):
-            return {"history": []}
-        return {"history": hist}
     except Exception:
-        return {"history": []}
+        return []
+    hist = data.get("history", []) if isinstance(data, dict) else []
+    return [item for item in hist if isinstance(item, dict)] if isinstance(hist, list) else []
 
 
-def _save_raw(payload: Dict[str, List[Dict[str, object]]]) -> None:
+def _read_session(session: _Session) -> None:
+    if session.loaded:
+        return
+    session.loaded = True
+    path = _log_path(session.session_id)
+    if not path.exists():
+        if session.session_id == DEFAULT_SESSION:
+            legacy = _load_legacy()[-_MAX_HISTORY:]
+            if legacy:
+                session.history.extend(legacy)
+                _rewrite_locked(session)
+        return
+    lines = 0
+    try:
+        with path.open("r", encoding="utf-8") as fh:
+            for raw in fh:
+                lines += 1
+                try:
+                    item = json.loads(raw)
+                except ValueError:
+                    continue  # ligne tronquée (arrêt pendant une écriture)
+                if isinstance(item, dict):
+                    item.pop("session", None)
+                    session.history.append(item)
+    except OSError:
+        return
+    session.lines = lines
+
+
+def _rewrite_locked(session: _Session) -> None:
+    """Compaction : réécrit le journal avec les seuls échanges conservés."""
     _ensure_dir()
-    MEMORY_FILE.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    path = _log_path(session.session_id)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        for item in session.history:
+            fh.write(json.dumps({"session": session.session_id, **item}, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    session.lines = len(session.history)
 
 
-def get_history() -> List[Dict[str, object]]:
-    return _load_raw().get("history", [])
+def _entry_text(item: Dict[str, object]) -> str:
+    return f"{item.get('user') or ''} {item.get('assistant') or ''}"
+
+
+def _read_archive(session: _Session) -> memory_index.MemoryIndex:
+    """Index des échanges archivés, reconstruit depuis le journal d'archive au premier rappel."""
+    if session.archive is not None:
+        return session.archive
+    archive = session.archive = memory_index.new_index()
+    path = _archive_path(session.session_id)
+    if not path.exists():
+        return archive
+    items: List[Dict[str, object]] = []
+    try:
+        with path.open("r", encoding="utf-8") as fh:
+            for raw in fh:
+                session.archive_lines += 1
+                try:
+                    item = json.loads(raw)
+                except ValueError:
+                    continue
+                if isinstance(item, dict) and item.get("id") is not None:
+                    items.append(item)
+    except OSError:
+        return archive
+    for item in items[-ARCHIVE_MAX:]:
+        _index_archived(session, archive, item)
+    return archive
 
 
-def get_summary_text(max_items: int = _MAX_HISTORY) -> str:
-    history = get_history()[-max_items:]
-    if not history:
-        return ""
+def _index_archived(session: _Session, archive: memory_index.MemoryIndex, item: Dict[str, object]) -> None:
+    doc_id = str(item["id"])
+    payload = {key: value for key, value in item.items() if key not in {"id", "session"}}
+    memory_index.add(archive, doc_id, _entry_text(payload), payload)
+    session.archived.append(doc_id)
+    while len(session.archived) > ARCHIVE_MAX:
+        memory_index.remove(archive, session.archived.popleft())
+
+
+def _archive_locked(session: _Session, item: Dict[str, object]) -> None:
+    """Archive un échange sorti de l'historique récent (journal en ajout seul, compacté)."""
+    if not ARCHIVE_MAX:
+        return
+    archive = _read_archive(session)
+    last = int(session.archived[-1]) if session.archived else 0
+    record = {"session": session.session_id, "id": last + 1, **item}
+    _index_archived(session, archive, record)
+    _ensure_dir()
+    path = _archive_path(session.session_id)
+    if session.archive_lines + 1 > 2 * ARCHIVE_MAX:
+        kept = set(session.archived)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as out:
+            with path.open("r", encoding="utf-8") as fh:
+                for raw in fh:
+                    try:
+                        old = json.loads(raw)
+                    except ValueError:
+                        continue
+                    if isinstance(old, dict) and str(old.get("id")) in kept:
+                        out.write(raw if raw.endswith("\n") else raw + "\n")
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+        session.archive_lines = len(kept)
+        return
+    with path.open("a", encoding="utf-8") as fh:
+        fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+    session.archive_lines += 1
+
+
+def _evict_locked() -> None:
+    """Ramène le LRU à ``MAX_SESSIONS`` en évinçant les sessions inutilisées les plus anciennes."""
+    excess = len(_sessions) - MAX_SESSIONS
+    if excess <= 0:
+        return
+    for key in [key for key, session in _sessions.items() if not session.users][:excess]:
+        del _sessions[key]
+
+
+@contextmanager
+def _session(session_id: Optional[str]) -> Iterator[_Session]:
+    """Session verrouillée, maintenue dans le LRU (non évinçable) pendant toute son utilisation."""
+    key = _session_key(session_id)
+    with _LOCK:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _Session(key)
+        else:
+            _sessions.move_to_end(key)
+        session.users += 1
+        _evict_locked()
+    try:
+        with session.lock:
+            yield session
+    finally:
+        with _LOCK:
+            session.users -= 1
+            _evict_locked()
+
+
+def get_history(session_id: Optional[str] = None) -> List[Dict[str, object]]:
+    with _session(session_id) as session:
+        _read_session(session)
+        return list(session.history)
+
+
+def _format_summary(history: List[Dict[str, object]]) -> str:
     lines: List[str] = []
     for item in history:
         user_raw = item.get("user")
@@ -70,23 +279,66 @@ def get_summary_text(max_items: int = _MAX_HISTORY) -> str:
     return "\n".join([line for line in lines if line])
 
 
-def remember_interaction(user_text: str, assistant_text: str, meta: Optional[Dict[str, object]] = None) -> None:
+def get_summary_text(max_items: int = _MAX_HISTORY, session_id: Optional[str] = None) -> str:
+    with _session(session_id) as session:
+        _read_session(session)
+        if max_items == _MAX_HISTORY and session.summary is not None:
+            return session.summary
+        summary = _format_summary(list(session.history)[-max_items:])
+        if max_items == _MAX_HISTORY:
+            session.summary = summary
+    return summary
+
+
+def remember_interaction(
+    user_text: str,
+    assistant_text: str,
+    meta: Optional[Dict[str, object]] = None,
+    session_id: Optional[str] = None,
+) -> None:
     user_text = (user_text or "").strip()
     assistant_text = (assistant_text or "").strip()
     if not user_text and not assistant_text:
         return
+    entry: Dict[str, object] = {
+        "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "user": user_text,
+        "assistant": assistant_text,
+    }
+    if meta:
+        entry["meta"] = meta
+    with _session(session_id) as session:
+        _read_session(session)
+        if len(session.history) == session.history.maxlen:
+            _archive_locked(session, session.history[0])
+        session.history.append(entry)
+        session.summary = None
+        if session.lines + 1 > COMPACT_EVERY:
+            _rewrite_locked(session)
+            return
+        _ensure_dir()
+        line = json.dumps({"session": session.session_id, **entry}, ensure_ascii=False)
+        with _log_path(session.session_id).open("a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+        session.lines += 1
+
+
+def recall(query: str, session_id: Optional[str] = None, top_k: int = 3) -> List[Dict[str, object]]:
+    """Échanges archivés de la session les plus pertinents pour ``query`` (score décroissant)."""
+    if not ARCHIVE_MAX or not (query or "").strip():
+        return []
+    with _session(session_id) as session:
+        _read_session(session)
+        hits = memory_index.search(_read_archive(session), query, top_k=top_k, min_score=RECALL_MIN_SCORE)
+    return [{**payload, "score": round(score, 4)} for score, payload in hits]
+
+
+def get_recall_text(query: str, session_id: Optional[str] = None, top_k: int = 3) -> str:
+    """``recall()`` mis en forme comme ``get_summary_text`` (ordre chronologique)."""
+    hits = recall(query, session_id=session_id, top_k=top_k)
+    return _format_summary(sorted(hits, key=lambda item: str(item.get("ts", ""))))
+
+
+def stats() -> Dict[str, object]:
     with _LOCK:
-        payload = _load_raw()
-        history = payload.get("history", [])
-        entry: Dict[str, object] = {
-            "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "user": user_text,
-            "assistant": assistant_text,
-        }
-        if meta:
-            entry["meta"] = meta
-        history.append(entry)
-        if len(history) > _MAX_HISTORY:
-            history = history[-_MAX_HISTORY:]
-        payload["history"] = history
-        _save_raw(payload)
+        return {"sessions_in_memory": len(_sessions), "max_sessions": MAX_SESSIONS, "max_history": _MAX_HISTORY}
@@ -0,0 +1,105 @@
+"""
+Index TF-IDF en mémoire pour le rappel des anciens échanges d'une session.
+
+Même pondération que le scorer ``tfidf`` de l'index documentaire (cosinus, TF normalisé
+par la longueur, IDF lissé) mais une instance par session, sans persistance propre ni
+dépendance à ``vector_index`` : ``memory`` la reconstruit depuis le journal d'archive
+de la session.
+"""
+from __future__ import annotations
+
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple, TypedDict
+
+try:
+    from . import analysis
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import analysis  # type: ignore[import]
+
+
+class MemoryDoc(TypedDict):
+    term_freq: Dict[str, int]
+    length: int
+    payload: Dict[str, object]
+
+
+class MemoryIndex(TypedDict):
+    doc_count: int
+    df: Dict[str, int]
+    docs: Dict[str, MemoryDoc]
+    postings: Dict[str, Dict[str, int]]  # terme -> {doc_id: fréquence}
+    weights: Dict[str, Tuple[Dict[str, float], float]]  # doc_id -> (poids, norme), vidé à chaque ajout
+
+
+def new_index() -> MemoryIndex:
+    return {"doc_count": 0, "df": {}, "docs": {}, "postings": {}, "weights": {}}
+
+
+def add(index: MemoryIndex, doc_id: str, text: str, payload: Dict[str, object]) -> None:
+    """Indexe un échange (``payload`` est restitué tel quel par ``search``)."""
+    remove(index, doc_id)
+    term_freq = dict(Counter(analysis.tokenize(text)))
+    if not term_freq:
+        return
+    index["docs"][doc_id] = {"term_freq": term_freq, "length": sum(term_freq.values()), "payload": payload}
+    df = index["df"]
+    postings = index["postings"]
+    for term, count in term_freq.items():
+        df[term] = df.get(term, 0) + 1
+        postings.setdefault(term, {})[doc_id] = count
+    index["doc_count"] = len(index["docs"])
+    index["weights"] = {}  # IDF modifiés : poids recalculés à la prochaine recherche
+
+
+def remove(index: MemoryIndex, doc_id: str) -> None:
+    doc = index["docs"].pop(doc_id, None)
+    if doc is None:
+        return
+    df = index["df"]
+    postings = index["postings"]
+    for term in doc["term_freq"]:
+        plist = postings.get(term)
+        if plist is not None:
+            plist.pop(doc_id, None)
+            if not plist:
+                del postings[term]
+        if df.get(term, 0) <= 1:
+            df.pop(term, None)
+        else:
+            df[term] -= 1
+    index["doc_count"] = len(index["docs"])
+    index["weights"] = {}
+
+
+def _tfidf_vector(index: MemoryIndex, term_freq: Dict[str, int], length: int) -> Tuple[Dict[str, float], float]:
+    length = max(1, length)
+    weights: Dict[str, float] = {}
+    for term, count in term_freq.items():
+        idf = math.log((1 + index["doc_count"]) / (1 + index["df"].get(term, 0))) + 1.0
+        weights[term] = count / length * idf
+    return weights, math.sqrt(sum(value * value for value in weights.values())) or 1.0
+
+
+def _doc_weights(index: MemoryIndex, doc_id: str) -> Tuple[Dict[str, float], float]:
+    cached = index["weights"].get(doc_id)
+    if cached is None:
+        doc = index["docs"][doc_id]
+        cached = index["weights"][doc_id] = _tfidf_vector(index, doc["term_freq"], doc["length"])
+    return cached
+
+
+def search(index: MemoryIndex, query: str, top_k: int = 3, min_score: float = 0.0) -> List[Tuple[float, Dict[str, object]]]:
+    """Échanges les plus proches de la requête (cosinus TF-IDF) : ``[(score, payload)]``."""
+    query_freq = dict(Counter(analysis.tokenize(query)))
+    if not query_freq or not index["doc_count"]:
+        return []
+    query_vec, query_norm = _tfidf_vector(index, query_freq, sum(query_freq.values()))
+    dots: Dict[str, float] = defaultdict(float)
+    for term, q_weight in query_vec.items():
+        for doc_id in index["postings"].get(term, ()):
+            dots[doc_id] += q_weight * _doc_weights(index, doc_id)[0].get(term, 0.0)
+    scores = ((dot / (query_norm * _doc_weights(index, doc_id)[1]), doc_id) for doc_id, dot in dots.items())
+    ranked = sorted((item for item in scores if item[0] > min_score), reverse=True)
+    docs = index["docs"]
+    return [(score, docs[doc_id]["payload"]) for score, doc_id in ranked[: max(1, top_k)]]
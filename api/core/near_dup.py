@@ -0,0 +1,550 @@
+"""
+Détection des quasi-doublons à l'ingestion (MinHash + LSH) pour ``vector_index``.
+
+Chaque document reçoit une signature MinHash calculée sur ses triplets de termes.
+Une table LSH (bandes de la signature) fournit les candidats, retenus si la
+similarité de Jaccard estimée dépasse ``ELYON_INDEX_DEDUP_THRESHOLD``.
+Mode ``ELYON_INDEX_DEDUP`` : ``link`` (défaut : doublon non indexé, rattaché au
+document canonique pour être ré-indexé si le canonique disparaît), ``skip`` (doublon
+ignoré) ou ``off``.
+Un rattachement ne garde en mémoire qu'une référence (position, taille et CRC32) vers
+son texte et ses métadonnées, écrits dans ``duplicates.bin`` à la sauvegarde suivante.
+La persistance est en ajout seul : ``minhash.bin`` / ``minhash_ids.jsonl`` et
+``duplicates.jsonl`` reçoivent les signatures et (dé)rattachements depuis la dernière
+sauvegarde, et ne sont réécrits qu'au compactage (journal trop long par rapport à
+l'état vivant) ou après une réindexation.
+Pendant une réindexation complète, ``stage()`` fait construire un nouvel état à part
+(lectures des rapports sur l'état courant) que ``publish()`` installe avec le snapshot.
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+import threading
+import zlib
+from array import array
+from collections import defaultdict
+from pathlib import Path
+from typing import BinaryIO, DefaultDict, Dict, Iterable, List, Optional, Set, Tuple, TypedDict, cast
+
+try:
+    from . import analysis
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import analysis  # type: ignore[import]
+
+MODE = os.getenv("ELYON_INDEX_DEDUP", "link").strip().lower() or "link"
+THRESHOLD = float(os.getenv("ELYON_INDEX_DEDUP_THRESHOLD", "0.85"))
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+# En dessous de ce nombre de triplets, le texte est trop court pour conclure.
+MIN_SHINGLES = 8
+
+SIGNATURES_FILE = "minhash.bin"
+IDS_FILE = "minhash_ids.jsonl"
+LINKS_FILE = "duplicates.jsonl"
+PAYLOADS_FILE = "duplicates.bin"
+# Anciens formats (réécriture complète à chaque sauvegarde), migrés au premier chargement.
+_LEGACY_FILES = ("minhash_ids.json", "duplicates.json")
+# Compactage quand le journal dépasse ``COMPACT_RATIO`` x l'état vivant (+ marge fixe).
+COMPACT_RATIO = 2
+COMPACT_SLACK = 256
+
+_PRIME = (1 << 31) - 1
+_rng = random.Random(6)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+Signature = Tuple[int, ...]
+
+
+class DuplicateLink(TypedDict):
+    """
+    Rattachement d'un doublon : document canonique et référence vers son texte et ses
+    métadonnées dans ``duplicates.bin`` (``offset`` à -1 tant qu'ils n'y sont pas écrits).
+    """
+
+    canonical: str
+    canonical_parent: Optional[str]
+    parent_id: Optional[str]
+    similarity: float
+    offset: int
+    size: int
+    checksum: int  # CRC32 du texte
+
+
+class Orphan(TypedDict):
+    """Doublon dont le document canonique a disparu, avec de quoi le ré-indexer."""
+
+    parent_id: Optional[str]
+    text: str
+    metadata: Dict[str, object]
+
+
+class Cluster(TypedDict):
+    canonical: str
+    duplicates: List[str]
+    passages: int
+    min_similarity: float
+
+
+class Stats(TypedDict):
+    mode: str
+    threshold: float
+    signatures: int
+    linked: int
+    skipped: int
+
+
+class _DedupState(TypedDict):
+    signatures: Dict[str, Signature]  # doc_id -> signature
+    buckets: DefaultDict[Tuple[int, int], Set[str]]  # (bande, hachage) -> {doc_id}
+    links: Dict[str, DuplicateLink]  # doublon -> rattachement
+
+
+class _Journal(TypedDict):
+    """Modifications de l'état publié depuis la dernière sauvegarde, et taille des fichiers."""
+
+    signatures: List[Tuple[str, Optional[Signature]]]  # (doc_id, signature ; None = retrait)
+    links: List[Tuple[str, Optional[DuplicateLink]]]  # (doublon, rattachement ; None = retrait)
+    payloads: Dict[str, Tuple[str, Dict[str, object]]]  # doublon -> (texte, métadonnées) non écrits
+    rows: int  # lignes de ``minhash_ids.jsonl`` (signatures mortes comprises)
+    lines: int  # lignes de ``duplicates.jsonl``
+    rewrite: bool  # réécriture complète à la prochaine sauvegarde
+
+
+_LOCK = threading.Lock()
+
+
+def _empty() -> _DedupState:
+    return {"signatures": {}, "buckets": defaultdict(set), "links": {}}
+
+
+def _empty_journal(rewrite: bool) -> _Journal:
+    return {"signatures": [], "links": [], "payloads": {}, "rows": 0, "lines": 0, "rewrite": rewrite}
+
+
+_state: _DedupState = _empty()  # état publié
+_staged: Optional[_DedupState] = None  # état en construction (réindexation), cf. ``stage()``
+_journal: _Journal = _empty_journal(rewrite=True)
+_directory: Optional[Path] = None  # dossier des fichiers persistés (dernier ``load``/``save``)
+_skipped = 0  # doublons ignorés (mode skip) depuis le démarrage
+
+
+def enabled() -> bool:
+    return MODE in {"link", "skip"}
+
+
+def _target() -> _DedupState:
+    """État modifié par l'ingestion : l'état en construction s'il existe, sinon l'état publié."""
+    return _staged if _staged is not None else _state
+
+
+def _journaled() -> bool:
+    # l'état en construction est écrit d'un bloc : rien à journaliser
+    return _staged is None and not _journal["rewrite"]
+
+
+def stage() -> None:
+    """Démarre un état vide, construit à part jusqu'à ``publish()`` (réindexation complète)."""
+    global _staged
+    with _LOCK:
+        _staged = _empty()
+        _reset_journal_locked(rewrite=True)
+
+
+def publish() -> None:
+    """Installe l'état en construction, s'il y en a un."""
+    global _state, _staged
+    with _LOCK:
+        if _staged is not None:
+            _state, _staged = _staged, None
+
+
+def _reset_journal_locked(rewrite: bool) -> None:
+    payloads = _journal["payloads"]
+    _journal.update(_empty_journal(rewrite))
+    _journal["payloads"] = payloads  # textes non encore écrits : toujours nécessaires
+
+
+def signature(text: str) -> Optional[Signature]:
+    """Signature MinHash du texte (``None`` si la détection est désactivée ou le texte trop court)."""
+    if not enabled():
+        return None
+    terms = analysis.tokenize(text)
+    shingles = {" ".join(terms[i : i + SHINGLE]) for i in range(len(terms) - SHINGLE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = [zlib.crc32(shingle.encode("utf-8")) % _PRIME for shingle in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def _band_keys(sig: Signature) -> List[Tuple[int, int]]:
+    return [(band, hash(sig[band * ROWS : (band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def _similarity(left: Signature, right: Signature) -> float:
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+def find_duplicate(sig: Signature, exclude: Iterable[str] = ()) -> Optional[Tuple[str, float]]:
+    """Document déjà indexé le plus proche au-dessus du seuil : ``(doc_id, similarité)``."""
+    excluded = set(exclude)
+    with _LOCK:
+        state = _target()
+        signatures = state["signatures"]
+        buckets = state["buckets"]
+        candidates: Set[str] = set()
+        for key in _band_keys(sig):
+            candidates.update(buckets.get(key, ()))
+        best: Optional[Tuple[str, float]] = None
+        for doc_id in candidates - excluded:
+            score = _similarity(sig, signatures[doc_id])
+            if score >= THRESHOLD and (best is None or score > best[1]):
+                best = (doc_id, score)
+    return best
+
+
+def add(doc_id: str, sig: Signature) -> None:
+    with _LOCK:
+        _add_locked(_target(), doc_id, sig)
+        if _journaled():
+            _journal["signatures"].append((doc_id, sig))
+
+
+def _add_locked(state: _DedupState, doc_id: str, sig: Signature) -> None:
+    _remove_locked(state, doc_id)
+    state["signatures"][doc_id] = sig
+    for key in _band_keys(sig):
+        state["buckets"][key].add(doc_id)
+
+
+def _remove_locked(state: _DedupState, doc_id: str) -> bool:
+    sig = state["signatures"].pop(doc_id, None)
+    if sig is None:
+        return False
+    buckets = state["buckets"]
+    for key in _band_keys(sig):
+        members = buckets.get(key)
+        if members is not None:
+            members.discard(doc_id)
+            if not members:
+                del buckets[key]
+    return True
+
+
+def remove(doc_id: str) -> List[Tuple[str, Orphan]]:
+    """
+    Retire un document ; ses doublons rattachés perdent leur document canonique et sont
+    retournés avec leur texte et leurs métadonnées (relus depuis ``duplicates.bin``) pour
+    être ré-indexés. Un doublon dont le texte est illisible est oublié.
+    """
+    with _LOCK:
+        state = _target()
+        if _remove_locked(state, doc_id) and _journaled():
+            _journal["signatures"].append((doc_id, None))
+        links = state["links"]
+        orphans: List[Tuple[str, Orphan]] = []
+        for dup in [dup for dup, record in links.items() if record["canonical"] == doc_id]:
+            record = links.pop(dup)
+            payload = _payload_locked(dup, record)
+            _forget_link_locked(dup)
+            if payload is not None:
+                text, metadata = payload
+                orphans.append((dup, {"parent_id": record["parent_id"], "text": text, "metadata": metadata}))
+    return orphans
+
+
+def link(
+    doc_id: str,
+    canonical: str,
+    similarity: float,
+    parent_id: Optional[str] = None,
+    canonical_parent: Optional[str] = None,
+    text: str = "",
+    metadata: Optional[Dict[str, object]] = None,
+) -> bool:
+    """
+    Enregistre ``doc_id`` comme doublon de ``canonical`` (mode ``link``, retourne True) ou
+    le compte seulement (mode ``skip``, retourne False). ``parent_id`` / ``canonical_parent`` :
+    documents d'origine des passages ; ``text`` / ``metadata`` : de quoi ré-indexer le doublon,
+    gardés en mémoire jusqu'à leur écriture dans ``duplicates.bin`` (``save()``).
+    """
+    global _skipped
+    with _LOCK:
+        if MODE == "skip":
+            _skipped += 1
+            return False
+        record: DuplicateLink = {
+            "canonical": canonical,
+            "canonical_parent": canonical_parent,
+            "parent_id": parent_id,
+            "similarity": round(similarity, 3),
+            "offset": -1,
+            "size": 0,
+            "checksum": zlib.crc32(text.encode("utf-8")),
+        }
+        _target()["links"][doc_id] = record
+        _journal["payloads"][doc_id] = (text, dict(metadata or {}))
+        if _journaled():
+            _journal["links"].append((doc_id, record))
+    return True
+
+
+def _forget_link_locked(doc_id: str) -> None:
+    _journal["payloads"].pop(doc_id, None)
+    if _journaled():
+        _journal["links"].append((doc_id, None))
+
+
+def unlink(doc_id: str) -> None:
+    with _LOCK:
+        if _target()["links"].pop(doc_id, None) is not None:
+            _forget_link_locked(doc_id)
+
+
+def unlink_parent(parent_id: str) -> None:
+    """Oublie les doublons rattachés issus d'un document (ré-ingéré ou supprimé)."""
+    with _LOCK:
+        links = _target()["links"]
+        for dup in [dup for dup, link in links.items() if dup == parent_id or link.get("parent_id") == parent_id]:
+            del links[dup]
+            _forget_link_locked(dup)
+
+
+def _payload_locked(doc_id: str, record: DuplicateLink) -> Optional[Tuple[str, Dict[str, object]]]:
+    """Texte et métadonnées d'un doublon : en attente d'écriture, sinon relus dans ``duplicates.bin``."""
+    pending = _journal["payloads"].get(doc_id)
+    if pending is not None:
+        return pending
+    if record["offset"] < 0 or _directory is None:
+        return None
+    try:
+        with (_directory / PAYLOADS_FILE).open("rb") as fh:
+            fh.seek(record["offset"])
+            data = json.loads(fh.read(record["size"]).decode("utf-8"))
+        text, metadata = str(data["text"]), data["metadata"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if zlib.crc32(text.encode("utf-8")) != record["checksum"] or not isinstance(metadata, dict):
+        return None
+    return text, metadata
+
+
+def clusters() -> List[Cluster]:
+    """
+    Groupes de doublons : document canonique (document parent pour les passages)
+    et documents rattachés, avec le nombre de passages concernés.
+    """
+    with _LOCK:
+        links = dict(_state["links"])
+    grouped: Dict[str, Cluster] = {}
+    members: Dict[str, Set[str]] = defaultdict(set)
+    for dup, info in links.items():
+        canonical_doc = str(info.get("canonical_parent") or info["canonical"])
+        group = grouped.setdefault(
+            canonical_doc, {"canonical": canonical_doc, "duplicates": [], "passages": 0, "min_similarity": 1.0}
+        )
+        members[canonical_doc].add(str(info.get("parent_id") or dup))
+        group["passages"] += 1
+        group["min_similarity"] = min(group["min_similarity"], float(info["similarity"]))
+    out = []
+    for group in sorted(grouped.values(), key=lambda g: (-g["passages"], g["canonical"])):
+        group["duplicates"] = sorted(members[group["canonical"]])
+        out.append(group)
+    return out
+
+
+def clear() -> None:
+    global _state, _staged
+    with _LOCK:
+        _state = _empty()
+        _staged = None
+        _journal.update(_empty_journal(rewrite=True))
+
+
+def _write_payload(fh: BinaryIO, record: DuplicateLink, payload: Tuple[str, Dict[str, object]]) -> None:
+    data = json.dumps({"text": payload[0], "metadata": payload[1]}, ensure_ascii=False).encode("utf-8")
+    record["offset"] = fh.tell()
+    record["size"] = len(data)
+    fh.write(data)
+
+
+def _json_line(value: object) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def save(directory: Path) -> None:
+    """
+    Persiste l'état modifié par l'ingestion (celui que publiera le prochain snapshot) :
+    ajout du journal en fin de fichiers, ou réécriture complète (réindexation, compactage,
+    changement de dossier).
+    """
+    global _directory
+    with _LOCK:
+        directory.mkdir(parents=True, exist_ok=True)
+        state = _target()
+        if _journal["rewrite"] or directory != _directory or _too_long_locked(state):
+            _rewrite_locked(directory, state)
+        else:
+            _append_locked(directory, state)
+        _directory = directory
+        _journal["signatures"], _journal["links"], _journal["payloads"] = [], [], {}
+        _journal["rewrite"] = _staged is not None
+
+
+def _too_long_locked(state: _DedupState) -> bool:
+    rows = _journal["rows"] + len(_journal["signatures"])
+    lines = _journal["lines"] + len(_journal["links"])
+    return (
+        rows > COMPACT_RATIO * len(state["signatures"]) + COMPACT_SLACK
+        or lines > COMPACT_RATIO * len(state["links"]) + COMPACT_SLACK
+    )
+
+
+def _append_locked(directory: Path, state: _DedupState) -> None:
+    signatures = _journal["signatures"]
+    if signatures:
+        flat = array("I")
+        for _, sig in signatures:
+            if sig is not None:
+                flat.extend(sig)
+        with (directory / SIGNATURES_FILE).open("ab") as fh:
+            flat.tofile(fh)
+        with (directory / IDS_FILE).open("a", encoding="utf-8") as fh:
+            fh.writelines(_json_line(["+" if sig is not None else "-", doc_id]) for doc_id, sig in signatures)
+    links = _journal["links"]
+    if links:
+        payloads = _journal["payloads"]
+        with (directory / PAYLOADS_FILE).open("ab") as fh:
+            for doc_id, record in links:
+                payload = payloads.get(doc_id)
+                if record is not None and payload is not None and state["links"].get(doc_id) is record:
+                    _write_payload(fh, record, payload)
+        with (directory / LINKS_FILE).open("a", encoding="utf-8") as fh:
+            fh.writelines(
+                _json_line({"id": doc_id, "link": record} if record is not None else {"id": doc_id})
+                for doc_id, record in links
+            )
+    _journal["rows"] += len(signatures)
+    _journal["lines"] += len(links)
+
+
+def _rewrite_locked(directory: Path, state: _DedupState) -> None:
+    signatures = state["signatures"]
+    flat = array("I")
+    for sig in signatures.values():
+        flat.extend(sig)
+    with (directory / (SIGNATURES_FILE + ".tmp")).open("wb") as fh:
+        flat.tofile(fh)
+    (directory / (IDS_FILE + ".tmp")).write_text(
+        "".join(_json_line(["+", doc_id]) for doc_id in signatures), encoding="utf-8"
+    )
+    links = state["links"]
+    with (directory / (PAYLOADS_FILE + ".tmp")).open("wb") as fh:
+        for doc_id, record in list(links.items()):
+            payload = _payload_locked(doc_id, record)
+            if payload is None:
+                del links[doc_id]  # texte perdu : le doublon ne pourrait plus être ré-indexé
+                continue
+            _write_payload(fh, record, payload)
+    (directory / (LINKS_FILE + ".tmp")).write_text(
+        "".join(_json_line({"id": doc_id, "link": record}) for doc_id, record in links.items()), encoding="utf-8"
+    )
+    for name in (SIGNATURES_FILE, IDS_FILE, PAYLOADS_FILE, LINKS_FILE):
+        os.replace(directory / (name + ".tmp"), directory / name)
+    for name in _LEGACY_FILES:
+        (directory / name).unlink(missing_ok=True)
+    _journal["rows"], _journal["lines"] = len(signatures), len(links)
+
+
+def load(directory: Path) -> bool:
+    """Recharge signatures et rattachements ; False si absents (signatures à recalculer)."""
+    global _directory
+    clear()
+    links, lines = _load_links(directory)
+    with _LOCK:
+        _directory = directory
+        _state["links"] = links
+        _journal["lines"] = lines
+    ids_path = directory / IDS_FILE
+    sig_path = directory / SIGNATURES_FILE
+    if not ids_path.exists() or not sig_path.exists():
+        return False
+    try:
+        events = [json.loads(line) for line in ids_path.read_text(encoding="utf-8").splitlines() if line]
+        flat = array("I")
+        with sig_path.open("rb") as fh:
+            flat.frombytes(fh.read())
+        rows = sum(1 for op, _ in events if op == "+")
+    except (OSError, ValueError, TypeError):
+        return False
+    if len(flat) < rows * NUM_PERM:
+        return False
+    with _LOCK:
+        row = 0
+        for op, doc_id in events:
+            if op == "+":
+                _add_locked(_state, str(doc_id), tuple(flat[row * NUM_PERM : (row + 1) * NUM_PERM]))
+                row += 1
+            else:
+                _remove_locked(_state, str(doc_id))
+        _journal["rows"] = len(events)
+        # lignes orphelines (écriture interrompue) ou liens hérités : repartir d'une réécriture
+        _journal["rewrite"] = len(flat) != rows * NUM_PERM or bool(_journal["payloads"])
+    return True
+
+
+def _load_links(directory: Path) -> Tuple[Dict[str, DuplicateLink], int]:
+    """Rejoue ``duplicates.jsonl`` (ou migre l'ancien ``duplicates.json``) : ``(rattachements, lignes)``."""
+    links: Dict[str, DuplicateLink] = {}
+    path = directory / LINKS_FILE
+    legacy = directory / _LEGACY_FILES[1]
+    try:
+        if path.exists():
+            lines = path.read_text(encoding="utf-8").splitlines()
+            for line in lines:
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # dernière ligne tronquée
+                record = event.get("link")
+                if isinstance(record, dict):
+                    links[str(event["id"])] = cast(DuplicateLink, record)
+                else:
+                    links.pop(str(event.get("id")), None)
+            return links, len(lines)
+        if legacy.exists():
+            data = json.loads(legacy.read_text(encoding="utf-8"))
+            for doc_id, old in (data if isinstance(data, dict) else {}).items():
+                text = str(old.get("text") or "")
+                metadata = old.get("metadata")
+                links[doc_id] = {
+                    "canonical": str(old.get("canonical")),
+                    "canonical_parent": old.get("canonical_parent"),
+                    "parent_id": old.get("parent_id"),
+                    "similarity": float(old.get("similarity") or 0.0),
+                    "offset": -1,
+                    "size": 0,
+                    "checksum": zlib.crc32(text.encode("utf-8")),
+                }
+                with _LOCK:
+                    _journal["payloads"][doc_id] = (text, metadata if isinstance(metadata, dict) else {})
+    except (OSError, ValueError, AttributeError):
+        return {}, 0
+    return links, 0
+
+
+def stats() -> Stats:
+    with _LOCK:
+        return {
+            "mode": MODE,
+            "threshold": THRESHOLD,
+            "signatures": len(_state["signatures"]),
+            "linked": len(_state["links"]),
+            "skipped": _skipped,
+        }
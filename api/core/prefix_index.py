@@ -0,0 +1,74 @@
+"""
+Index de préfixes pour l'autocomplétion (vocabulaire de ``vector_index`` et titres).
+
+Tableau trié de clés repliées (``analysis.fold``) parcouru par dichotomie ; les
+complétions sont classées par fréquence documentaire. Les meilleures complétions
+des préfixes courts (1 à 2 caractères), les plus coûteux, sont précalculées.
+L'index est immuable : ``vector_index`` le reconstruit à chaque génération.
+"""
+from __future__ import annotations
+
+import heapq
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Mapping, Sized, Tuple
+
+try:
+    from . import analysis
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import analysis  # type: ignore[import]
+
+# Longueur maximale des préfixes précalculés et nombre de complétions conservées pour eux.
+SHORT_PREFIX = 2
+MAX_LIMIT = 20
+
+# (clé repliée, libellé, poids)
+Entry = Tuple[str, str, int]
+
+
+def normalize(text: str) -> str:
+    """Clé de recherche : texte replié, espaces compactés."""
+    return " ".join(analysis.fold(text).split())
+
+
+class PrefixIndex:
+    """Complétions par préfixe sur un ensemble figé d'entrées."""
+
+    __slots__ = ("_keys", "_entries", "_short")
+
+    def __init__(self, entries: Iterable[Entry]) -> None:
+        ordered = sorted(entry for entry in entries if entry[0] and entry[2] > 0)
+        self._keys = [entry[0] for entry in ordered]
+        self._entries = ordered
+        short: Dict[str, List[Entry]] = {}
+        for entry in ordered:
+            for size in range(1, min(SHORT_PREFIX, len(entry[0])) + 1):
+                short.setdefault(entry[0][:size], []).append(entry)
+        self._short = {prefix: _best(group, MAX_LIMIT) for prefix, group in short.items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Entry]:
+        """Entrées dont la clé commence par ``prefix`` (déjà normalisé), par poids décroissant."""
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_LIMIT))
+        if len(prefix) <= SHORT_PREFIX:
+            return self._short.get(prefix, [])[:limit]
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + "\uffff", lo)
+        return _best(self._entries[lo:hi], limit)
+
+
+def _best(entries: Iterable[Entry], limit: int) -> List[Entry]:
+    return heapq.nsmallest(limit, entries, key=lambda entry: (-entry[2], len(entry[0]), entry[0]))
+
+
+def from_terms(df: Mapping[str, int]) -> PrefixIndex:
+    """Index du vocabulaire (terme -> fréquence documentaire)."""
+    return PrefixIndex((term, term, count) for term, count in df.items())
+
+
+def from_labels(labels: Mapping[str, Sized]) -> PrefixIndex:
+    """Index de libellés (titre -> documents le portant, dont le nombre sert de poids)."""
+    return PrefixIndex((normalize(label), label, len(doc_ids)) for label, doc_ids in labels.items())
@@ -0,0 +1,131 @@
+"""
+Assemblage du prompt /chat sous budget de jetons.
+
+Chaque section (consigne système, connaissances RAG, intention, mémoire, messages
+du client) porte une priorité : les sections sont retenues par priorité croissante
+tant que le budget le permet ; une section qui déborde est tronquée si elle l'accepte,
+écartée sinon. Les lignes déjà présentes dans une section plus prioritaire sont
+retirées, de même qu'un message entièrement cité par l'une d'elles (mémoire et
+historique client se recoupent souvent).
+Le comptage des jetons est une estimation rapide (mots et ponctuation), sans tokenizer.
+"""
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+TOKEN_BUDGET = max(64, int(os.getenv("ELYON_PROMPT_TOKEN_BUDGET", "3000")))
+# En dessous de ce reliquat, une section n'est pas tronquée mais écartée.
+MIN_TRUNCATED_TOKENS = 32
+# Les lignes plus courtes ("oui", "merci") ne sont jamais considérées comme des doublons.
+MIN_DUPLICATE_CHARS = 20
+
+_TOKEN_REGEX = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation du nombre de jetons : un par signe de ponctuation, un par tranche de 4 caractères de mot."""
+    return sum((len(token) + 3) // 4 for token in _TOKEN_REGEX.findall(text or ""))
+
+
+def _normalize_line(line: str) -> str:
+    return " ".join(line.split()).lower()
+
+
+def _truncate(text: str, max_tokens: int, keep: str) -> str:
+    """Coupe ``text`` à ``max_tokens`` environ, en gardant le début (``head``) ou la fin (``tail``)."""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+
+    def cut(size: int) -> str:
+        return text[:size].rstrip() + " […]" if keep == "head" else "[…] " + text[-size:].lstrip()
+
+    size = max(1, len(text) * max_tokens // tokens)
+    while size > 1 and estimate_tokens(cut(size)) > max_tokens:
+        size = size * 9 // 10
+    return cut(size)
+
+
+@dataclass
+class _Section:
+    name: str
+    text: str
+    priority: int
+    role: str
+    truncate: Optional[str]  # "head", "tail" ou None
+
+
+class PromptBuilder:
+    """Sections ordonnées d'un prompt ; ``build()`` applique déduplication et budget."""
+
+    def __init__(self, budget: Optional[int] = None) -> None:
+        self.budget = TOKEN_BUDGET if budget is None else max(1, budget)
+        self._sections: List[_Section] = []
+        self._kept: Dict[str, str] = {}
+
+    def add(
+        self,
+        name: str,
+        text: str,
+        priority: int,
+        role: str = "system",
+        truncate: Optional[str] = None,
+    ) -> None:
+        """
+        Ajoute une section (l'ordre d'ajout est l'ordre du prompt). ``priority`` : 0 = la
+        plus importante ; ``truncate`` : ``"head"`` ou ``"tail"`` (partie conservée) si la
+        section peut être raccourcie, ``None`` sinon.
+        """
+        if text and text.strip():
+            self._sections.append(_Section(name, text, priority, role, truncate))
+
+    def kept(self, name: str) -> Optional[str]:
+        """Texte retenu (éventuellement tronqué) pour la section ``name`` au dernier ``build()``."""
+        return self._kept.get(name)
+
+    def build(self) -> Tuple[List[Dict[str, str]], Dict[str, object]]:
+        """Messages retenus (dans l'ordre d'ajout) et rapport ``{budget, used, dropped, sections}``."""
+        by_priority = sorted(range(len(self._sections)), key=lambda i: self._sections[i].priority)
+        seen_lines: set = set()
+        seen_texts: List[str] = []
+        kept: Dict[int, str] = {}
+        status: Dict[str, str] = {}
+        used = 0
+        dropped = 0
+        for i in by_priority:
+            section = self._sections[i]
+            name = section.name
+            lines = [line for line in section.text.splitlines() if _normalize_line(line) not in seen_lines]
+            text = "\n".join(lines).strip()
+            key = _normalize_line(text)
+            if not text or (len(key) >= MIN_DUPLICATE_CHARS and any(key in other for other in seen_texts)):
+                status[name] = "duplicate"
+                continue
+            tokens = estimate_tokens(text)
+            remaining = self.budget - used
+            if tokens > remaining:
+                keep = section.truncate
+                if keep is None or remaining < MIN_TRUNCATED_TOKENS:
+                    status[name] = "dropped"
+                    dropped += tokens
+                    continue
+                text = _truncate(text, remaining, keep)
+                dropped += tokens - estimate_tokens(text)
+                tokens = estimate_tokens(text)
+                status[name] = "truncated"
+            else:
+                status[name] = "kept"
+            used += tokens
+            kept[i] = text
+            seen_texts.append(_normalize_line(text))
+            seen_lines.update(
+                key for key in (_normalize_line(line) for line in text.splitlines()) if len(key) >= MIN_DUPLICATE_CHARS
+            )
+        self._kept = {self._sections[i].name: text for i, text in kept.items()}
+        messages = [
+            {"role": self._sections[i].role, "content": kept[i]} for i in range(len(self._sections)) if i in kept
+        ]
+        return messages, {"budget": self.budget, "used": used, "dropped": dropped, "sections": status}
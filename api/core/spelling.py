@@ -0,0 +1,210 @@
+"""
+Correction orthographique des requêtes (suppressions symétriques, à la SymSpell).
+
+Chaque terme du vocabulaire de ``vector_index`` est enregistré sous toutes ses
+variantes obtenues en supprimant jusqu'à ``ELYON_INDEX_SPELL_DISTANCE`` caractères
+(sur ses ``PREFIX_LENGTH`` premiers caractères). Un terme inconnu est corrigé en
+cherchant ses propres variantes dans cette table, puis en retenant le candidat le
+plus proche (distance de Damerau-Levenshtein), à égalité le plus fréquent (DF).
+Une faute dans un suffixe empêche la racinisation (``"harcelemnt"``) : le terme est
+alors ramené à sa racine si sa fin est à une faute d'un suffixe connu.
+La table est mise à jour terme par terme quand le vocabulaire change ; pendant une
+réindexation complète, ``stage()`` la fait reconstruire à part (les requêtes gardent
+la table courante) jusqu'à ``publish()``.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple, TypedDict
+
+try:
+    from . import analysis
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import analysis  # type: ignore[import]
+
+MAX_DISTANCE = max(0, min(3, int(os.getenv("ELYON_INDEX_SPELL_DISTANCE", "2"))))
+# Seuls les premiers caractères sont indexés (borne le nombre de variantes par terme).
+PREFIX_LENGTH = 7
+# Termes plus courts : ni indexés ni corrigés (trop de faux positifs).
+MIN_LENGTH = 4
+# En dessous de cette longueur, une seule faute est tolérée.
+LONG_TERM = 8
+# Suffixes assez longs pour reconnaître une fin de mot mal orthographiée.
+_MIN_SUFFIX = 3
+_LONG_SUFFIXES = tuple(suffix for suffix in analysis.SUFFIXES if len(suffix) >= _MIN_SUFFIX)
+
+_LOCK = threading.Lock()
+
+
+class _SpellingState(TypedDict):
+    deletes: Dict[str, Set[str]]  # variante -> {terme du vocabulaire}
+    terms: Set[str]  # termes indexés
+
+
+class Stats(TypedDict):
+    max_distance: int
+    terms: int
+    variants: int
+
+
+def _empty() -> _SpellingState:
+    return {"deletes": {}, "terms": set()}
+
+
+_state: _SpellingState = _empty()  # table interrogée par ``correct()``
+_staged: Optional[_SpellingState] = None  # table en construction (réindexation), cf. ``stage()``
+
+
+def enabled() -> bool:
+    return MAX_DISTANCE > 0
+
+
+def stage() -> None:
+    """Démarre une table vide, alimentée à part jusqu'à ``publish()`` (réindexation complète)."""
+    global _staged
+    with _LOCK:
+        _staged = _empty()
+
+
+def publish() -> None:
+    """Installe la table en construction, s'il y en a une."""
+    global _state, _staged
+    with _LOCK:
+        if _staged is not None:
+            _state, _staged = _staged, None
+
+
+def _target() -> _SpellingState:
+    return _staged if _staged is not None else _state
+
+
+def _eligible(term: str) -> bool:
+    return len(term) >= MIN_LENGTH and term.isalpha()
+
+
+def _variants(term: str) -> Set[str]:
+    """Le préfixe du terme et toutes ses variantes à ``MAX_DISTANCE`` suppressions au plus."""
+    prefix = term[:PREFIX_LENGTH]
+    out = {prefix}
+    frontier = {prefix}
+    for _ in range(MAX_DISTANCE):
+        frontier = {word[:i] + word[i + 1 :] for word in frontier if len(word) > 1 for i in range(len(word))}
+        out |= frontier
+    return out
+
+
+def _add_locked(state: _SpellingState, term: str) -> None:
+    terms = state["terms"]
+    if term in terms or not _eligible(term):
+        return
+    terms.add(term)
+    deletes = state["deletes"]
+    for variant in _variants(term):
+        deletes.setdefault(variant, set()).add(term)
+
+
+def _remove_locked(state: _SpellingState, term: str) -> None:
+    terms = state["terms"]
+    if term not in terms:
+        return
+    terms.discard(term)
+    deletes = state["deletes"]
+    for variant in _variants(term):
+        bucket = deletes.get(variant)
+        if bucket is not None:
+            bucket.discard(term)
+            if not bucket:
+                del deletes[variant]
+
+
+def update(added: Iterable[str] = (), removed: Iterable[str] = ()) -> None:
+    """Applique les termes apparus et disparus du vocabulaire."""
+    if not enabled():
+        return
+    with _LOCK:
+        state = _target()
+        for term in removed:
+            _remove_locked(state, term)
+        for term in added:
+            _add_locked(state, term)
+
+
+def rebuild(vocabulary: Iterable[str]) -> None:
+    """Reconstruit la table pour tout un vocabulaire (chargement, ré-analyse)."""
+    global _state, _staged
+    state = _empty()
+    if enabled():
+        for term in vocabulary:
+            _add_locked(state, term)
+    with _LOCK:
+        _state, _staged = state, None
+
+
+def clear() -> None:
+    rebuild(())
+
+
+def distance(left: str, right: str, limit: int) -> int:
+    """Distance de Damerau-Levenshtein (transpositions adjacentes) ; ``limit + 1`` au-delà de ``limit``."""
+    if abs(len(left) - len(right)) > limit:
+        return limit + 1
+    previous: Optional[List[int]] = None
+    current = list(range(len(right) + 1))
+    for i in range(1, len(left) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(right)
+        for j in range(1, len(right) + 1):
+            cost = 0 if left[i - 1] == right[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if before is not None and i > 1 and j > 1 and left[i - 1] == right[j - 2] and left[i - 2] == right[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def correct(term: str, df: Dict[str, int]) -> Optional[str]:
+    """
+    Terme du vocabulaire le plus proche d'un terme inconnu (``None`` si le terme est
+    connu, trop court ou sans candidat assez proche). ``df`` départage les ex aequo.
+    """
+    if not enabled() or term in df or not _eligible(term):
+        return None
+    limit = 1 if len(term) < LONG_TERM else MAX_DISTANCE
+    candidates: Set[str] = set()
+    with _LOCK:
+        deletes = _state["deletes"]
+        for variant in _variants(term):
+            bucket = deletes.get(variant)
+            if bucket:
+                candidates.update(bucket)
+    best: Optional[Tuple[int, int, str]] = None
+    for candidate in candidates:
+        count = df.get(candidate, 0)
+        if not count:
+            continue
+        dist = distance(term, candidate, limit)
+        if dist <= limit and (best is None or (dist, -count, candidate) < best):
+            best = (dist, -count, candidate)
+    if best is not None:
+        return best[2]
+    return _misspelled_suffix(term, df)
+
+
+def _misspelled_suffix(term: str, df: Dict[str, int]) -> Optional[str]:
+    """Racine connue la plus longue dont le reste du terme est un suffixe mal orthographié."""
+    for cut in range(len(term) - _MIN_SUFFIX, MIN_LENGTH - 2, -1):
+        head, tail = term[:cut], term[cut:]
+        if head in df and any(distance(tail, suffix, 1) <= 1 for suffix in _LONG_SUFFIXES):
+            return head
+    return None
+
+
+def stats() -> Stats:
+    with _LOCK:
+        return {
+            "max_distance": MAX_DISTANCE,
+            "terms": len(_state["terms"]),
+            "variants": len(_state["deletes"]),
+        }
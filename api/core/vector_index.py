@@ -1,224 +1,1645 @@
 from __future__ import annotations
 
+import heapq
 import json
 import math
-import re
+import os
 import threading
-from collections import Counter
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, TypedDict
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - dépendance optionnelle
+    np = None  # type: ignore[assignment]
+
+try:
+    from . import analysis, corpus_ingest, dense_index, index_segment, near_dup, prefix_index, spelling
+except ImportError:  # pragma: no cover - exécution directe du module
+    from api.core import (  # type: ignore[import]
+        analysis,
+        corpus_ingest,
+        dense_index,
+        index_segment,
+        near_dup,
+        prefix_index,
+        spelling,
+    )
 
 ROOT = Path(__file__).resolve().parents[2]
 INDEX_DIR = ROOT / "data" / "vector_index"
-INDEX_FILE = INDEX_DIR / "index.json"
+INDEX_FILE = INDEX_DIR / "index.json"  # ancien format JSON, migré au premier chargement
+CORPUS_MANIFEST_FILE = INDEX_DIR / "corpus_manifest.json"  # empreintes des fichiers indexés
 _LOCK = threading.Lock()
 
-_TOK_REGEX = re.compile(r"[A-Za-zÀ-ÖØ-öø-ÿ0-9_]{2,}")
+# Écart relatif de DF (ou du nombre de documents) toléré avant de recalculer
+# les poids TF-IDF mis en cache.
+DF_TOLERANCE = float(os.getenv("ELYON_INDEX_DF_TOLERANCE", "0.1"))
+
+# Classement par défaut ("tfidf" ou "bm25") et paramètres BM25/BM25F.
+DEFAULT_SCORER = os.getenv("ELYON_INDEX_SCORER", "tfidf").strip().lower() or "tfidf"
+BM25_K1 = float(os.getenv("ELYON_INDEX_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("ELYON_INDEX_BM25_B", "0.75"))
+
+
+def _parse_boosts(raw: str) -> Dict[str, float]:
+    boosts: Dict[str, float] = {}
+    for part in raw.split(","):
+        if "=" not in part:
+            continue
+        name, value = part.split("=", 1)
+        try:
+            boosts[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return boosts
+
+
+# Recherche hybride (lexicale + dense) fusionnée par rang réciproque, si l'index dense est actif.
+HYBRID_SEARCH = os.getenv("ELYON_INDEX_HYBRID", "1").strip().lower() not in {"0", "false", "no", "off"}
+RRF_K = int(os.getenv("ELYON_INDEX_RRF_K", "60"))
+
+# Métadonnées non indexées pour les filtres (positions des passages).
+_UNFILTERED_FIELDS = {"start", "end"}
+
+# Reranking MMR : taille du vivier de candidats (multiple de top_k) quand ``diversity`` > 0.
+MMR_POOL = max(1, int(os.getenv("ELYON_INDEX_MMR_POOL", "4")))
+
+# Métadonnées proposées en autocomplétion (en plus du vocabulaire).
+SUGGEST_FIELDS = ("title",)
+# Documents relus (les plus fréquents pour le terme) pour retrouver la forme écrite d'un terme suggéré.
+SUGGEST_SURFACE_SAMPLE = 3
+
+# Cache LRU/TTL des résultats de recherche (0 = désactivé), invalidé à chaque génération d'index.
+QUERY_CACHE_SIZE = max(0, int(os.getenv("ELYON_INDEX_CACHE_SIZE", "256")))
+QUERY_CACHE_TTL = float(os.getenv("ELYON_INDEX_CACHE_TTL", "300"))
+
+# Champs de métadonnées indexés à part (BM25F) et leur pondération par défaut.
+FIELD_BOOSTS: Dict[str, float] = _parse_boosts(
+    os.getenv("ELYON_INDEX_FIELD_BOOSTS", "title=2.0,heading=1.5,source=0.5")
+)
+
+_IndexDoc = index_segment.StoredDoc  # {text | text_ref, metadata, term_freq, length, fields}
+_Postings = Dict[str, Dict[str, int]]  # term -> {doc_id: tf}
+
+
+class _IdfBase(TypedDict):
+    doc_count: int
+    df: Dict[str, int]
+
+
+class _IndexState(TypedDict):
+    """Structures lues par la recherche (snapshot publié)."""
+
+    doc_count: int
+    df: Dict[str, int]  # term -> document frequency
+    docs: Dict[str, _IndexDoc]
+    postings: _Postings  # index inversé, reconstruit au chargement
+    weights: Dict[str, Tuple[Dict[str, float], float]]  # doc_id -> (poids TF-IDF, norme), invalidé paresseusement
+    field_postings: Dict[str, _Postings]  # champ -> postings (métadonnées, BM25F)
+    field_lengths: Dict[str, int]  # champ -> somme des longueurs du champ
+    total_length: int  # somme des longueurs (longueur moyenne pour BM25)
+    filters: Dict[str, Dict[str, Set[str]]]  # champ de métadonnées -> valeur -> {doc_id} (recherche filtrée)
+    filter_fields: Dict[str, Set[str]]  # champ de métadonnées -> {doc_id possédant ce champ}
+    generation: int  # incrémenté à chaque modification (invalide le cache de requêtes)
 
-_IndexDoc = Dict[str, object]
-_IndexState = Dict[str, object]
 
-_state: _IndexState = {
+class _WritableState(_IndexState):
+    """État modifié par les écrivains : structures publiées et structures internes."""
+
+    idf_base: _IdfBase  # DF de référence des poids en cache
+    parents: Dict[str, Set[str]]  # parent_id -> {passage doc_id} (documents découpés en passages)
+
+
+class SyncSummary(TypedDict):
+    added: List[str]
+    updated: List[str]
+    removed: List[str]
+    restored: List[str]
+    unchanged: int
+
+
+class ReindexSummary(TypedDict):
+    documents: int  # fichiers sources indexés (au moins un passage)
+    passages: int  # entrées de l'index (un document non découpé compte pour un passage)
+
+
+class IndexStats(TypedDict):
+    doc_count: int
+    terms: int
+    cached_weights: int
+    generation: int
+    dense: dense_index.Stats
+    near_duplicates: near_dup.Stats
+    spelling: spelling.Stats
+    query_cache: Dict[str, object]
+
+
+class _BulkState(TypedDict):
+    depth: int
+    dirty: bool
+
+
+class _UnsavedState(TypedDict):
+    """Écarts entre l'état en mémoire et le segment sur disque (``save`` écrit un delta ou tout)."""
+
+    deleted: Set[str]  # documents retirés depuis la dernière sauvegarde
+    full: bool  # segment complet à réécrire (index vidé ou ré-analysé)
+
+
+class _SuggestIndex(TypedDict):
+    generation: int
+    terms: Optional[prefix_index.PrefixIndex]
+    titles: Optional[prefix_index.PrefixIndex]
+    surfaces: Dict[str, str]  # terme -> forme écrite
+
+
+_state: _WritableState = {
     "doc_count": 0,
-    "df": {},  # term -> document frequency
-    "docs": {},  # doc_id -> {text, metadata, term_freq}
+    "df": {},
+    "docs": {},
+    "postings": {},
+    "weights": {},
+    "idf_base": {"doc_count": 0, "df": {}},
+    "parents": {},
+    "total_length": 0,
+    "field_postings": {},
+    "field_lengths": {},
+    "filters": {},
+    "filter_fields": {},
+    "generation": 0,
 }
 
 
+# Lectures sans verrou : les écrivains modifient ``_state`` sous ``_LOCK`` en copiant à
+# l'écriture toute structure encore partagée avec le snapshot publié, puis publient un
+# nouveau snapshot par simple réaffectation de ``_snapshot`` (atomique). Les lecteurs
+# travaillent sur le snapshot obtenu au début de la requête, jamais modifié ensuite
+# (hormis le remplissage paresseux du cache de poids).
+def _snapshot_of(state: _WritableState) -> _IndexState:
+    return {
+        "doc_count": state["doc_count"],
+        "df": state["df"],
+        "docs": state["docs"],
+        "postings": state["postings"],
+        "weights": state["weights"],
+        "field_postings": state["field_postings"],
+        "field_lengths": state["field_lengths"],
+        "total_length": state["total_length"],
+        "filters": state["filters"],
+        "filter_fields": state["filter_fields"],
+        "generation": state["generation"],
+    }
+
+
+_snapshot: _IndexState = _snapshot_of(_state)
+_owned: Set[Tuple[str, ...]] = set()  # structures déjà copiées depuis la dernière publication
+
+# ingestion massive en cours : la persistance est différée jusqu'à la sortie
+_bulk: _BulkState = {"depth": 0, "dirty": False}
+_unsaved: _UnsavedState = {"deleted": set(), "full": True}
+
+# doublons rattachés dont le document canonique vient d'être retiré (doublon -> texte et métadonnées),
+# ré-indexés avant la fin de la mutation en cours (``_restore_orphans_locked``)
+_orphans: Dict[str, near_dup.Orphan] = {}
+
+# clé (termes, top_k, options) -> (expiration, génération, résultats)
+_query_cache: "OrderedDict[Tuple[object, ...], Tuple[float, int, List[Dict[str, object]]]]" = OrderedDict()
+_query_cache_stats: Dict[str, int] = {"hits": 0, "misses": 0}
+_CACHE_LOCK = threading.Lock()
+
+# index de préfixes de l'autocomplétion, reconstruit à la première suggestion d'une génération
+_suggest_index: _SuggestIndex = {"generation": -1, "terms": None, "titles": None, "surfaces": {}}
+_SUGGEST_LOCK = threading.Lock()
+
+
 def _ensure_dir() -> None:
     INDEX_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def _load_json_index() -> bool:
+    data = json.loads(INDEX_FILE.read_text(encoding="utf-8"))
+    if not isinstance(data, dict):
+        return False
+    docs: Dict[str, _IndexDoc] = {}
+    for doc_id, payload in (data.get("docs", {}) or {}).items():
+        if not isinstance(payload, dict):
+            continue
+        docs[str(doc_id)] = {
+            "text": str(payload.get("text", "")),
+            "metadata": payload.get("metadata") if isinstance(payload.get("metadata"), dict) else {},
+            "term_freq": {
+                str(k): int(v) for k, v in (payload.get("term_freq", {}) or {}).items()
+            },
+            "length": int(payload.get("length", 0)),
+        }
+    _state["docs"] = docs
+    _state["df"] = {str(k): int(v) for k, v in (data.get("df", {}) or {}).items()}
+    _state["doc_count"] = len(docs)
+    return True
+
+
 def load() -> None:
-    """Charge l'index depuis le disque si présent."""
+    """
+    Charge l'index depuis le segment binaire courant (textes laissés dans le fichier mappé).
+    Un ancien ``index.json`` est migré une fois vers le format binaire puis renommé.
+    """
     _ensure_dir()
-    if INDEX_FILE.exists():
+    with _LOCK:
         try:
-            data = json.loads(INDEX_FILE.read_text(encoding="utf-8"))
-            if isinstance(data, dict):
-                _state["doc_count"] = int(data.get("doc_count", 0))
-                _state["df"] = {str(k): int(v) for k, v in (data.get("df", {}) or {}).items()}
-                docs = {}
-                for doc_id, payload in (data.get("docs", {}) or {}).items():
-                    if not isinstance(payload, dict):
-                        continue
-                    docs[str(doc_id)] = {
-                        "text": str(payload.get("text", "")),
-                        "metadata": payload.get("metadata") if isinstance(payload.get("metadata"), dict) else {},
-                        "term_freq": {
-                            str(k): int(v) for k, v in (payload.get("term_freq", {}) or {}).items()
-                        },
-                        "length": int(payload.get("length", 0)),
-                    }
-                _state["docs"] = docs
+            segment = index_segment.read_segment(INDEX_DIR)
+            if segment is not None:
+                _unsaved["deleted"], _unsaved["full"] = set(), False
+                _state["docs"] = segment["docs"]
+                _state["df"] = segment["df"]
+                _state["doc_count"] = len(_state["docs"])
+                if segment["analyzer"] != analysis.VERSION:
+                    _reanalyze_locked()
+                _rebuild_postings_locked()
+                if segment["analyzer"] != analysis.VERSION:
+                    save()
+            elif INDEX_FILE.exists() and _load_json_index():
+                _reanalyze_locked()
+                _rebuild_postings_locked()
+                save()
+                INDEX_FILE.replace(INDEX_FILE.with_suffix(".json.migrated"))
         except Exception:
             # index corrompu -> on repart sur un état vide
-            _state["doc_count"] = 0
-            _state["df"] = {}
-            _state["docs"] = {}
-    else:
-        _ensure_dir()
+            _clear_state_locked()
+        _publish_locked()
+        spelling.rebuild(_state["df"])
+        if not near_dup.load(INDEX_DIR) and near_dup.enabled() and _state["docs"]:
+            _rebuild_signatures_locked()
+    dense_index.load(INDEX_DIR)
+
+
+def _rebuild_signatures_locked() -> None:
+    """Recalcule les signatures MinHash des documents indexés (index antérieur à la déduplication)."""
+    for doc_id, doc in _state["docs"].items():
+        sig = near_dup.signature(_doc_text(doc))
+        if sig is not None:
+            near_dup.add(doc_id, sig)
+    near_dup.save(INDEX_DIR)
+
+
+def _reanalyze_locked() -> None:
+    """Recalcule fréquences, longueurs et DF avec la chaîne d'analyse courante (changement de version)."""
+    _unsaved["full"] = True
+    df: Dict[str, int] = defaultdict(int)
+    for doc in _state["docs"].values():
+        text = _doc_text(doc)
+        term_freq = dict(Counter(_tokenize(text)))
+        doc["text"] = text
+        doc["term_freq"] = term_freq
+        doc["length"] = sum(term_freq.values())
+        for term in term_freq:
+            df[term] += 1
+    _state["df"] = dict(df)
+
+
+def migrate_json() -> bool:
+    """Migration explicite ``index.json`` -> segment binaire (retourne True si effectuée)."""
+    if not INDEX_FILE.exists():
+        return False
+    with _LOCK:
+        if not _load_json_index():
+            return False
+        _reanalyze_locked()
+        _rebuild_postings_locked()
+        save()
+        spelling.rebuild(_state["df"])
+    INDEX_FILE.replace(INDEX_FILE.with_suffix(".json.migrated"))
+    return True
+
+
+def _doc_text(doc: _IndexDoc) -> str:
+    text = doc.get("text")
+    if text is not None:
+        return str(text)
+    ref = doc.get("text_ref")
+    return ref.read() if ref is not None else ""
 
 
 def save() -> None:
-    """Persiste l'état courant sur le disque."""
+    """
+    Persiste l'état courant puis publie un snapshot : un segment delta avec les seuls
+    documents ajoutés ou remplacés (ceux dont le texte est encore en mémoire) et les
+    retraits, ou un segment complet si l'index a été vidé, si plus de la moitié des
+    documents a changé ou s'il faut fusionner les deltas (``index_segment.MAX_DELTAS``).
+    Les textes en mémoire sont remplacés par des références vers le fichier mappé
+    (nouvelles entrées : les snapshots précédents gardent les leurs).
+    """
     _ensure_dir()
-    payload = {
-        "doc_count": _state["doc_count"],
-        "df": _state["df"],
-        "docs": {},
-    }
-    for doc_id, meta in _state["docs"].items():
-        payload["docs"][doc_id] = {
-            "text": meta.get("text", ""),
-            "metadata": meta.get("metadata", {}),
-            "term_freq": meta.get("term_freq", {}),
-            "length": meta.get("length", 0),
-        }
-    INDEX_FILE.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    docs = _state["docs"]
+    changed = [(doc_id, doc) for doc_id, doc in docs.items() if "text" in doc]
+    refs: Optional[List[index_segment.TextRef]] = None
+    if not _unsaved["full"] and 2 * len(changed) <= len(docs):
+        refs = index_segment.write_delta(
+            INDEX_DIR, _segment_rows(changed), _unsaved["deleted"], analyzer=analysis.VERSION
+        )
+    if refs is None:
+        changed = list(docs.items())
+        refs = index_segment.write_segment(INDEX_DIR, _segment_rows(changed), analyzer=analysis.VERSION)
+        docs = _state["docs"] = dict(docs)
+    else:
+        docs = _cow_locked(_state, "docs", ("docs",))
+    for (doc_id, doc), ref in zip(changed, refs):
+        entry = {key: value for key, value in doc.items() if key != "text"}
+        entry["text_ref"] = ref
+        docs[doc_id] = entry
+    _unsaved["deleted"], _unsaved["full"] = set(), False
+    dense_index.save(INDEX_DIR)
+    near_dup.save(INDEX_DIR)
+    _publish_locked()
+
+
+def _segment_rows(docs: List[Tuple[str, _IndexDoc]]) -> Iterator[index_segment.SegmentDoc]:
+    for doc_id, doc in docs:
+        yield doc_id, _doc_text(doc), doc.get("metadata", {}), int(doc.get("length", 0)), doc.get("term_freq", {})
+
+
+def _publish_locked() -> None:
+    """
+    Publie l'état courant comme nouveau snapshot de lecture (échange de référence atomique),
+    avec les structures annexes reconstruites à part depuis une réindexation complète.
+    """
+    global _snapshot
+    _owned.clear()
+    _snapshot = _snapshot_of(_state)
+    dense_index.publish()
+    near_dup.publish()
+    spelling.publish()
+
+
+def _cow_locked(parent: Any, key: str, path: Tuple[str, ...], factory: type = dict) -> Any:
+    """
+    Copie à l'écriture : retourne ``parent[key]`` (dict ou set) modifiable, en le copiant
+    s'il peut encore être partagé avec le snapshot publié. ``parent`` doit déjà être modifiable.
+    """
+    current = parent.get(key)
+    if current is None or path not in _owned:
+        current = current.copy() if current else factory()
+        parent[key] = current
+        _owned.add(path)
+    return current
+
+
+def snapshot() -> _IndexState:
+    """Snapshot courant (lecture seule) ; reste cohérent même si l'index est modifié ensuite."""
+    return _snapshot
+
+
+def _bump_generation_locked() -> None:
+    _state["generation"] += 1
+
+
+def _persist_locked() -> None:
+    _bump_generation_locked()
+    if _bulk["depth"]:
+        _bulk["dirty"] = True
+    else:
+        save()
+
+
+@contextmanager
+def bulk_ingest() -> Iterator[None]:
+    """
+    Regroupe plusieurs ``ingest()`` : l'index n'est écrit sur disque qu'une fois
+    en sortie de bloc, puis les poids TF-IDF sont recalculés en arrière-plan.
+    """
+    with _LOCK:
+        _bulk["depth"] += 1
+    flushed = False
+    try:
+        yield
+    finally:
+        with _LOCK:
+            _bulk["depth"] -= 1
+            if not _bulk["depth"] and _bulk["dirty"]:
+                _bulk["dirty"] = False
+                save()
+                flushed = True
+            elif not _bulk["depth"] and _state["generation"] != _snapshot["generation"]:
+                _publish_locked()
+        if flushed:
+            rebuild_weights(background=True)
+
+
+def _clear_state_locked() -> None:
+    _state["doc_count"] = 0
+    _state["df"] = {}
+    _state["docs"] = {}
+    _state["postings"] = {}
+    _state["weights"] = {}
+    _state["idf_base"] = {"doc_count": 0, "df": {}}
+    _state["parents"] = {}
+    _state["total_length"] = 0
+    _state["field_postings"] = {}
+    _state["field_lengths"] = {}
+    _state["filters"] = {}
+    _state["filter_fields"] = {}
+    _unsaved["full"] = True
+    _owned.clear()
+    _bump_generation_locked()
+    # les lecteurs gardent index dense, signatures et correcteur courants jusqu'à la publication
+    dense_index.stage()
+    near_dup.stage()
+    spelling.stage()
+    _orphans.clear()
+
+
+def _rebuild_postings_locked() -> None:
+    """Reconstruit l'index inversé (corps et champs) à partir des fréquences stockées par document."""
+    _state["postings"] = {}
+    _state["parents"] = {}
+    _state["total_length"] = 0
+    _state["field_postings"] = {}
+    _state["field_lengths"] = {}
+    _state["filters"] = {}
+    _state["filter_fields"] = {}
+    _owned.clear()
+    for doc_id, doc in _state["docs"].items():
+        _index_doc_locked(doc_id, doc)
+    _state["weights"] = {}
+    _state["idf_base"] = {"doc_count": _state["doc_count"], "df": dict(_state["df"])}
 
 
 def reset() -> None:
     """Réinitialise complètement l'index (utilitaire dev/tests)."""
     with _LOCK:
-        _state["doc_count"] = 0
-        _state["df"] = {}
-        _state["docs"] = {}
+        _clear_state_locked()
         save()
+        _save_corpus_manifest({})
+
+
+def _load_corpus_manifest() -> Dict[str, Dict[str, object]]:
+    if not CORPUS_MANIFEST_FILE.exists():
+        return {}
+    try:
+        data = json.loads(CORPUS_MANIFEST_FILE.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    files = data.get("files") if isinstance(data, dict) else None
+    return {str(k): v for k, v in files.items() if isinstance(v, dict)} if isinstance(files, dict) else {}
+
+
+def _save_corpus_manifest(files: Dict[str, Dict[str, object]]) -> None:
+    _ensure_dir()
+    tmp_file = CORPUS_MANIFEST_FILE.with_suffix(".tmp")
+    tmp_file.write_text(json.dumps({"files": files}, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    tmp_file.replace(CORPUS_MANIFEST_FILE)
 
 
 def _tokenize(text: str) -> List[str]:
-    return [m.group(0).lower() for m in _TOK_REGEX.finditer(text or "")]
+    return analysis.tokenize(text)
+
+
+def _drifted(current: int, base: int) -> bool:
+    return abs(current - base) > DF_TOLERANCE * max(1, base)
 
 
 def _update_df_for_terms(terms: Iterable[str], delta: int) -> None:
-    df = _state["df"]
-    for term in set(terms):
-        current = df.get(term, 0) + delta
+    _apply_df_delta_locked({term: delta for term in set(terms)})
+
+
+def _apply_df_delta_locked(deltas: Dict[str, int]) -> None:
+    if not any(deltas.values()):
+        return
+    df = _cow_locked(_state, "df", ("df",))
+    base_df = _state["idf_base"]["df"]
+    postings = _state["postings"]
+    appeared: List[str] = []
+    vanished: List[str] = []
+    for term, delta in deltas.items():
+        if not delta:
+            continue
+        previous = df.get(term, 0)
+        current = previous + delta
         if current <= 0:
             df.pop(term, None)
+            if previous > 0:
+                vanished.append(term)
         else:
             df[term] = current
+            if previous <= 0:
+                appeared.append(term)
+        base = base_df.get(term, 0)
+        if _drifted(max(0, current), base):
+            # l'IDF de ce terme a trop bougé : on invalide les documents concernés
+            weights = _cow_locked(_state, "weights", ("weights",))
+            for doc_id in postings.get(term, ()):
+                weights.pop(doc_id, None)
+            base_df[term] = max(0, current)
+    if appeared or vanished:
+        spelling.update(appeared, vanished)
+
+
+def _check_doc_count_drift_locked() -> None:
+    base = _state["idf_base"]
+    if _drifted(_state["doc_count"], base["doc_count"]):
+        _state["weights"] = {}
+        _state["idf_base"] = {"doc_count": _state["doc_count"], "df": dict(_state["df"])}
+
 
+def _writable_postings_locked(scope: Tuple[str, ...]) -> Dict[str, Dict[str, int]]:
+    """Postings modifiables : ``("postings",)`` (corps) ou ``("field_postings", champ)``."""
+    postings = _cow_locked(_state, scope[0], scope[:1])
+    if len(scope) > 1:
+        postings = _cow_locked(postings, scope[1], scope)
+    return postings
 
-def _remove_doc_locked(doc_id: str) -> None:
-    doc = _state["docs"].pop(doc_id, None)
-    if not doc:
+
+def _add_postings_locked(scope: Tuple[str, ...], doc_id: str, term_freq: Dict[str, int]) -> None:
+    if not term_freq:
         return
+    postings = _writable_postings_locked(scope)
+    for term, count in term_freq.items():
+        _cow_locked(postings, term, scope + (term,))[doc_id] = count
+
+
+def _remove_postings_locked(scope: Tuple[str, ...], doc_id: str, terms: Iterable[str]) -> None:
+    postings = _writable_postings_locked(scope)
+    for term in terms:
+        if doc_id not in postings.get(term, ()):
+            continue
+        plist = _cow_locked(postings, term, scope + (term,))
+        del plist[doc_id]
+        if not plist:
+            del postings[term]
+
+
+def _doc_fields(metadata: Dict[str, object]) -> Dict[str, Tuple[Dict[str, int], int]]:
+    """Tokenise les champs de métadonnées indexés (titre, section, source...)."""
+    fields: Dict[str, Tuple[Dict[str, int], int]] = {}
+    for field in FIELD_BOOSTS:
+        value = metadata.get(field)
+        if not value:
+            continue
+        tokens = _tokenize(str(value))
+        if tokens:
+            fields[field] = (dict(Counter(tokens)), len(tokens))
+    return fields
+
+
+def _filter_value(value: object) -> Optional[str]:
+    """Forme normalisée d'une valeur de filtre (``None`` si non indexable)."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    return None
+
+
+def _filter_values(metadata: Dict[str, object]) -> Dict[str, Set[str]]:
+    """Valeurs indexées par champ (scalaires, ou éléments d'une liste de scalaires)."""
+    values: Dict[str, Set[str]] = {}
+    for field, raw in metadata.items():
+        if field in _UNFILTERED_FIELDS:
+            continue
+        items = raw if isinstance(raw, (list, tuple, set)) else [raw]
+        normalized = {v for v in (_filter_value(item) for item in items) if v is not None}
+        if normalized:
+            values[str(field)] = normalized
+    return values
+
+
+def _index_filters_locked(doc_id: str, metadata: Dict[str, object], add: bool) -> None:
+    values = _filter_values(metadata)
+    if not values:
+        return
+    filters = _cow_locked(_state, "filters", ("filters",))
+    filter_fields = _cow_locked(_state, "filter_fields", ("filter_fields",))
+    for field, field_values in values.items():
+        if add:
+            _cow_locked(filter_fields, field, ("filter_fields", field), set).add(doc_id)
+        elif doc_id in filter_fields.get(field, ()):
+            present = _cow_locked(filter_fields, field, ("filter_fields", field), set)
+            present.discard(doc_id)
+            if not present:
+                del filter_fields[field]
+        by_value = _cow_locked(filters, field, ("filters", field))
+        for value in field_values:
+            if add:
+                _cow_locked(by_value, value, ("filters", field, value), set).add(doc_id)
+            elif doc_id in by_value.get(value, ()):
+                ids = _cow_locked(by_value, value, ("filters", field, value), set)
+                ids.discard(doc_id)
+                if not ids:
+                    del by_value[value]
+        if not by_value:
+            del filters[field]
+
+
+def _index_doc_locked(doc_id: str, doc: _IndexDoc) -> None:
+    """Enregistre un document dans les structures dérivées (postings, champs, passages)."""
+    _add_postings_locked(("postings",), doc_id, doc.get("term_freq") or {})
+    _state["total_length"] += int(doc.get("length", 0))
+    metadata = doc.get("metadata") or {}
+    fields = _doc_fields(metadata)
+    doc["fields"] = fields  # document pas encore publié
+    if fields:
+        field_lengths = _cow_locked(_state, "field_lengths", ("field_lengths",))
+    for field, (term_freq, length) in fields.items():
+        _add_postings_locked(("field_postings", field), doc_id, term_freq)
+        field_lengths[field] = field_lengths.get(field, 0) + length
+    _index_filters_locked(doc_id, metadata, add=True)
+    parent_id = metadata.get("parent_id")
+    if parent_id:
+        _state["parents"].setdefault(str(parent_id), set()).add(doc_id)
+
+
+def _unindex_doc_locked(doc_id: str, doc: _IndexDoc) -> None:
+    _remove_postings_locked(("postings",), doc_id, (doc.get("term_freq") or {}).keys())
+    _state["total_length"] = max(0, _state["total_length"] - int(doc.get("length", 0)))
+    fields = doc.get("fields") or {}
+    if fields:
+        field_lengths = _cow_locked(_state, "field_lengths", ("field_lengths",))
+    for field, (term_freq, length) in fields.items():
+        _remove_postings_locked(("field_postings", field), doc_id, term_freq.keys())
+        field_lengths[field] = max(0, field_lengths.get(field, 0) - length)
+    _index_filters_locked(doc_id, doc.get("metadata") or {}, add=False)
+    parent_id = (doc.get("metadata") or {}).get("parent_id")
+    if parent_id:
+        siblings = _state["parents"].get(str(parent_id))
+        if siblings is not None:
+            siblings.discard(doc_id)
+            if not siblings:
+                _state["parents"].pop(str(parent_id), None)
+
+
+@dataclass
+class IngestReport:
+    """Bilan d'une ingestion : seuls ``doc_ids`` ont été ajoutés à l'index."""
+
+    doc_ids: List[str] = field(default_factory=list)  # documents (ou passages) indexés
+    linked: Dict[str, str] = field(default_factory=dict)  # quasi-doublon -> document canonique
+    skipped: List[str] = field(default_factory=list)  # quasi-doublons ignorés (mode skip)
+    restored: List[str] = field(default_factory=list)  # doublons ré-indexés, canonique retiré
+    parents: Dict[str, str] = field(default_factory=dict)  # passage -> document d'origine
+
+    def documents(self, ids: Iterable[str]) -> List[str]:
+        """Documents d'origine distincts (dans l'ordre) d'identifiants de documents ou de passages."""
+        return list(dict.fromkeys(self.parents.get(doc_id, doc_id) for doc_id in ids))
+
+
+def _remove_doc_locked(doc_id: str, df_deltas: Optional[Dict[str, int]] = None) -> None:
+    if doc_id not in _state["docs"]:
+        return
+    doc = _cow_locked(_state, "docs", ("docs",)).pop(doc_id)
+    _unsaved["deleted"].add(doc_id)
     term_freq = doc.get("term_freq") or {}
-    _update_df_for_terms(term_freq.keys(), -1)
+    if df_deltas is None:
+        _update_df_for_terms(term_freq.keys(), -1)
+    else:
+        for term in term_freq:
+            df_deltas[term] = df_deltas.get(term, 0) - 1
+    _unindex_doc_locked(doc_id, doc)
+    # toujours copier : un lecteur d'un ancien snapshot peut encore remplir le cache partagé
+    # avec les poids de l'ancienne version du document
+    _cow_locked(_state, "weights", ("weights",)).pop(doc_id, None)
+    dense_index.remove([doc_id])
+    for duplicate, record in near_dup.remove(doc_id):
+        _orphans[duplicate] = record
     _state["doc_count"] = max(0, _state["doc_count"] - 1)
 
 
-def ingest(text: str, doc_id: Optional[str] = None, metadata: Optional[Dict[str, object]] = None) -> str:
+def _remove_parent_locked(parent_id: str, df_deltas: Optional[Dict[str, int]] = None) -> List[str]:
+    """Retire un document et tous ses passages ; retourne les identifiants supprimés."""
+    near_dup.unlink_parent(parent_id)
+    removed: List[str] = []
+    for doc_id in [parent_id, *sorted(_state["parents"].get(parent_id, ()))]:
+        if doc_id in _state["docs"]:
+            _remove_doc_locked(doc_id, df_deltas)
+            removed.append(doc_id)
+    for duplicate in [dup for dup, record in _orphans.items() if parent_id in (dup, record["parent_id"])]:
+        del _orphans[duplicate]
+    return removed
+
+
+def _restore_orphans_locked(df_deltas: Dict[str, int], report: IngestReport) -> None:
+    """
+    Ré-indexe, dans la mutation qui a retiré leur document canonique, les doublons rattachés
+    à partir du texte relu par ``near_dup`` (ils peuvent se rattacher à un autre document).
+    Sans embedding calculé sous le verrou, ils restent hors de l'index dense.
+    """
+    while _orphans:
+        doc_id, record = _orphans.popitem()
+        doc = corpus_ingest.prepare(record["text"], doc_id=doc_id, metadata=record["metadata"])
+        if doc is None or doc_id in _state["docs"]:
+            continue
+        _, text, meta, term_freq, length = doc
+        if _add_doc_locked(doc_id, text, meta, term_freq, length, near_dup.signature(text), df_deltas, report):
+            report.restored.append(doc_id)
+
+
+def _add_doc_locked(
+    doc_id: str,
+    text: str,
+    metadata: Dict[str, object],
+    term_freq: Dict[str, int],
+    length: int,
+    sig: Optional["near_dup.Signature"],
+    df_deltas: Dict[str, int],
+    report: IngestReport,
+    counted: bool = False,
+) -> bool:
+    """
+    Indexe un document, ou le rattache à un quasi-doublon déjà indexé ; retourne True s'il
+    a été indexé. ``counted`` : ses termes figurent déjà dans ``df_deltas`` (DF précalculé).
+    """
+    if sig is not None:
+        canonical = _link_duplicate_locked(doc_id, text, metadata, sig)
+        if canonical is not None:
+            if counted:
+                for term in term_freq:
+                    df_deltas[term] = df_deltas.get(term, 0) - 1
+            if near_dup.MODE == "skip":
+                report.skipped.append(doc_id)
+            else:
+                report.linked[doc_id] = canonical
+            return False
+    if not counted:
+        for term in term_freq:
+            df_deltas[term] = df_deltas.get(term, 0) + 1
+    docs = _cow_locked(_state, "docs", ("docs",))
+    docs[doc_id] = {
+        "text": text,
+        "metadata": metadata,
+        "term_freq": term_freq,
+        "length": length,
+    }
+    _index_doc_locked(doc_id, docs[doc_id])
+    if sig is not None:
+        near_dup.add(doc_id, sig)
+    return True
+
+
+def ingest(text: str, doc_id: Optional[str] = None, metadata: Optional[Dict[str, object]] = None) -> Optional[str]:
     """
-    Ajoute ou remplace un document dans l'index et retourne son identifiant.
+    Ajoute ou remplace un document dans l'index et retourne son identifiant
+    (``None`` s'il n'est pas indexé : quasi-doublon d'un document déjà présent).
     """
     if not text:
         raise ValueError("Texte vide, impossible d'indexer")
-    doc_id = doc_id or f"doc_{_state['doc_count'] + 1}"
-    tokens = _tokenize(text)
-    if not tokens:
+    doc = corpus_ingest.prepare(text, doc_id=doc_id, metadata=metadata)
+    if doc is None:
         raise ValueError("Aucun token détecté après nettoyage")
-    term_freq = Counter(tokens)
+    doc_ids = _ingest_prepared([doc]).doc_ids
+    return doc_ids[0] if doc_ids else None
+
+
+def ingest_many(documents: Iterable[Dict[str, object]]) -> IngestReport:
+    """
+    Indexe un lot de documents ``{"text", "doc_id"?, "metadata"?, "chunk"?}`` en une passe :
+    tokenisation hors verrou, fusion des DF en une fois et une seule écriture disque.
+    Avec ``"chunk": true`` (et un ``doc_id``), le document est découpé en passages.
+    Les documents vides sont ignorés ; le bilan distingue les identifiants indexés des
+    quasi-doublons rattachés à un document canonique ou ignorés.
+    """
+    prepared: List[corpus_ingest.PreparedDoc] = []
+    for item in documents:
+        if not isinstance(item, dict):
+            continue
+        raw_id = item.get("doc_id")
+        metadata = item.get("metadata")
+        text = str(item.get("text") or "")
+        meta = metadata if isinstance(metadata, dict) else None
+        if raw_id and item.get("chunk"):
+            prepared.extend(corpus_ingest.prepare_passages(text, str(raw_id), metadata=meta))
+            continue
+        doc = corpus_ingest.prepare(text, doc_id=str(raw_id) if raw_id else None, metadata=meta)
+        if doc is not None:
+            prepared.append(doc)
+    return _ingest_prepared(prepared)
+
+
+def _ingest_prepared(
+    prepared: List[corpus_ingest.PreparedDoc],
+    precomputed_df: Optional[Dict[str, int]] = None,
+    rebuild: bool = False,
+    replace: bool = False,
+) -> IngestReport:
+    """
+    Insère des documents déjà tokenisés. ``precomputed_df`` (DF agrégé de ``prepared``,
+    fourni par les workers de réindexation) évite de recompter les termes sous le verrou.
+    ``rebuild`` relance le recalcul des poids en arrière-plan (hors bloc ``bulk_ingest``) :
+    réservé aux réindexations complètes ; un ingest ordinaire laisse la dérive des DF
+    invalider les seuls poids concernés (``DF_TOLERANCE``) sans vider le cache de requêtes.
+    ``replace`` vide l'index dans la même mutation (réindexation complète) : les lecteurs
+    passent directement de l'ancien index complet au nouveau.
+    Les quasi-doublons d'un document déjà indexé ne sont pas indexés (``near_dup``).
+    """
+    report = IngestReport()
+    if not prepared:
+        return report
+    vectors = _embed_prepared(prepared)
+    signatures = [near_dup.signature(doc[1]) for doc in prepared] if near_dup.enabled() else None
+    indexed_rows: List[int] = []
     with _LOCK:
-        if doc_id in _state["docs"]:
-            _remove_doc_locked(doc_id)
-        _update_df_for_terms(term_freq.keys(), +1)
-        _state["docs"][doc_id] = {
-            "text": text,
-            "metadata": metadata or {},
-            "term_freq": dict(term_freq),
-            "length": len(tokens),
-        }
+        if replace:
+            _clear_state_locked()
+        docs = _cow_locked(_state, "docs", ("docs",))
+        df_deltas: Dict[str, int] = dict(precomputed_df or {})
+        # un document ré-ingéré (découpé ou non) remplace l'ensemble de ses anciens passages
+        replaced = {str(doc[2]["parent_id"]) for doc in prepared if doc[2].get("parent_id")}
+        replaced.update(str(doc[0]) for doc in prepared if doc[0] and str(doc[0]) in _state["parents"])
+        for parent_id in replaced:
+            _remove_parent_locked(parent_id, df_deltas)
+        next_num = _state["doc_count"] + 1
+        for row, (raw_id, text, metadata, term_freq, length) in enumerate(prepared):
+            doc_id = raw_id
+            if not doc_id:
+                while f"doc_{next_num}" in docs:
+                    next_num += 1
+                doc_id = f"doc_{next_num}"
+            if doc_id in docs:
+                _remove_doc_locked(doc_id, df_deltas)
+            near_dup.unlink(doc_id)
+            _orphans.pop(doc_id, None)
+            if metadata.get("parent_id"):
+                report.parents[doc_id] = str(metadata["parent_id"])
+            sig = signatures[row] if signatures else None
+            counted = precomputed_df is not None
+            if _add_doc_locked(doc_id, text, metadata, term_freq, length, sig, df_deltas, report, counted):
+                report.doc_ids.append(doc_id)
+                indexed_rows.append(row)
+        _restore_orphans_locked(df_deltas, report)
+        _apply_df_delta_locked(df_deltas)
         _state["doc_count"] = len(_state["docs"])
-        save()
-    return doc_id
+        _check_doc_count_drift_locked()
+        if vectors is not None and indexed_rows:
+            dense_index.add_vectors(report.doc_ids, vectors[indexed_rows])
+        _persist_locked()
+    if rebuild and not _bulk["depth"]:
+        rebuild_weights(background=True)
+    return report
 
 
-def ingest_file(path: Path, metadata: Optional[Dict[str, object]] = None) -> Optional[str]:
+def _link_duplicate_locked(
+    doc_id: str, text: str, metadata: Dict[str, object], sig: "near_dup.Signature"
+) -> Optional[str]:
+    """
+    Rattache ``doc_id`` à un quasi-doublon déjà indexé (hors passages du même document) ;
+    retourne le document canonique, ``None`` si aucun.
+    """
+    parent_id = metadata.get("parent_id")
+    exclude = {doc_id}
+    if parent_id:
+        exclude.update(_state["parents"].get(str(parent_id), ()))
+    match = near_dup.find_duplicate(sig, exclude)
+    if match is None:
+        return None
+    canonical, similarity = match
+    canonical_meta = _state["docs"][canonical].get("metadata") or {}
+    near_dup.link(
+        doc_id,
+        canonical,
+        similarity,
+        parent_id=str(parent_id) if parent_id else None,
+        canonical_parent=str(canonical_meta.get("parent_id") or canonical),
+        text=text,
+        metadata=metadata,
+    )
+    return canonical
+
+
+def _build_prefix_indexes(index: _IndexState, blocking: bool = True) -> None:
+    """Construit les index de préfixes de ``index`` ; sans ``blocking``, abandonne si un autre build est en cours."""
+    global _suggest_index
+    if not _SUGGEST_LOCK.acquire(blocking=blocking):
+        return
     try:
-        text = path.read_text(encoding="utf-8")
-    except Exception:
+        if _suggest_index["generation"] == index["generation"]:
+            return
+        titles: Dict[str, Set[str]] = {}
+        for field in SUGGEST_FIELDS:
+            for value, doc_ids in index["filters"].get(field, {}).items():
+                titles.setdefault(value, set()).update(doc_ids)
+        _suggest_index = {
+            "generation": index["generation"],
+            "terms": prefix_index.from_terms(index["df"]),
+            "titles": prefix_index.from_labels(titles),
+            "surfaces": {},
+        }
+    finally:
+        _SUGGEST_LOCK.release()
+
+
+def _prefix_indexes(index: _IndexState) -> _SuggestIndex:
+    """
+    Index de préfixes de la génération publiée. Une fois un premier index construit,
+    la reconstruction se fait en arrière-plan et l'index précédent sert entre-temps.
+    """
+    current = _suggest_index
+    if current["generation"] == index["generation"]:
+        return current
+    if current["terms"] is None:
+        _build_prefix_indexes(index)
+        return _suggest_index
+    if not _SUGGEST_LOCK.locked():
+        threading.Thread(target=_build_prefix_indexes, args=(index, False), daemon=True).start()
+    return current
+
+
+def _surface_form(index: _IndexState, term: str, surfaces: Dict[str, str]) -> str:
+    """
+    Forme écrite la plus fréquente d'un terme indexé (racine), relevée dans les documents
+    où il est le plus fréquent ; mise en cache pour la génération des index de préfixes.
+    """
+    cached = surfaces.get(term)
+    if cached is not None:
+        return cached
+    postings: Dict[str, int] = index["postings"].get(term) or {}
+    counts: Counter = Counter()
+    for doc_id in heapq.nlargest(SUGGEST_SURFACE_SAMPLE, postings, key=postings.__getitem__):
+        doc = index["docs"].get(doc_id)
+        if doc is not None:
+            counts.update(word for word, indexed in analysis.surface(_doc_text(doc)) if indexed == term)
+    form = counts.most_common(1)[0][0] if counts else term
+    surfaces[term] = form
+    return form
+
+
+def suggest(query: str, limit: int = 10) -> List[Dict[str, object]]:
+    """
+    Autocomplétion : titres de documents commençant par la saisie, puis termes du
+    vocabulaire complétant son dernier mot, classés par fréquence documentaire.
+    """
+    key = prefix_index.normalize(query)
+    if not key or limit <= 0:
+        return []
+    index = _snapshot
+    indexes = _prefix_indexes(index)
+    titles, vocabulary = indexes["titles"], indexes["terms"]
+    if titles is None or vocabulary is None:
+        return []
+    out: List[Dict[str, object]] = [
+        {"text": label, "kind": "title", "weight": weight} for _, label, weight in titles.complete(key, limit)
+    ]
+    _, _, last = key.rpartition(" ")
+    head = " ".join(query.split()).rpartition(" ")[0]
+    prefixes = {last}
+    stemmed = analysis.stem(last)
+    if len(stemmed) >= prefix_index.SHORT_PREFIX + 1:
+        prefixes.add(stemmed)  # "harcele" -> "harcel", forme indexée
+    terms: Dict[str, int] = {}
+    for prefix in prefixes:
+        for term, _, weight in vocabulary.complete(prefix, limit):
+            terms[term] = weight
+    ranked = sorted(terms.items(), key=lambda item: (-item[1], len(item[0]), item[0]))
+    surfaces = indexes["surfaces"]
+    for term, weight in ranked[: max(0, limit - len(out))]:
+        word = _surface_form(index, term, surfaces)
+        out.append({"text": f"{head} {word}".strip(), "kind": "term", "weight": weight})
+    return out
+
+
+def duplicate_clusters() -> List[near_dup.Cluster]:
+    """Groupes de quasi-doublons rattachés à l'ingestion (rapport)."""
+    return near_dup.clusters()
+
+
+def _embed_prepared(prepared: List[corpus_ingest.PreparedDoc]):
+    """Embeddings du lot (hors verrou) si l'index dense est actif ; ``None`` sinon ou en cas d'échec."""
+    if not dense_index.enabled():
+        return None
+    try:
+        return dense_index.embed([doc[1] for doc in prepared])
+    except Exception as exc:
+        print(f"[index] Embeddings indisponibles, index dense non mis à jour: {exc}", flush=True)
+        return None
+
+
+def ingest_file(path: Path, metadata: Optional[Dict[str, object]] = None) -> Optional[str]:
+    """
+    Indexe un fichier (découpé en passages selon la configuration) ; retourne son identifiant
+    (``None`` si rien n'a été indexé : fichier vide ou entièrement quasi-doublon).
+    """
+    passages = corpus_ingest.read_file(path, metadata)
+    if not passages or not _ingest_prepared(passages).doc_ids:
         return None
-    meta = metadata.copy() if isinstance(metadata, dict) else {}
-    meta.setdefault("path", str(path))
-    return ingest(text, doc_id=path.stem, metadata=meta)
+    return path.stem
 
 
-def reindex_corpus(folder: Optional[Path] = None, extensions: Tuple[str, ...] = (".txt", ".md", ".json")) -> int:
-    """Recharge un dossier complet (remplace l'index existant)."""
+def reindex_corpus(
+    folder: Optional[Path] = None,
+    extensions: Tuple[str, ...] = corpus_ingest.DEFAULT_EXTENSIONS,
+    workers: int = 1,
+) -> ReindexSummary:
+    """
+    Recharge un dossier complet (remplace l'index existant). Avec ``workers > 1``,
+    lecture et tokenisation sont parallélisées sur un pool de processus. Renvoie le
+    nombre de documents sources indexés et celui des passages qui les composent.
+    """
     folder = folder or (ROOT / "data" / "corpus")
     if not folder.exists():
-        return 0
-    paths = [p for p in folder.rglob("*") if p.is_file() and p.suffix.lower() in extensions]
-    with _LOCK:
-        _state["doc_count"] = 0
-        _state["df"] = {}
-        _state["docs"] = {}
-        save()
-    count = 0
-    for path in paths:
-        doc_id = ingest_file(path, metadata={"source": "corpus"})
-        if doc_id:
-            count += 1
-    return count
+        return {"documents": 0, "passages": 0}
+    paths = corpus_ingest.list_files(folder, extensions)
+    prepared, df, fingerprints = corpus_ingest.prepare_files(paths, metadata={"source": "corpus"}, workers=workers)
+    if not prepared:
+        with _LOCK:
+            _clear_state_locked()
+            _persist_locked()
+    report = _ingest_prepared(prepared, precomputed_df=df, rebuild=True, replace=True)
+    _save_corpus_manifest(fingerprints)
+    return {"documents": len(report.documents(report.doc_ids)), "passages": len(report.doc_ids)}
 
 
-def _idf(term: str) -> float:
-    df = _state["df"].get(term, 0)
-    return math.log((1 + _state["doc_count"]) / (1 + df)) + 1.0
+def _document_path_locked(doc_id: str) -> Optional[str]:
+    candidates = [doc_id, *sorted(_state["parents"].get(doc_id, ()))]
+    for candidate in candidates:
+        doc = _state["docs"].get(candidate)
+        if doc is not None:
+            path = (doc.get("metadata") or {}).get("path")
+            return str(path) if path else None
+    return None
 
 
-def _tfidf_vector(term_freq: Dict[str, int], doc_len: int) -> Tuple[Dict[str, float], float]:
+def sync_corpus(
+    folder: Optional[Path] = None,
+    extensions: Tuple[str, ...] = corpus_ingest.DEFAULT_EXTENSIONS,
+) -> SyncSummary:
+    """
+    Synchronisation incrémentale du corpus à partir du manifeste d'empreintes :
+    seuls les fichiers nouveaux ou modifiés (mtime/taille, puis SHA-256) sont relus
+    et indexés, les fichiers disparus sont retirés de l'index.
+    Retourne ``{"added", "updated", "removed", "restored", "unchanged"}`` ; ``restored`` liste les
+    quasi-doublons ré-indexés car leur document canonique a disparu.
+    """
+    folder = folder or (ROOT / "data" / "corpus")
+    summary: SyncSummary = {"added": [], "updated": [], "removed": [], "restored": [], "unchanged": 0}
+    if not folder.exists():
+        return summary
+    previous = _load_corpus_manifest()
+    current: Dict[str, Dict[str, object]] = {}
+    changed: List[corpus_ingest.PreparedDoc] = []
+    changed_ids: List[str] = []
+    unchanged = 0
+    for path in corpus_ingest.list_files(folder, extensions):
+        key = str(path)
+        known = previous.get(key)
+        try:
+            quick = corpus_ingest.fingerprint(path)
+        except OSError:
+            continue
+        if known and known.get("mtime") == quick["mtime"] and known.get("size") == quick["size"]:
+            current[key] = known
+            unchanged += 1
+            continue
+        passages, entry = corpus_ingest.read_file_with_fingerprint(path, metadata={"source": "corpus"})
+        if entry is None:
+            continue
+        current[key] = entry
+        if known and known.get("sha256") == entry.get("sha256"):
+            unchanged += 1  # simple "touch" : contenu identique
+            continue
+        changed.extend(passages)
+        changed_ids.append(str(entry["doc_id"]))
+        summary["updated" if known else "added"].append(str(entry["doc_id"]))
+
+    removed = [(key, entry) for key, entry in previous.items() if key not in current]
+    report = IngestReport()
+    with bulk_ingest():
+        if removed:
+            with _LOCK:
+                df_deltas: Dict[str, int] = {}
+                for key, entry in removed:
+                    doc_id = str(entry.get("doc_id", ""))
+                    path = _document_path_locked(doc_id)
+                    if path is None:
+                        # fichier entièrement rattaché à des doublons
+                        _remove_parent_locked(doc_id, df_deltas)
+                        continue
+                    if path != key:
+                        continue
+                    _remove_parent_locked(doc_id, df_deltas)
+                    summary["removed"].append(doc_id)
+                _restore_orphans_locked(df_deltas, report)
+                _apply_df_delta_locked(df_deltas)
+                _state["doc_count"] = len(_state["docs"])
+                _check_doc_count_drift_locked()
+                _persist_locked()
+        if changed_ids:
+            # fichiers vidés : leurs anciens passages disparaissent aussi
+            with _LOCK:
+                df_deltas = {}
+                for doc_id in changed_ids:
+                    _remove_parent_locked(doc_id, df_deltas)
+                _restore_orphans_locked(df_deltas, report)
+                _apply_df_delta_locked(df_deltas)
+                _state["doc_count"] = len(_state["docs"])
+                _check_doc_count_drift_locked()
+                _persist_locked()
+        report.restored.extend(_ingest_prepared(changed).restored)
+    summary["restored"] = report.restored
+    _save_corpus_manifest(current)
+    summary["unchanged"] = unchanged
+    return summary
+
+
+def stats() -> IndexStats:
+    """Résumé de l'état de l'index publié (supervision / endpoints)."""
+    index = _snapshot
+    return {
+        "doc_count": index["doc_count"],
+        "terms": len(index["df"]),
+        "cached_weights": len(index["weights"]),
+        "generation": index["generation"],
+        "dense": dense_index.stats(),
+        "near_duplicates": near_dup.stats(),
+        "spelling": spelling.stats(),
+        "query_cache": query_cache_stats(),
+    }
+
+
+def query_cache_stats() -> Dict[str, object]:
+    """Compteurs du cache de requêtes (supervision)."""
+    with _CACHE_LOCK:
+        hits = _query_cache_stats["hits"]
+        misses = _query_cache_stats["misses"]
+        size = len(_query_cache)
+    total = hits + misses
+    return {
+        "size": size,
+        "max_size": QUERY_CACHE_SIZE,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+    }
+
+
+def _cache_get(key: Tuple[object, ...], generation: int) -> Optional[List[Dict[str, object]]]:
+    with _CACHE_LOCK:
+        entry = _query_cache.get(key)
+        if entry is not None:
+            expires, entry_generation, hits = entry
+            if entry_generation == generation and expires > time.monotonic():
+                _query_cache.move_to_end(key)
+                _query_cache_stats["hits"] += 1
+                return [dict(hit) for hit in hits]
+            del _query_cache[key]
+        _query_cache_stats["misses"] += 1
+    return None
+
+
+def _cache_put(key: Tuple[object, ...], generation: int, hits: List[Dict[str, object]]) -> None:
+    with _CACHE_LOCK:
+        _query_cache[key] = (time.monotonic() + QUERY_CACHE_TTL, generation, [dict(hit) for hit in hits])
+        _query_cache.move_to_end(key)
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+
+
+def _idf(index: _IndexState, term: str) -> float:
+    df = index["df"].get(term, 0)
+    return math.log((1 + index["doc_count"]) / (1 + df)) + 1.0
+
+
+def _tfidf_vector(index: _IndexState, term_freq: Dict[str, int], doc_len: int) -> Tuple[Dict[str, float], float]:
     weights: Dict[str, float] = {}
     doc_len = max(1, doc_len)
     norm_sq = 0.0
     for term, count in term_freq.items():
         tf = count / doc_len
-        idf = _idf(term)
+        idf = _idf(index, term)
         value = tf * idf
         weights[term] = value
         norm_sq += value * value
     return weights, math.sqrt(norm_sq) or 1.0
 
 
-def _cosine_similarity(vec_a: Dict[str, float], norm_a: float, vec_b: Dict[str, float], norm_b: float) -> float:
-    if not vec_a or not vec_b or norm_a == 0 or norm_b == 0:
-        return 0.0
-    score = 0.0
-    for term, weight in vec_a.items():
-        if term in vec_b:
-            score += weight * vec_b[term]
-    return score / (norm_a * norm_b)
+def _doc_weights(index: _IndexState, doc_id: str) -> Tuple[Dict[str, float], float]:
+    """Poids TF-IDF et norme d'un document, recalculés seulement s'ils ont été invalidés."""
+    weights = index["weights"]
+    cached = weights.get(doc_id)
+    if cached is None:
+        doc = index["docs"][doc_id]
+        cached = _tfidf_vector(index, doc.get("term_freq", {}), doc.get("length", 1))
+        weights[doc_id] = cached  # affectation atomique, partagée avec les lecteurs du même snapshot
+    return cached
 
 
-def search(query: str, top_k: int = 3) -> List[Dict[str, object]]:
-    tokens = _tokenize(query)
-    if not tokens or _state["doc_count"] == 0:
+def _rebuild_weights_locked() -> None:
+    _bump_generation_locked()
+    _state["idf_base"] = {"doc_count": _state["doc_count"], "df": dict(_state["df"])}
+    _state["weights"] = {
+        doc_id: _tfidf_vector(_state, doc.get("term_freq", {}), doc.get("length", 1))
+        for doc_id, doc in _state["docs"].items()
+    }
+    if not _bulk["depth"]:
+        _publish_locked()
+
+
+def rebuild_weights(background: bool = False) -> None:
+    """
+    Recalcule tous les poids TF-IDF en cache avec les DF courants.
+    En mode ``background``, le calcul se fait dans un thread dédié (après un ingest massif).
+    """
+    def _run() -> None:
+        with _LOCK:
+            _rebuild_weights_locked()
+
+    if background:
+        threading.Thread(target=_run, name="vector-index-weights", daemon=True).start()
+    else:
+        _run()
+
+
+class SearchOptions(TypedDict, total=False):
+    """Options d'une recherche transmises au ``Scorer``."""
+
+    field_boosts: Optional[Dict[str, float]]
+    k1: Optional[float]
+    b: Optional[float]
+    filter: Optional[_DocFilter]  # documents acceptés par les filtres de métadonnées
+    diversity: float  # 0..1, reranking MMR
+
+
+class Scorer(ABC):
+    """
+    Fonction de classement branchable : ``score()`` parcourt les postings des termes
+    de la requête dans le snapshot ``index`` et retourne ``{doc_id: score}`` pour les
+    documents candidats.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def score(self, index: _IndexState, query_freq: Dict[str, int], options: SearchOptions) -> Dict[str, float]:
+        ...
+
+
+class TfidfScorer(Scorer):
+    """Cosinus TF-IDF sur les poids de documents mis en cache."""
+
+    name = "tfidf"
+
+    def score(self, index: _IndexState, query_freq: Dict[str, int], options: SearchOptions) -> Dict[str, float]:
+        query_vec, query_norm = _tfidf_vector(index, query_freq, sum(query_freq.values()))
+        postings = index["postings"]
+        doc_filter = options.get("filter")
+        scores: Dict[str, float] = defaultdict(float)
+        norms: Dict[str, float] = {}
+        for term, q_weight in query_vec.items():
+            plist = postings.get(term)
+            if not plist:
+                continue
+            for doc_id in plist:
+                if doc_filter is not None and doc_id not in doc_filter:
+                    continue
+                doc_vec, doc_norm = _doc_weights(index, doc_id)
+                scores[doc_id] += q_weight * doc_vec.get(term, 0.0)
+                norms[doc_id] = doc_norm
+        return {doc_id: score / (query_norm * norms[doc_id]) for doc_id, score in scores.items()}
+
+
+class BM25Scorer(Scorer):
+    """
+    BM25 sur le corps du document, étendu en BM25F aux champs de métadonnées
+    (``field_boosts``) ; longueurs moyennes maintenues à l'ingestion.
+    """
+
+    name = "bm25"
+
+    def score(self, index: _IndexState, query_freq: Dict[str, int], options: SearchOptions) -> Dict[str, float]:
+        k1 = float(options.get("k1") or BM25_K1)
+        b = options.get("b")
+        b = BM25_B if b is None else float(b)
+        boosts = dict(FIELD_BOOSTS)
+        boosts.update(options.get("field_boosts") or {})
+        doc_count = max(1, index["doc_count"])
+        avg_len = max(1.0, index["total_length"] / doc_count)
+        field_postings = index["field_postings"]
+        field_avg = {f: max(1.0, n / doc_count) for f, n in index["field_lengths"].items()}
+        postings = index["postings"]
+        docs = index["docs"]
+        doc_filter = options.get("filter")
+        scores: Dict[str, float] = defaultdict(float)
+        for term, q_count in query_freq.items():
+            body = postings.get(term) or {}
+            fields = [
+                (field, boost, field_postings[field][term])
+                for field, boost in boosts.items()
+                if boost > 0 and term in field_postings.get(field, {})
+            ]
+            if not body and not fields:
+                continue
+            df = max([len(body)] + [len(plist) for _, _, plist in fields])
+            idf = math.log(1.0 + (doc_count - df + 0.5) / (df + 0.5))
+            candidates = set(body)
+            for _, _, plist in fields:
+                candidates.update(plist)
+            for doc_id in candidates:
+                if doc_filter is not None and doc_id not in doc_filter:
+                    continue
+                doc = docs[doc_id]
+                tf = 0.0
+                count = body.get(doc_id)
+                if count:
+                    tf += count / (1.0 - b + b * int(doc.get("length", 0)) / avg_len)
+                for field, boost, plist in fields:
+                    f_count = plist.get(doc_id)
+                    if f_count:
+                        f_len = doc.get("fields", {})[field][1]
+                        tf += boost * f_count / (1.0 - b + b * f_len / field_avg.get(field, 1.0))
+                scores[doc_id] += q_count * idf * tf * (k1 + 1.0) / (k1 + tf)
+        return scores
+
+
+class _DocFilter:
+    """
+    Prédicat de filtrage construit à partir des ensembles précalculés à l'ingestion :
+    un document est accepté s'il satisfait chaque clause (ET entre champs).
+    """
+
+    __slots__ = ("clauses", "empty")
+
+    def __init__(self, clauses: List[Tuple[Set[str], Optional[Set[str]]]]) -> None:
+        # (documents acceptés, documents possédant le champ si l'absence est acceptée)
+        self.clauses = clauses
+        self.empty = any(not allowed and present is None for allowed, present in clauses)
+
+    @classmethod
+    def build(cls, index: _IndexState, filters: Tuple[Tuple[str, Tuple[Optional[str], ...]], ...]) -> "_DocFilter":
+        by_field = index["filters"]
+        clauses: List[Tuple[Set[str], Optional[Set[str]]]] = []
+        for field, values in filters:
+            by_value = by_field.get(field, {})
+            sets = [by_value[value] for value in values if value is not None and value in by_value]
+            allowed = sets[0] if len(sets) == 1 else set().union(*sets)
+            present = index["filter_fields"].get(field, set()) if None in values else None
+            clauses.append((allowed, present))
+        # clauses les plus sélectives d'abord
+        clauses.sort(key=lambda clause: (clause[1] is not None, len(clause[0])))
+        return cls(clauses)
+
+    def __contains__(self, doc_id: object) -> bool:
+        for allowed, present in self.clauses:
+            if doc_id in allowed or (present is not None and doc_id not in present):
+                continue
+            return False
+        return True
+
+
+def _normalize_filters(filters: Optional[Dict[str, object]]) -> Tuple[Tuple[str, Tuple[Optional[str], ...]], ...]:
+    """Forme canonique (triée, hashable) des filtres : clé de cache et entrée de ``_DocFilter``."""
+    if not filters:
+        return ()
+    normalized = []
+    for field, raw in filters.items():
+        items = raw if isinstance(raw, (list, tuple, set)) else [raw]
+        values: Set[Optional[str]] = set()
+        for item in items:
+            value = None if item is None else _filter_value(item)
+            if value is not None or item is None:
+                values.add(value)
+        if values:
+            normalized.append((str(field), tuple(sorted(values, key=lambda v: (v is not None, v or "")))))
+    return tuple(sorted(normalized))
+
+
+_SCORERS: Dict[str, Scorer] = {}
+
+
+def register_scorer(scorer: Scorer) -> None:
+    """Enregistre (ou remplace) une fonction de classement utilisable via ``search(scorer=...)``."""
+    _SCORERS[scorer.name] = scorer
+
+
+register_scorer(TfidfScorer())
+register_scorer(BM25Scorer())
+
+
+def _known_term(index: _IndexState, term: str) -> bool:
+    return term in index["df"] or any(term in postings for postings in index["field_postings"].values())
+
+
+def _correct_terms(index: _IndexState, terms: Sequence[str]) -> Tuple[List[str], Dict[str, str]]:
+    corrections: Dict[str, str] = {}
+    out: List[str] = []
+    for term in terms:
+        if term not in corrections and not _known_term(index, term):
+            fixed = spelling.correct(term, index["df"])
+            if fixed is not None:
+                corrections[term] = fixed
+        out.append(corrections.get(term, term))
+    return out, corrections
+
+
+def correct_terms(terms: Sequence[str]) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Remplace les termes inconnus de l'index par le terme du vocabulaire le plus proche
+    (``"gouvernnanc"`` -> ``"gouvern"``). Retourne ``(termes, {terme inconnu: correction})``.
+    """
+    return _correct_terms(_snapshot, terms)
+
+
+def search(
+    query: str,
+    top_k: int = 3,
+    scorer: Optional[str] = None,
+    field_boosts: Optional[Dict[str, float]] = None,
+    k1: Optional[float] = None,
+    b: Optional[float] = None,
+    hybrid: Optional[bool] = None,
+    filters: Optional[Dict[str, object]] = None,
+    terms: Optional[Sequence[str]] = None,
+    diversity: Optional[float] = None,
+) -> List[Dict[str, object]]:
+    """
+    Recherche via l'index inversé : seuls les documents partageant au moins un terme
+    (ou un champ de métadonnées pour BM25F) avec la requête sont évalués.
+    ``scorer`` : "tfidf" (cosinus, défaut) ou "bm25" ; ``field_boosts``, ``k1`` et ``b``
+    ajustent BM25/BM25F pour cette requête. Si l'index dense est actif (``hybrid``),
+    les classements lexical et dense sont fusionnés par rang réciproque (RRF).
+    ``filters`` restreint les candidats sur les métadonnées avant le calcul des scores :
+    ``{"source": "corpus", "roles": ["enseignant", None]}`` (ET entre champs, OU entre
+    valeurs ; ``None`` accepte les documents sans ce champ).
+    ``terms`` : termes déjà analysés (``analysis.tokenize``), pour ne pas ré-analyser la requête.
+    ``diversity`` (0..1) active un reranking MMR des meilleurs candidats : 0 = pertinence
+    seule, 1 = diversité maximale entre résultats.
+    Les termes absents de l'index sont d'abord corrigés (voir ``correct_terms``).
+    Les résultats sont mis en cache par multiensemble de termes et options, tant que
+    la génération de l'index ne change pas.
+    """
+    ranker = _SCORERS.get((scorer or DEFAULT_SCORER).lower())
+    if ranker is None:
+        raise ValueError(f"Scorer inconnu : {scorer}")
+    index = _snapshot
+    tokens = list(terms) if terms is not None else _tokenize(query)
+    if not tokens or index["doc_count"] == 0:
         return []
-    query_freq = Counter(tokens)
-    query_vec, query_norm = _tfidf_vector(query_freq, len(tokens))
-    results: List[Tuple[str, float]] = []
-    for doc_id, doc_meta in _state["docs"].items():
-        doc_vec, doc_norm = _tfidf_vector(doc_meta.get("term_freq", {}), doc_meta.get("length", 1))
-        score = _cosine_similarity(query_vec, query_norm, doc_vec, doc_norm)
-        if score > 0.0:
-            results.append((doc_id, score))
-    results.sort(key=lambda x: x[1], reverse=True)
-    out = []
-    for doc_id, score in results[: max(1, top_k)]:
-        doc_meta = _state["docs"][doc_id]
-        out.append(
-            {
-                "doc_id": doc_id,
-                "score": round(score, 4),
-                "text": doc_meta.get("text", ""),
-                "metadata": doc_meta.get("metadata", {}),
-            }
+    tokens, _ = _correct_terms(index, tokens)
+    normalized_filters = _normalize_filters(filters)
+    doc_filter: Optional[_DocFilter] = None
+    if normalized_filters:
+        doc_filter = _DocFilter.build(index, normalized_filters)
+        if doc_filter.empty:
+            return []
+    query_freq = dict(Counter(tokens))
+    use_dense = (HYBRID_SEARCH if hybrid is None else hybrid) and dense_index.enabled()
+    generation = int(index["generation"])
+    cache_key: Optional[Tuple[object, ...]] = None
+    if QUERY_CACHE_SIZE:
+        cache_key = (
+            tuple(sorted(query_freq.items())),
+            max(1, top_k),
+            ranker.name,
+            tuple(sorted((field_boosts or {}).items())),
+            k1,
+            b,
+            normalized_filters,
+            round(float(diversity or 0.0), 3),
+            # la requête dense dépend du texte brut, pas seulement des termes
+            query.strip() if use_dense else None,
         )
+        cached = _cache_get(cache_key, generation)
+        if cached is not None:
+            return cached
+    options: SearchOptions = {
+        "field_boosts": field_boosts,
+        "k1": k1,
+        "b": b,
+        "filter": doc_filter,
+        "diversity": min(1.0, max(0.0, float(diversity or 0.0))),
+    }
+    out = _search_uncached(index, query, ranker, query_freq, top_k, options, use_dense)
+    if cache_key is not None:
+        _cache_put(cache_key, generation, out)
     return out
 
 
+def _search_uncached(
+    index: _IndexState,
+    query: str,
+    ranker: Scorer,
+    query_freq: Dict[str, int],
+    top_k: int,
+    options: SearchOptions,
+    use_dense: bool,
+) -> List[Dict[str, object]]:
+    scores = ranker.score(index, query_freq, options)
+    if not scores:
+        return []
+    docs = index["docs"]
+    diversity = float(options.get("diversity") or 0.0)
+    depth = max(1, top_k) * (MMR_POOL if diversity > 0.0 else 1)
+    if use_dense:
+        ranked, components = _fuse_dense(index, query, scores, depth, options.get("filter"))
+    else:
+        ranked = heapq.nlargest(depth, ((score, doc_id) for doc_id, score in scores.items()))
+        components = {}
+    if diversity > 0.0:
+        ranked = _mmr_rerank(index, [(s, d) for s, d in ranked if s > 0.0 and d in docs], top_k, diversity)
+    out = []
+    for score, doc_id in ranked:
+        if score <= 0.0 or doc_id not in docs:
+            continue
+        doc_meta = docs[doc_id]
+        hit: Dict[str, object] = {
+            "doc_id": doc_id,
+            "score": round(score, 4),
+            "text": _doc_text(doc_meta),
+            "metadata": doc_meta.get("metadata", {}),
+        }
+        if doc_id in components:
+            hit["scores"] = components[doc_id]
+        out.append(hit)
+    return out
+
+
+def _similarity_matrix(index: _IndexState, doc_ids: List[str]) -> List[List[float]]:
+    """
+    Cosinus entre candidats : vecteurs denses s'ils existent tous, sinon poids TF-IDF
+    (matrice termes x documents avec NumPy, produits scalaires creux sinon).
+    """
+    dense = dense_index.vectors(doc_ids) if dense_index.enabled() else None
+    if dense is not None:
+        return (dense @ dense.T).tolist()
+    vectors = []
+    for doc_id in doc_ids:
+        weights, norm = _doc_weights(index, doc_id)
+        vectors.append((weights, norm))
+    if np is not None:
+        vocab: Dict[str, int] = {}
+        for weights, _ in vectors:
+            for term in weights:
+                vocab.setdefault(term, len(vocab))
+        matrix = np.zeros((len(doc_ids), max(1, len(vocab))), dtype=np.float32)
+        for row, (weights, norm) in enumerate(vectors):
+            for term, value in weights.items():
+                matrix[row, vocab[term]] = value / norm
+        return (matrix @ matrix.T).tolist()
+    sims = [[1.0] * len(doc_ids) for _ in doc_ids]
+    for i, (left, left_norm) in enumerate(vectors):
+        for j in range(i + 1, len(vectors)):
+            right, right_norm = vectors[j]
+            small, large = (left, right) if len(left) <= len(right) else (right, left)
+            dot = sum(value * large.get(term, 0.0) for term, value in small.items())
+            sims[i][j] = sims[j][i] = dot / (left_norm * right_norm)
+    return sims
+
+
+def _mmr_rerank(
+    index: _IndexState, ranked: List[Tuple[float, str]], top_k: int, diversity: float
+) -> List[Tuple[float, str]]:
+    """
+    Maximal marginal relevance : choisit itérativement le candidat maximisant
+    ``(1 - diversity) * pertinence - diversity * similarité max aux résultats retenus``.
+    """
+    if len(ranked) <= 1:
+        return ranked[:top_k]
+    doc_ids = [doc_id for _, doc_id in ranked]
+    best = ranked[0][0] or 1.0
+    relevance = [score / best for score, _ in ranked]
+    sims = _similarity_matrix(index, doc_ids)
+    max_sim = [0.0] * len(ranked)
+    remaining = list(range(len(ranked)))
+    selected: List[int] = []
+    while remaining and len(selected) < max(1, top_k):
+        pick = max(remaining, key=lambda i: (1.0 - diversity) * relevance[i] - diversity * max_sim[i])
+        selected.append(pick)
+        remaining.remove(pick)
+        row = sims[pick]
+        for i in remaining:
+            if row[i] > max_sim[i]:
+                max_sim[i] = row[i]
+    return [ranked[i] for i in selected]
+
+
+def _fuse_dense(
+    index: _IndexState,
+    query: str,
+    lexical_scores: Dict[str, float],
+    top_k: int,
+    doc_filter: Optional["_DocFilter"] = None,
+) -> Tuple[List[Tuple[float, str]], Dict[str, Dict[str, float]]]:
+    """Fusion RRF du classement lexical et du classement dense (profondeur ``5 * top_k``)."""
+    depth = max(10, 5 * max(1, top_k))
+    lexical = heapq.nlargest(depth, ((score, doc_id) for doc_id, score in lexical_scores.items()))
+    try:
+        dense = dense_index.search(query, depth)
+    except Exception as exc:
+        print(f"[index] Recherche dense indisponible: {exc}", flush=True)
+        dense = []
+    fused: Dict[str, float] = defaultdict(float)
+    components: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for rank, (score, doc_id) in enumerate(lexical):
+        fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+        components[doc_id]["lexical"] = round(score, 4)
+    for rank, (doc_id, score) in enumerate(dense):
+        if doc_id not in index["docs"] or (doc_filter is not None and doc_id not in doc_filter):
+            continue
+        fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+        components[doc_id]["dense"] = round(score, 4)
+    ranked = heapq.nlargest(max(1, top_k), ((score, doc_id) for doc_id, score in fused.items()))
+    return ranked, components
+
+
 # charger l'index à l'import
 load()
@@ -1,8 +1,9 @@
 ﻿# -*- coding: utf-8 -*-
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import asyncio, threading, time, os, json, sys
+import asyncio, functools, queue, threading, time, os, json, sys
+from concurrent.futures import ThreadPoolExecutor
 import httpx
 from pathlib import Path
 from typing import Optional, TYPE_CHECKING
@@ -12,10 +13,10 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 try:
-    from .core import memory, intent, vector_index, governance, profiles, divine  # type: ignore[import]
+    from .core import memory, intent, vector_index, analysis, governance, profiles, divine, prompt_builder, http_pool, circuit_breaker, latency  # type: ignore[import]
     from .routers import governance_profiles  # type: ignore[import]
 except ImportError:
-    from api.core import memory, intent, vector_index, governance, profiles, divine  # type: ignore[import]
+    from api.core import memory, intent, vector_index, analysis, governance, profiles, divine, prompt_builder, http_pool, circuit_breaker, latency  # type: ignore[import]
     from api.routers import governance_profiles  # type: ignore[import]
 
 def load_env_file(path: Optional[Path] = None) -> None:
@@ -56,6 +57,12 @@ RUN_PINGS: bool = True
 EVENTS: list[dict] = []
 MAX_EVENTS: int = 2000
 DEFAULT_PING_INTERVAL = 1
+# Threads pour le travail bloquant de /chat (mémoire, intention, RAG, génération locale)
+CHAT_WORKERS = max(1, int(os.getenv("ELYON_CHAT_WORKERS", "8")))
+_BLOCKING_POOL = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat")
+_JOURNAL_QUEUE: "queue.Queue[dict]" = queue.Queue()
+_JOURNAL_LOCK = threading.Lock()
+_JOURNAL_STARTED = False
 os.environ.setdefault("ELYON_PING_INTERVAL", str(DEFAULT_PING_INTERVAL))
 _PRODUCER_STARTED = False
 
@@ -277,17 +284,41 @@ def start_producer_once():
     log_event("BOOT", {"app": APP_NAME, "ver": APP_VER})
     _PRODUCER_STARTED = True
 
+def _journal_writer():
+    # écritures du journal hors du chemin des requêtes : lots regroupés par fichier du jour
+    while True:
+        batch = [_JOURNAL_QUEUE.get()]
+        while True:
+            try:
+                batch.append(_JOURNAL_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            fp = JOURNAL_DIR / f"journal_{time.strftime('%Y%m%d')}.jsonl"
+            with fp.open("a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in batch))
+        except Exception:
+            pass
+
+
 def log_event(kind: str, payload: Optional[dict] = None):
+    global _JOURNAL_STARTED
     e = {"ts": time.strftime("%Y-%m-%d %H:%M:%S"), "type": kind, "data": payload or {}}
     EVENTS.append(e)
     if len(EVENTS) > MAX_EVENTS:
         del EVENTS[: MAX_EVENTS // 2]
-    try:
-        fp = JOURNAL_DIR / f"journal_{time.strftime('%Y%m%d')}.jsonl"
-        with fp.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(e, ensure_ascii=False) + "\n")
-    except Exception:
-        pass
+    if not _JOURNAL_STARTED:
+        with _JOURNAL_LOCK:
+            if not _JOURNAL_STARTED:
+                threading.Thread(target=_journal_writer, name="journal", daemon=True).start()
+                _JOURNAL_STARTED = True
+    _JOURNAL_QUEUE.put(e)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Exécute un appel bloquant (disque, CPU) dans le pool borné de /chat, hors de la boucle d'événements."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_BLOCKING_POOL, functools.partial(fn, *args, **kwargs))
 
 def _pick_available_model(api_key: str, base_url: str = "https://api.openai.com/v1") -> str:
     """Tente de déterminer le meilleur modèle GPT disponible selon le compte."""
@@ -297,7 +328,7 @@ def _pick_available_model(api_key: str, base_url: str = "https://api.openai.com/
     try:
         headers = {"Authorization": f"Bearer {api_key}"}
         endpoint = base_url.rstrip("/") + "/models"
-        response = httpx.get(endpoint, headers=headers, timeout=5.0)
+        response = http_pool.client("openai").get(endpoint, headers=headers, timeout=5.0)
         if response.status_code == 200:
             available = {m["id"] for m in response.json().get("data", [])}
             print(f"[api] Modèles disponibles OpenAI: {sorted(available)[:5]}", flush=True)
@@ -312,6 +343,12 @@ def _pick_available_model(api_key: str, base_url: str = "https://api.openai.com/
     print(f"[api] Fallback model: {priority_models[0]}", flush=True)
     return priority_models[0]  # fallback au premier choix
 
+def register_lmstudio_probe() -> None:
+    # sonde de santé du disjoncteur LM Studio sur l'URL courante (load_chat_cfg peut la redéfinir)
+    chat_url = os.getenv("LMSTUDIO_URL", "http://localhost:1234/v1/chat/completions")
+    circuit_breaker.register_probe("lmstudio", circuit_breaker.models_url(chat_url))
+
+
 def load_chat_cfg():
     cfg = {
         "provider": "lmstudio",
@@ -396,7 +433,8 @@ def load_chat_cfg():
             if model_val:
                 os.environ["GPT5_MODEL"] = model_val
     return cfg
-async def try_external_chat(cfg: dict, msgs: list[dict], data: dict) -> Optional[tuple[str, str]]:
+def _external_request(cfg: dict, msgs: list[dict], data: dict) -> tuple[str, dict, dict, str, str]:
+    """Endpoint, en-têtes, payload, libellé du provider et nom du pool HTTP pour un appel externe."""
     provider_cfg = (cfg.get("provider") or "lmstudio").lower().strip()
     base_url = (cfg.get("base_url") or "").strip()
     api_key = cfg.get("api_key") or ""
@@ -443,11 +481,20 @@ async def try_external_chat(cfg: dict, msgs: list[dict], data: dict) -> Optional
         if api_key:
             headers["Authorization"] = f"Bearer {api_key}"
         provider_label = cfg.get("provider", provider_cfg)
+    return endpoint, headers, payload, provider_label, "openai" if provider_cfg == "openai" else "external"
 
+
+async def try_external_chat(cfg: dict, msgs: list[dict], data: dict) -> Optional[tuple[str, str]]:
+    endpoint, headers, payload, provider_label, pool_name = _external_request(cfg, msgs, data)
     print(f"[api] Appel externe {provider_label}: endpoint={endpoint}, model={payload.get('model')}, msg_count={len(payload.get('messages', []))}, payload_size={len(str(payload))}", flush=True)
-    async with httpx.AsyncClient(timeout=httpx.Timeout(8.0, connect=3.0, read=6.0)) as client:
-        response = await client.post(endpoint, headers=headers, json=payload)
-    response.raise_for_status()
+    client = http_pool.async_client(pool_name)
+    size, max_tokens = latency.prompt_size(payload["messages"]), payload.get("max_tokens")
+    read = latency.timeout(pool_name, size, 6.0, max_tokens)  # p99 observé pour ce prompt et cette réponse
+    with circuit_breaker.guard(pool_name), latency.measure(pool_name, size, max_tokens):
+        response = await client.post(
+            endpoint, headers=headers, json=payload, timeout=httpx.Timeout(max(8.0, read), connect=3.0, read=read)
+        )
+        response.raise_for_status()
 
     body = response.json()
     choice = (body.get("choices") or [{}])[0]
@@ -458,6 +505,26 @@ async def try_external_chat(cfg: dict, msgs: list[dict], data: dict) -> Optional
     return reply, provider_label
 
 
+async def stream_external_chat(cfg: dict, msgs: list[dict], data: dict):
+    """Variante ``stream: true`` de ``try_external_chat`` : ``(provider, fragment)`` au fil de la génération."""
+    from app.services import llm_client
+
+    endpoint, headers, payload, provider_label, pool_name = _external_request(cfg, msgs, data)
+    payload["stream"] = True
+    print(f"[api] Flux externe {provider_label}: endpoint={endpoint}, model={payload.get('model')}", flush=True)
+    client = http_pool.async_client(pool_name)
+    # premier fragment : p99 observé pour ce prompt et cette réponse ; fragments suivants : écart fixe
+    size, max_tokens = latency.prompt_size(payload["messages"]), payload.get("max_tokens")
+    first = latency.timeout(pool_name, size, 6.0, max_tokens)
+    with circuit_breaker.guard(pool_name), latency.measure(pool_name, size, max_tokens):
+        async with client.stream(
+            "POST", endpoint, headers=headers, json=payload, timeout=llm_client.stream_timeout(first)
+        ) as response:
+            response.raise_for_status()
+            async for delta in llm_client.aiter_deltas(response, first_timeout=first):
+                yield provider_label, delta
+
+
 @app.get("/", response_class=HTMLResponse)
 def home():
     if WEB_UI_FILE.exists():
@@ -481,7 +548,7 @@ def health():
 
 @app.get("/self")
 def self_state():
-    return {"self": SELF}
+    return {"self": SELF, "backends": circuit_breaker.snapshot(), "latency": latency.snapshot()}
 
 @app.get("/events")
 def events():
@@ -518,186 +585,341 @@ async def set_control(req: Request):
             pass
     return get_control()
 
-# --- endpoint CHAT ---
-@app.post("/chat")
-async def chat(req: Request):
+# --- index vectoriel (RAG) ---
+@app.get("/index/stats")
+def index_stats():
+    """État de l'index et compteurs du cache de requêtes (hits/misses)."""
+    return {"ok": True, **vector_index.stats()}
+
+@app.get("/index/duplicates")
+def index_duplicates():
+    """Groupes de quasi-doublons détectés à l'ingestion (document canonique -> copies rattachées)."""
+    clusters = vector_index.duplicate_clusters()
+    return {"ok": True, "clusters": clusters, "count": len(clusters), **vector_index.stats()["near_duplicates"]}
+
+@app.get("/index/suggest")
+def index_suggest(q: str = "", limit: int = 10):
+    """Autocomplétion (titres et vocabulaire de l'index) : { "suggestions": [ {text, kind, weight} ] }."""
+    return {"ok": True, "q": q, "suggestions": vector_index.suggest(q, limit=max(1, min(limit, 20)))}
+
+@app.post("/index/bulk")
+async def index_bulk(req: Request):
     """
-    Input: { "messages": [ { "role":"user|system|assistant", "content":"..." }, ... ] }
-    Output: { "reply": "..." , "provider":"openai|lmstudio|gen_*" , "trace": {...} }
+    Input: { "documents": [ { "text":"...", "doc_id":"...", "metadata":{...}, "chunk": bool }, ... ] }
+    Output: { "ok": true, "indexed": n, "linked": n, "skipped": n, "doc_ids": [...], "doc_count": n }
+    Les compteurs portent sur les documents reçus (un document découpé compte une fois) :
+    ``linked`` / ``skipped`` = quasi-doublons rattachés / ignorés ; ``doc_ids`` = passages indexés.
     """
+    body = await req.json()
+    documents = body.get("documents") if isinstance(body, dict) else None
+    if not isinstance(documents, list) or not documents:
+        return JSONResponse({"ok": False, "error": "Champ 'documents' (liste non vide) requis."}, status_code=400)
+    report = await run_blocking(vector_index.ingest_many, documents)
+    indexed = report.documents(report.doc_ids)
+    linked = [doc_id for doc_id in report.documents(report.linked) if doc_id not in indexed]
+    skipped = [doc_id for doc_id in report.documents(report.skipped) if doc_id not in indexed]
+    log_event("INDEX", {"op": "bulk", "indexed": len(indexed), "linked": len(linked), "received": len(documents)})
+    return {
+        "ok": True,
+        "indexed": len(indexed),
+        "linked": len(linked),
+        "skipped": len(skipped),
+        "doc_ids": report.doc_ids,
+        "doc_count": vector_index.stats()["doc_count"],
+    }
+
+@app.post("/index/sync")
+async def index_sync():
+    """Synchronisation incrémentale de data/corpus (fichiers nouveaux, modifiés, supprimés)."""
+    summary = await run_blocking(vector_index.sync_corpus)
+    log_event(
+        "INDEX",
+        {
+            "op": "sync",
+            "added": len(summary["added"]),
+            "updated": len(summary["updated"]),
+            "removed": len(summary["removed"]),
+            "unchanged": summary["unchanged"],
+        },
+    )
+    return {"ok": True, **summary, "doc_count": vector_index.stats()["doc_count"]}
+
+# --- portée RAG par rôle / établissement ---
+# Les documents réservés portent ces champs de métadonnées ; sans eux, ils restent visibles de tous.
+RAG_ROLE_FIELD = "roles"
+RAG_ESTABLISHMENT_FIELD = "etablissement"
+_RAG_UNSCOPED_ROLES = {profiles.UserRole.DIVINE, profiles.UserRole.ADMIN}
+
+def rag_scope_filters(data: dict) -> dict:
+    """
+    Filtres de métadonnées pour la recherche RAG : ``rag_filters`` du payload, puis
+    restriction au rôle du profil ``user_id`` (lecture publique par défaut) et à
+    l'établissement (``etablissement`` du payload ou du profil).
+    """
+    raw = data.get("rag_filters")
+    filters = dict(raw) if isinstance(raw, dict) else {}
+    profile = None
+    manager = globals().get("profile_mgr")
+    user_id = data.get("user_id")
+    if user_id and manager is not None:
+        profile = manager.get_profile(str(user_id))
+    role = profile.role if profile else profiles.UserRole.PUBLIC_READ
+    if role in _RAG_UNSCOPED_ROLES:
+        return filters
+    filters[RAG_ROLE_FIELD] = [role.value, None]
+    establishment = data.get("etablissement") or (profile.learning_profile.get("etablissement") if profile else None)
+    if establishment:
+        filters[RAG_ESTABLISHMENT_FIELD] = [str(establishment), None]
+    return filters
+
+# --- endpoint CHAT ---
+def _optional_number(data: dict, key: str, kind: type, low: float, high: Optional[float] = None):
+    """``data[key]`` converti par ``kind`` et borné ; ``None`` si absent ou vide."""
+    raw = data.get(key)
+    if raw is None or raw == "":
+        return None
     try:
-        data = await req.json()
-        msgs = data.get("messages") or []
-        cfg = load_chat_cfg()
-        print("[api] /chat reçu", len(msgs), "messages", flush=True)
-
-        print("[api] [DEBUG 1] Chargement mémoire...", flush=True)
-        memory_summary = memory.get_summary_text()
-        summary_applied = bool(memory_summary)
-        print(f"[api] [DEBUG 1] OK", flush=True)
-
-        enriched_msgs = list(msgs)
-        if summary_applied:
-            enriched_msgs = (
-                [
-                    {
-                        "role": "system",
-                        "content": "Contexte récent (résumé) :\n" + memory_summary,
-                    }
-                ]
-                + enriched_msgs
+        value = kind(raw) if not isinstance(raw, bool) else None
+    except (TypeError, ValueError):
+        value = None
+    if value is None:
+        raise ValueError(f"Champ '{key}' : nombre attendu.")
+    if not low <= value <= (high if high is not None else value):
+        bounds = f"entre {low} et {high}" if high is not None else f"supérieur ou égal à {low}"
+        raise ValueError(f"Champ '{key}' : {bounds} attendu.")
+    return value
+
+
+def _chat_options(data: dict) -> dict:
+    """Paramètres numériques de /chat et /chat/stream validés (``ValueError`` -> réponse 400)."""
+    return {
+        "prompt_budget": _optional_number(data, "prompt_budget", int, 0) or None,
+        "rag_diversity": _optional_number(data, "rag_diversity", float, 0.0, 1.0) or None,
+        "rag_top_k": _optional_number(data, "rag_top_k", int, 0, 50) or 3,
+    }
+
+
+async def _chat_context(data: dict, options: dict) -> dict:
+    """
+    Préparation commune à /chat et /chat/stream : configuration, mémoire, intention,
+    RAG et prompt sous budget. Retourne les éléments utiles à la génération et à la trace.
+    ``options`` : paramètres déjà validés par ``_chat_options``.
+    """
+    msgs = data.get("messages") or []
+    # le travail bloquant (fichiers, index, CPU) passe par run_blocking : la boucle reste libre
+    cfg = await run_blocking(load_chat_cfg)
+    register_lmstudio_probe()
+    session_id = data.get("session_id") or data.get("user_id") or None
+    print("[api] /chat reçu", len(msgs), "messages", flush=True)
+
+    print("[api] [DEBUG 1] Chargement mémoire...", flush=True)
+    memory_summary = await run_blocking(memory.get_summary_text, session_id=session_id)
+    summary_applied = bool(memory_summary)
+    print(f"[api] [DEBUG 1] OK", flush=True)
+
+    provider_tag = (cfg.get("provider") or "lmstudio").lower().strip()
+    policy = str(cfg.get("policy", "local_first")).lower().strip() or "local_first"
+    external_on_fallback = bool(cfg.get("external_on_fallback", True))
+
+    mode = data.get("mode", "normal")
+    last_user = next((m["content"] for m in reversed(msgs) if m.get("role") == "user"), "")
+
+    print("[api] [DEBUG 2] Analyse intentions...", flush=True)
+    intent_meta_raw = await run_blocking(intent.analyze, last_user)
+    intent_meta = intent_meta_raw if isinstance(intent_meta_raw, dict) else {}
+    intent_value = intent_meta.get("intent") if isinstance(intent_meta.get("intent"), str) else intent_meta.get("intent")
+    intent_applied = bool(intent_value and intent_value != "empty")
+    keywords_raw = intent_meta.get("keywords") if intent_applied else []
+    keywords_list = [str(k) for k in keywords_raw[:4]] if isinstance(keywords_raw, list) else []
+    entities_raw = intent_meta.get("entities") if intent_applied else {}
+    entities_map = entities_raw if isinstance(entities_raw, dict) else {}
+    print(f"[api] [DEBUG 2] OK - intent={intent_value}", flush=True)
+
+    # échanges anciens de la session (au-delà du résumé récent) pertinents pour ce message
+    memory_recall = await run_blocking(memory.get_recall_text, last_user, session_id=session_id) if last_user else ""
+
+    print("[api] [DEBUG 3] Recherche RAG...", flush=True)
+    rag_query_parts: list[str] = []
+    if last_user:
+        rag_query_parts.append(last_user)
+    if keywords_list:
+        rag_query_parts.extend(keywords_list)
+    rag_query = " ".join(part for part in rag_query_parts if part)
+    # analyse unique du message (déjà en cache après intent.analyze), complétée par les mots-clés
+    rag_terms = analysis.tokenize(last_user)
+    rag_terms.extend(term for term in (analysis.term(k) for k in keywords_list) if term)
+    # termes inconnus de l'index (fautes de frappe) remplacés par le terme le plus proche
+    rag_terms, rag_corrections = await run_blocking(vector_index.correct_terms, rag_terms)
+    rag_filters = rag_scope_filters(data)
+    rag_hits: list[dict] = []
+    if rag_query:
+        try:
+            rag_hits = await run_blocking(
+                vector_index.search,
+                rag_query,
+                top_k=options["rag_top_k"],
+                scorer=data.get("rag_scorer") or None,
+                filters=rag_filters or None,
+                terms=rag_terms,
+                diversity=options["rag_diversity"],
             )
+        except Exception as exc:
+            print(f"[api] [DEBUG 3] RAG erreur: {exc}", flush=True)
+            log_event("CHAT_TRACE", {"stage": "rag_error", "query": rag_query, "error": str(exc)})
+            rag_hits = []
+    print(f"[api] [DEBUG 3] OK - rag_hits={len(rag_hits)}", flush=True)
 
-        provider_tag = (cfg.get("provider") or "lmstudio").lower().strip()
-        policy = str(cfg.get("policy", "local_first")).lower().strip() or "local_first"
-        external_on_fallback = bool(cfg.get("external_on_fallback", True))
-
-        mode = data.get("mode", "normal")
-        last_user = next((m["content"] for m in reversed(msgs) if m.get("role") == "user"), "")
-
-        print("[api] [DEBUG 2] Analyse intentions...", flush=True)
-        intent_meta_raw = intent.analyze(last_user)
-        intent_meta = intent_meta_raw if isinstance(intent_meta_raw, dict) else {}
-        intent_value = intent_meta.get("intent") if isinstance(intent_meta.get("intent"), str) else intent_meta.get("intent")
-        intent_applied = bool(intent_value and intent_value != "empty")
-        keywords_raw = intent_meta.get("keywords") if intent_applied else []
-        keywords_list = [str(k) for k in keywords_raw[:4]] if isinstance(keywords_raw, list) else []
-        entities_raw = intent_meta.get("entities") if intent_applied else {}
-        entities_map = entities_raw if isinstance(entities_raw, dict) else {}
-        print(f"[api] [DEBUG 2] OK - intent={intent_value}", flush=True)
-
-        print("[api] [DEBUG 3] Recherche RAG...", flush=True)
-        rag_query_parts: list[str] = []
-        if last_user:
-            rag_query_parts.append(last_user)
-        if keywords_list:
-            rag_query_parts.extend(keywords_list)
-        rag_query = " ".join(part for part in rag_query_parts if part)
-        rag_hits: list[dict] = []
-        if rag_query:
+    rag_applied = bool(rag_hits)
+    rag_lines: list[str] = []
+    if rag_applied:
+        for idx, hit in enumerate(rag_hits, start=1):
+            doc_id = str(hit.get("doc_id", f"doc_{idx}"))
+            score_raw = hit.get("score", 0.0)
             try:
-                rag_hits = vector_index.search(rag_query, top_k=int(data.get("rag_top_k", 3) or 3))
-            except Exception as exc:
-                print(f"[api] [DEBUG 3] RAG erreur: {exc}", flush=True)
-                log_event("CHAT_TRACE", {"stage": "rag_error", "query": rag_query, "error": str(exc)})
-                rag_hits = []
-        print(f"[api] [DEBUG 3] OK - rag_hits={len(rag_hits)}", flush=True)
-
-        rag_applied = bool(rag_hits)
-        rag_lines: list[str] = []
-        if rag_applied:
-            for idx, hit in enumerate(rag_hits, start=1):
-                doc_id = str(hit.get("doc_id", f"doc_{idx}"))
-                score_raw = hit.get("score", 0.0)
-                try:
-                    score = float(score_raw)
-                except Exception:
-                    score = 0.0
-                text_raw = str(hit.get("text", "")).strip().replace("\r", " ")
-                snippet = " ".join(text_raw.split())
-                if len(snippet) > 220:
-                    snippet = snippet[:217] + "..."
-                rag_lines.append(f"{idx}. [{doc_id}] score={score:.3f} -> {snippet}")
-            log_event(
-                "CHAT_TRACE",
-                {
-                    "stage": "rag",
-                    "query": rag_query,
-                    "count": len(rag_hits),
-                    "results": [str(hit.get("doc_id", "")) for hit in rag_hits],
-                },
-            )
-        if intent_applied:
-            intent_str_parts = [
-                f"Intention: {intent_meta.get('intent')}",
-                f"Urgence: {'oui' if intent_meta.get('urgent') else 'non'}",
-            ]
-            if keywords_list:
-                intent_str_parts.append("Mots-clés: " + ", ".join(keywords_list))
-            if entities_map:
-                ent_chunks = []
-                for key, vals in entities_map.items():
-                    if isinstance(vals, list) and vals:
-                        safe_vals = [str(v) for v in vals[:3]]
-                        ent_chunks.append(f"{key}={','.join(safe_vals)}")
-                if ent_chunks:
-                    intent_str_parts.append("Entités: " + "; ".join(ent_chunks))
-            enriched_msgs = (
-                [
-                    {
-                        "role": "system",
-                        "content": "Analyse de l'intention utilisateur : " + " | ".join(intent_str_parts),
-                    }
-                ]
-                + enriched_msgs
-            )
-        if rag_applied and rag_lines:
-            enriched_msgs = (
-                [
-                    {
-                        "role": "system",
-                        "content": "Connaissances pertinentes (TF-IDF) :\n" + "\n".join(rag_lines),
-                    }
-                ]
-                + enriched_msgs
-            )
-        # message d'amorçage local pour garantir une réponse
-        enriched_msgs = (
-            [
-                {
-                    "role": "system",
-                    "content": (
-                        "Tu es ÉlyonEU, IA locale gouvernance 6S/6R. Réponds sans nuancer inutilement,"
-                        " propose une synthèse opérationnelle et termine par une prochaine étape concrète."
-                    ),
-                }
-            ]
-            + enriched_msgs
+                score = float(score_raw)
+            except Exception:
+                score = 0.0
+            text_raw = str(hit.get("text", "")).strip().replace("\r", " ")
+            snippet = " ".join(text_raw.split())
+            if len(snippet) > 220:
+                snippet = snippet[:217] + "..."
+            rag_lines.append(f"{idx}. [{doc_id}] score={score:.3f} -> {snippet}")
+        log_event(
+            "CHAT_TRACE",
+            {
+                "stage": "rag",
+                "query": rag_query,
+                "count": len(rag_hits),
+                "results": [str(hit.get("doc_id", "")) for hit in rag_hits],
+            },
         )
+    if intent_applied:
+        intent_str_parts = [
+            f"Intention: {intent_meta.get('intent')}",
+            f"Urgence: {'oui' if intent_meta.get('urgent') else 'non'}",
+        ]
+        if keywords_list:
+            intent_str_parts.append("Mots-clés: " + ", ".join(keywords_list))
+        if entities_map:
+            ent_chunks = []
+            for key, vals in entities_map.items():
+                if isinstance(vals, list) and vals:
+                    safe_vals = [str(v) for v in vals[:3]]
+                    ent_chunks.append(f"{key}={','.join(safe_vals)}")
+            if ent_chunks:
+                intent_str_parts.append("Entités: " + "; ".join(ent_chunks))
+        intent_section = "Analyse de l'intention utilisateur : " + " | ".join(intent_str_parts)
 
-        # Construire un prompt contextuel enrichi avec l'historique complet
-        conversation_history = "\n".join([
-            f"[{msg.get('role', '?').upper()}]: {msg.get('content', '')}"
-            for msg in enriched_msgs
-        ])
+    # Prompt sous budget de jetons : sections par priorité, doublons retirés (voir prompt_builder)
+    builder = prompt_builder.PromptBuilder(options["prompt_budget"])
+    # message d'amorçage local pour garantir une réponse
+    builder.add(
+        "system",
+        "Tu es ÉlyonEU, IA locale gouvernance 6S/6R. Réponds sans nuancer inutilement,"
+        " propose une synthèse opérationnelle et termine par une prochaine étape concrète.",
+        priority=0,
+    )
+    if rag_applied and rag_lines:
+        builder.add(
+            "rag", "Connaissances pertinentes (TF-IDF) :\n" + "\n".join(rag_lines), priority=2, truncate="head"
+        )
+    if intent_applied:
+        builder.add("intent", intent_section, priority=3)
+    if memory_recall:
+        builder.add(
+            "memory_recall", "Échanges passés pertinents :\n" + memory_recall, priority=5, truncate="head"
+        )
+    if summary_applied:
+        builder.add(
+            "memory_summary", "Contexte récent (résumé) :\n" + memory_summary, priority=4, truncate="tail"
+        )
+    last_user_idx = max((i for i, m in enumerate(msgs) if m.get("role") == "user"), default=-1)
+    for i, msg in enumerate(msgs):
+        # le dernier message utilisateur d'abord, puis l'historique du plus récent au plus ancien
+        priority = 1 if i == last_user_idx else 10 + len(msgs) - i
+        builder.add(
+            f"message_{i}", str(msg.get("content") or ""), priority, role=str(msg.get("role") or "user"), truncate="tail"
+        )
+    enriched_msgs, prompt_report = builder.build()
+
+    # Prompt contextuel : les mêmes sections, le dernier message utilisateur (tel que retenu
+    # par le budget, donc éventuellement tronqué) repris en fin de prompt
+    last_user_kept = builder.kept(f"message_{last_user_idx}") if last_user_idx >= 0 else None
+    history_msgs = enriched_msgs
+    if history_msgs and history_msgs[-1].get("role") == "user" and history_msgs[-1].get("content") == last_user_kept:
+        history_msgs = history_msgs[:-1]
+    conversation_history = "\n".join(
+        f"[{msg.get('role', '?').upper()}]: {msg.get('content', '')}" for msg in history_msgs
+    )
 
-        contextual_prompt = f"Historique de conversation:\n{conversation_history}\n\nDernier message utilisateur:\n{last_user or 'Bonjour'}"
+    contextual_prompt = f"Historique de conversation:\n{conversation_history}\n\nDernier message utilisateur:\n{last_user_kept or 'Bonjour'}"
+    return {
+        "cfg": cfg,
+        "msgs": msgs,
+        "session_id": session_id,
+        "mode": mode,
+        "last_user": last_user,
+        "provider_tag": provider_tag,
+        "policy": policy,
+        "external_on_fallback": external_on_fallback,
+        "summary_applied": summary_applied,
+        "memory_recall": memory_recall,
+        "intent_meta": intent_meta,
+        "intent_applied": intent_applied,
+        "rag_filters": rag_filters,
+        "rag_corrections": rag_corrections,
+        "enriched_msgs": enriched_msgs,
+        "prompt_report": prompt_report,
+        "contextual_prompt": contextual_prompt,
+    }
 
-        if summary_applied:
-            contextual_prompt = (
-                "Contexte récent :\n" + memory_summary + "\n\n" + contextual_prompt
-            )
-        if intent_applied:
-            contextual_prompt += (
-                "\n\nAnalyse intention :"
-                f"\n- intention={intent_meta.get('intent')}"
-                f"\n- urgent={'oui' if intent_meta.get('urgent') else 'non'}"
-            )
-            if keywords_list:
-                contextual_prompt += "\n- mots_clés=" + ",".join(keywords_list)
-        if rag_applied and rag_lines:
-            contextual_prompt += "\n\nConnaissances pertinentes :\n" + "\n".join(rag_lines)
 
-        def run_local_generation() -> tuple[str, str]:
-            # D'abord essayer llm_client (LM Studio)
+@app.post("/chat")
+async def chat(req: Request):
+    """
+    Input: { "messages": [ { "role":"user|system|assistant", "content":"..." }, ... ],
+             "session_id": "..." (optionnel, sinon user_id, sinon mémoire partagée) }
+    Output: { "reply": "..." , "provider":"openai|lmstudio|gen_*" , "trace": {...} }
+    """
+    try:
+        data = await req.json()
+    except ValueError:
+        return JSONResponse({"error": "Corps JSON invalide.", "reply": ""}, status_code=400)
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "Objet JSON attendu.", "reply": ""}, status_code=400)
+    try:
+        options = _chat_options(data)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc), "reply": ""}, status_code=400)
+    try:
+        ctx = await _chat_context(data, options)
+        cfg, session_id, mode, last_user = ctx["cfg"], ctx["session_id"], ctx["mode"], ctx["last_user"]
+        provider_tag, policy, external_on_fallback = ctx["provider_tag"], ctx["policy"], ctx["external_on_fallback"]
+        summary_applied, memory_recall = ctx["summary_applied"], ctx["memory_recall"]
+        intent_meta, intent_applied = ctx["intent_meta"], ctx["intent_applied"]
+        rag_filters, rag_corrections = ctx["rag_filters"], ctx["rag_corrections"]
+        enriched_msgs, prompt_report, contextual_prompt = ctx["enriched_msgs"], ctx["prompt_report"], ctx["contextual_prompt"]
+
+        async def run_local_generation() -> tuple[str, str]:
+            # D'abord essayer llm_client (LM Studio), en asynchrone
             try:
                 from app.services import llm_client
-                context_for_llm = [msg.get("content", "") for msg in enriched_msgs if msg.get("role") == "user"]
-                text, source = llm_client.generate(contextual_prompt, context_for_llm, prefer_cloud=False)
+                # l'historique retenu est déjà dans contextual_prompt : pas de contexte séparé
+                text, source = await llm_client.agenerate(contextual_prompt, [], prefer_cloud=False)
                 if text and len(text.strip()) > 0:
                     return text.strip(), f"llm_{source}"
             except Exception as exc:
                 print(f"[api] LLM Studio indisponible: {exc}", flush=True)
             
             # Fallback sur local_generate (templates)
-            return local_generate(contextual_prompt, mode=mode, context=enriched_msgs)
+            return await run_blocking(local_generate, contextual_prompt, mode=mode, context=enriched_msgs)
 
         print("[api] [DEBUG 4] Génération...", flush=True)
         try:
-            reply, provider = run_local_generation()
+            reply, provider = await run_local_generation()
         except Exception as exc:
             print(f"[api] Fallback vers local_generate: {exc}", flush=True)
-            reply, provider = local_generate(contextual_prompt, mode=mode, context=enriched_msgs)
+            reply, provider = await run_blocking(local_generate, contextual_prompt, mode=mode, context=enriched_msgs)
         print(f"[api] [DEBUG 4] OK - provider={provider}, len={len(reply)}", flush=True)
 
         local_provider = provider
@@ -800,13 +1022,24 @@ async def chat(req: Request):
             "external_success": external_success,
             "external_provider": external_provider_name or (provider_tag if external_attempted else None),
             "memory_used": summary_applied,
+            "memory_recalled": bool(memory_recall),
             "intent": intent_meta,
+            "rag_filters": rag_filters,
+            "rag_corrections": rag_corrections,
+            "prompt": prompt_report,
+            "breakers": {name: info["state"] for name, info in circuit_breaker.snapshot().items()},
         }
         if external_error:
             trace["external_error"] = external_error[0:120]
 
         print("[api] [DEBUG 6] Sauvegarde mémoire...", flush=True)
-        memory.remember_interaction(last_user or "", reply, meta=intent_meta if intent_applied else None)
+        await run_blocking(
+            memory.remember_interaction,
+            last_user or "",
+            reply,
+            meta=intent_meta if intent_applied else None,
+            session_id=session_id,
+        )
         print("[api] [DEBUG 6] OK", flush=True)
 
         print("[api] [DEBUG] ✓ /chat complète", flush=True)
@@ -817,263 +1050,140 @@ async def chat(req: Request):
         import traceback
         traceback.print_exc()
         return JSONResponse({"error": str(e), "reply": "Erreur serveur interne"}, status_code=500)
-    if summary_applied:
-        enriched_msgs = (
-            [
-                {
-                    "role": "system",
-                    "content": "Contexte récent (résumé) :\n" + memory_summary,
-                }
-            ]
-            + enriched_msgs
-        )
 
-    provider_tag = (cfg.get("provider") or "lmstudio").lower().strip()
-    policy = str(cfg.get("policy", "local_first")).lower().strip() or "local_first"
-    external_on_fallback = bool(cfg.get("external_on_fallback", True))
 
-    mode = data.get("mode", "normal")
-    last_user = next((m["content"] for m in reversed(msgs) if m.get("role") == "user"), "")
+def _sse(payload: dict, event: Optional[str] = None) -> str:
+    frame = f"event: {event}\n" if event else ""
+    return frame + "data: " + json.dumps(payload, ensure_ascii=False) + "\n\n"
 
-    intent_meta_raw = intent.analyze(last_user)
-    intent_meta = intent_meta_raw if isinstance(intent_meta_raw, dict) else {}
-    intent_value = intent_meta.get("intent") if isinstance(intent_meta.get("intent"), str) else intent_meta.get("intent")
-    intent_applied = bool(intent_value and intent_value != "empty")
-    keywords_raw = intent_meta.get("keywords") if intent_applied else []
-    keywords_list = [str(k) for k in keywords_raw[:4]] if isinstance(keywords_raw, list) else []
-    entities_raw = intent_meta.get("entities") if intent_applied else {}
-    entities_map = entities_raw if isinstance(entities_raw, dict) else {}
-    rag_query_parts: list[str] = []
-    if last_user:
-        rag_query_parts.append(last_user)
-    if keywords_list:
-        rag_query_parts.extend(keywords_list)
-    rag_query = " ".join(part for part in rag_query_parts if part)
-    rag_hits: list[dict] = []
-    if rag_query:
+
+async def _stream_reply(ctx: dict, data: dict):
+    """
+    ``(provider, fragment)`` au fil de la génération, mêmes backends et même politique que
+    /chat (LM Studio, provider externe, modèles locaux). On ne bascule sur le backend
+    suivant que si le précédent échoue avant son premier fragment.
+    """
+    from app.services import llm_client
+
+    cfg, policy, provider_tag = ctx["cfg"], ctx["policy"], ctx["provider_tag"]
+    external_requested = any(bool(data.get(k)) for k in ("use_external", "external", "force_external", "prefer_external"))
+    allow_external = provider_tag not in {"disabled", "none", "local"} and policy not in {"disabled", "never"}
+
+    async def local_llm():
+        async for delta in llm_client.astream_local(ctx["contextual_prompt"], []):
+            yield "llm_local", delta
+
+    def external():
+        return stream_external_chat(cfg, ctx["enriched_msgs"], data)
+
+    if allow_external and (policy in {"external_first", "always"} or external_requested):
+        backends = [external, local_llm]
+    elif allow_external and ctx["external_on_fallback"]:
+        backends = [local_llm, external]
+    else:
+        backends = [local_llm]
+    for backend in backends:
+        emitted = False
         try:
-            rag_hits = vector_index.search(rag_query, top_k=int(data.get("rag_top_k", 3) or 3))
+            async for provider, delta in backend():
+                emitted = True
+                yield provider, delta
+            if emitted:
+                return
         except Exception as exc:
-            log_event("CHAT_TRACE", {"stage": "rag_error", "query": rag_query, "error": str(exc)})
-            rag_hits = []
-    rag_applied = bool(rag_hits)
-    rag_lines: list[str] = []
-    if rag_applied:
-        for idx, hit in enumerate(rag_hits, start=1):
-            doc_id = str(hit.get("doc_id", f"doc_{idx}"))
-            score_raw = hit.get("score", 0.0)
-            try:
-                score = float(score_raw)
-            except Exception:
-                score = 0.0
-            text_raw = str(hit.get("text", "")).strip().replace("\r", " ")
-            snippet = " ".join(text_raw.split())
-            if len(snippet) > 220:
-                snippet = snippet[:217] + "..."
-            rag_lines.append(f"{idx}. [{doc_id}] score={score:.3f} -> {snippet}")
-        log_event(
-            "CHAT_TRACE",
-            {
-                "stage": "rag",
-                "query": rag_query,
-                "count": len(rag_hits),
-                "results": [str(hit.get("doc_id", "")) for hit in rag_hits],
-            },
-        )
-    if intent_applied:
-        intent_str_parts = [
-            f"Intention: {intent_meta.get('intent')}",
-            f"Urgence: {'oui' if intent_meta.get('urgent') else 'non'}",
-        ]
-        if keywords_list:
-            intent_str_parts.append("Mots-clés: " + ", ".join(keywords_list))
-        if entities_map:
-            ent_chunks = []
-            for key, vals in entities_map.items():
-                if isinstance(vals, list) and vals:
-                    safe_vals = [str(v) for v in vals[:3]]
-                    ent_chunks.append(f"{key}={','.join(safe_vals)}")
-            if ent_chunks:
-                intent_str_parts.append("Entités: " + "; ".join(ent_chunks))
-        enriched_msgs = (
-            [
-                {
-                    "role": "system",
-                    "content": "Analyse de l’intention utilisateur : " + " | ".join(intent_str_parts),
-                }
-            ]
-            + enriched_msgs
-        )
-    if rag_applied and rag_lines:
-        enriched_msgs = (
-            [
-                {
-                    "role": "system",
-                    "content": "Connaissances pertinentes (TF-IDF) :\n" + "\n".join(rag_lines),
-                }
-            ]
-            + enriched_msgs
-        )
-    # message d'amorçage local pour garantir une réponse
-    enriched_msgs = (
-        [
-            {
-                "role": "system",
-                "content": (
-                    "Tu es ÉlyonEU, IA locale gouvernance 6S/6R. Réponds sans nuancer inutilement,"
-                    " propose une synthèse opérationnelle et termine par une prochaine étape concrète."
-                ),
-            }
-        ]
-        + enriched_msgs
-    )
+            if emitted:
+                raise
+            print(f"[api] /chat/stream backend indisponible: {exc}", flush=True)
+            log_event("CHAT_TRACE", {"stage": "stream_fallback", "error": str(exc)[0:240]})
+    reply, provider = await run_blocking(local_generate, ctx["contextual_prompt"], mode=ctx["mode"], context=ctx["enriched_msgs"])
+    yield provider, reply
 
-    contextual_prompt = last_user or "Bonjour"
-    if summary_applied:
-        contextual_prompt = (
-            "Contexte récent :\n" + memory_summary + "\n\nDemande utilisateur :\n" + (last_user or "Bonjour")
-        )
-    if intent_applied:
-        contextual_prompt += (
-            "\n\nAnalyse intention :"
-            f"\n- intention={intent_meta.get('intent')}"
-            f"\n- urgent={'oui' if intent_meta.get('urgent') else 'non'}"
-        )
-        if keywords_list:
-            contextual_prompt += "\n- mots_clés=" + ",".join(keywords_list)
-    if rag_applied and rag_lines:
-        contextual_prompt += "\n\nConnaissances pertinentes :\n" + "\n".join(rag_lines)
-
-    def run_local_generation() -> tuple[str, str]:
-        gen = ensure_gen_provider()
-        if gen is not None:
-            try:
-                result = gen.generate(contextual_prompt, mode=mode)
-                text = (result.text or "").strip()
-                used_raw = str(getattr(result, "used", "local") or "local")
-                used_lower = used_raw.lower()
-                text_lower = text.lower()
-                placeholder = text_lower.startswith("[cloud gpt") or "(vide" in text_lower
-                if used_lower == "cloud" and (not text or placeholder):
-                    raise RuntimeError("fallback cloud vide ou non autorisé")
-                if not text:
-                    raise RuntimeError("réponse vide du générateur interne")
-                return text, f"gen_{used_lower or 'local'}"
-            except Exception as exc:
-                print(f"[api] Générateur interne en erreur: {exc}", flush=True)
-        return local_generate(contextual_prompt, mode=mode, context=enriched_msgs)
 
+@app.post("/chat/stream")
+async def chat_stream(req: Request):
+    """
+    Variante SSE de /chat (mêmes entrées) : frames ``data: {"delta": "..."}`` au fil de la
+    génération, puis ``event: done`` avec ``{"reply", "provider", "trace"}`` une fois la
+    mémoire enregistrée (``event: error`` en cas d'échec).
+    """
     try:
-        reply, provider = run_local_generation()
-    except Exception as exc:
-        print(f"[api] Fallback vers local_generate suite à l'erreur: {exc}", flush=True)
-        reply, provider = local_generate(contextual_prompt, mode=mode, context=enriched_msgs)
-    local_provider = provider
-    local_len = len(reply)
-    log_event(
-        "CHAT_TRACE",
-        {
-            "stage": "local",
-            "provider": local_provider,
-            "len": local_len,
-            "policy": policy,
-            "memory_applied": summary_applied,
-            "intent": intent_meta,
-        },
-    )
+        data = await req.json()
+    except ValueError:
+        return JSONResponse({"error": "Corps JSON invalide.", "reply": ""}, status_code=400)
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "Objet JSON attendu.", "reply": ""}, status_code=400)
+    try:
+        options = _chat_options(data)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc), "reply": ""}, status_code=400)
 
-    external_requested = any(bool(data.get(k)) for k in ("use_external", "external", "force_external", "prefer_external"))
-    allow_external = provider_tag not in {"disabled", "none", "local"} and policy not in {"disabled", "never"}
-    fallback_triggered = local_provider == "gen_local"
-
-    should_try_external = False
-    if allow_external:
-        if policy in {"external_first", "always"}:
-            should_try_external = True
-        elif policy in {"fallback"}:
-            should_try_external = fallback_triggered or external_requested
-        else:  # local_first / on_request
-            should_try_external = external_requested or (fallback_triggered and external_on_fallback)
-
-    external_attempted = False
-    external_success = False
-    external_provider_name: Optional[str] = None
-    external_error: Optional[str] = None
-
-    if should_try_external:
-        external_attempted = True
+    async def frames():
+        started = time.perf_counter()
+        try:
+            ctx = await _chat_context(data, options)
+        except Exception as exc:
+            yield _sse({"error": str(exc)}, "error")
+            return
+        parts: list[str] = []
+        provider = "?"
+        first_token_ms: Optional[int] = None
+        stream_error: Optional[str] = None
+        try:
+            async for provider, delta in _stream_reply(ctx, data):
+                if first_token_ms is None:
+                    first_token_ms = int((time.perf_counter() - started) * 1000)
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except Exception as exc:
+            # flux interrompu après les premiers fragments : la réponse partielle est conservée
+            stream_error = str(exc)
+            print(f"[api] /chat/stream interrompu: {exc}", flush=True)
+        reply = "".join(parts).strip()
+        if not reply:
+            yield _sse({"error": stream_error or "réponse vide"}, "error")
+            return
+
+        trace = {
+            "policy": ctx["policy"],
+            "stream": True,
+            "provider": provider,
+            "first_token_ms": first_token_ms,
+            "total_ms": int((time.perf_counter() - started) * 1000),
+            "memory_used": ctx["summary_applied"],
+            "memory_recalled": bool(ctx["memory_recall"]),
+            "intent": ctx["intent_meta"],
+            "rag_filters": ctx["rag_filters"],
+            "rag_corrections": ctx["rag_corrections"],
+            "prompt": ctx["prompt_report"],
+            "breakers": {name: info["state"] for name, info in circuit_breaker.snapshot().items()},
+        }
+        if stream_error:
+            trace["stream_error"] = stream_error[0:120]
         log_event(
-            "CHAT_TRACE",
+            "CHAT",
             {
-                "stage": "external_attempt",
-                "provider": provider_tag,
-                "policy": policy,
-                "requested": external_requested,
-                "fallback_triggered": fallback_triggered,
+                "provider": provider,
+                "len": len(reply),
+                "policy": ctx["policy"],
+                "stream": True,
+                "first_token_ms": first_token_ms,
+                "memory_applied": ctx["summary_applied"],
+                "intent": ctx["intent_meta"],
             },
         )
-        try:
-            external_reply = await try_external_chat(cfg, enriched_msgs, data)
-            if external_reply:
-                reply, external_provider_name = external_reply
-                provider = external_provider_name
-                external_success = True
-                log_event(
-                    "CHAT_TRACE",
-                    {
-                        "stage": "external_success",
-                        "provider": provider,
-                        "len": len(reply),
-                        "memory_applied": summary_applied,
-                        "intent": intent_meta,
-                    },
-                )
-        except Exception as exc:
-            external_error = str(exc)
-            print(f"[api] Provider externe indisponible ({provider_tag}): {exc}", flush=True)
-            log_event(
-                "CHAT_TRACE",
-                {
-                    "stage": "external_error",
-                    "provider": provider_tag,
-                    "error": (external_error or "")[0:240],
-                },
-            )
+        await run_blocking(
+            memory.remember_interaction,
+            ctx["last_user"] or "",
+            reply,
+            meta=ctx["intent_meta"] if ctx["intent_applied"] else None,
+            session_id=ctx["session_id"],
+        )
+        yield _sse({"reply": reply, "provider": provider, "trace": trace}, "done")
 
-    log_event(
-        "CHAT",
-        {
-            "provider": provider,
-            "len": len(reply),
-            "policy": policy,
-            "external_requested": external_requested,
-            "external_attempted": external_attempted,
-            "external_success": external_success,
-            "local_provider": local_provider,
-            "memory_applied": summary_applied,
-            "intent": intent_meta,
-        },
+    return StreamingResponse(
+        frames(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    trace = {
-        "policy": policy,
-        "local_provider": local_provider,
-        "local_len": local_len,
-        "external_requested": external_requested,
-        "external_on_fallback": external_on_fallback,
-        "external_attempted": external_attempted,
-        "external_success": external_success,
-        "external_provider": external_provider_name or (provider_tag if external_attempted else None),
-        "memory_used": summary_applied,
-        "intent": intent_meta,
-    }
-    if external_error:
-        trace["external_error"] = external_error[0:120]
-
-    memory.remember_interaction(last_user or "", reply, meta=intent_meta if intent_applied else None)
-
-    return JSONResponse({"reply": reply, "provider": provider, "trace": trace})
-
 
 # ---------- heartbeat ----------
 def producer():
@@ -1097,6 +1207,19 @@ def producer():
 # Startup manuel au premier appel
 _startup_done = False
 
+
+@app.on_event("startup")
+async def on_startup_http_pool():
+    # ouverture anticipée du pool LM Studio (la première requête /chat ne paie pas la création)
+    http_pool.client("lmstudio")
+    register_lmstudio_probe()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # connexions keep-alive des backends LLM (pool partagé)
+    await http_pool.aclose_all()
+
 def main():
     import uvicorn
 
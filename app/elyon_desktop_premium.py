@@ -44,6 +44,24 @@ def http_post(path, payload, timeout=20.0):
         print(f"[desktop] POST {path} -> ERROR: {type(exc).__name__}", flush=True)
         return None
 
+def http_post_stream(path, payload, timeout=20.0):
+    """POST en flux SSE : génère les couples (événement, données JSON) au fil de la réponse."""
+    print(f"[desktop] POST (flux) {API + path}", flush=True)
+    with requests.post(API + path, json=payload, timeout=timeout, stream=True) as r:
+        r.raise_for_status()
+        event, data = "message", ""
+        for line in r.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if not line:
+                if data:
+                    yield event, json.loads(data)
+                event, data = "message", ""
+            elif line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data += line[5:].strip()
+
 # ================== Design System ==================
 COLORS = {
     "bg": "#0b0f14",
@@ -192,6 +210,7 @@ class ChatWidget(QWidget):
 
         # Historique des messages pour le contexte
         self.messages = []  # List[(role, text), ...]
+        self.streamed = ""  # réponse en cours de réception (/chat/stream)
 
         # Charger l'historique depuis fichier
         self.load_history()
@@ -357,6 +376,42 @@ class ChatWidget(QWidget):
         self.sendRequested.emit(msg)  # Puis émettre
         self.start_loading()
 
+    def begin_stream(self):
+        """Ouvrir une réponse assistant remplie au fil du flux"""
+        from datetime import datetime
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.history.append(f"""
+            <div style='color: {COLORS['acc2']}; font-weight: bold; font-size: 12px; margin-top: 10px;'>
+                🤖 ÉlyonEU <span style='color: {COLORS['muted']}; font-weight: normal;'>{timestamp}</span>
+            </div>
+        """)
+        self.history.append("")
+        self.streamed = ""
+
+    def append_stream(self, delta: str):
+        """Ajouter un fragment de la réponse en cours"""
+        self.streamed += delta
+        cursor = self.history.textCursor()
+        cursor.movePosition(cursor.MoveOperation.End)
+        cursor.insertText(delta)
+        self.history.setTextCursor(cursor)
+        self.history.verticalScrollBar().setValue(self.history.verticalScrollBar().maximum())
+
+    def end_stream(self, text: str, provider: str = "?", trace: dict | None = None):
+        """Clore la réponse en cours : historique de contexte et pied provider"""
+        if text != self.streamed:
+            # le texte final diffère du flux (réponse reprise sans flux) : on l'affiche tel quel
+            self.append_stream(text[len(self.streamed):] if text.startswith(self.streamed) else "\n" + text)
+        self.messages.append({"role": "assistant", "content": text})
+        self.save_history()
+        self.streamed = ""
+        provider_val = (trace or {}).get("provider", provider)
+        ttft = (trace or {}).get("first_token_ms")
+        ttft_text = f" · 1er jeton {ttft} ms" if ttft is not None else ""
+        self.history.append(
+            f"<div style='color: {COLORS['muted']}; font-size: 10px;'>Provider: <b>{provider_val}</b>{ttft_text}</div>"
+        )
+
     def get_context(self):
         """Retourner l'historique complet des messages pour le contexte"""
         return self.messages
@@ -707,10 +762,30 @@ class ElyonDesktopPremium(QMainWindow):
 
         # Lancer appel async
         def send_async():
+            # Envoyer l'historique COMPLET pour le contexte (pas juste la dernière question)
+            context = self.panel_chat.get_context()
+            payload = {"messages": context}
+            started = False
+            try:
+                # Réponse en flux : les fragments s'affichent au fil de la génération
+                for event, data in http_post_stream("/chat/stream", payload, timeout=20.0):
+                    if event == "error":
+                        raise RuntimeError(data.get("error", "erreur"))
+                    if event == "done":
+                        _reply_queue.put(("done", data.get("reply", ""), data.get("provider", "?"), data.get("trace", {})))
+                        return
+                    if data.get("delta"):
+                        if not started:
+                            _reply_queue.put(("start",))
+                            started = True
+                        _reply_queue.put(("delta", data["delta"]))
+                raise RuntimeError("flux interrompu")
+            except Exception as exc:
+                print(f"[desktop] /chat/stream -> {exc}", flush=True)
+                if started:
+                    _reply_queue.put(("done", None, "?", {}))
+                    return
             try:
-                # Envoyer l'historique COMPLET pour le contexte (pas juste la dernière question)
-                context = self.panel_chat.get_context()
-                payload = {"messages": context}
                 resp = http_post("/chat", payload, timeout=20.0)
                 if resp:
                     reply = resp.get("reply", "(pas de réponse)")
@@ -731,6 +806,14 @@ class ElyonDesktopPremium(QMainWindow):
         self.panel_chat.status.setText(f"OK ({provider})")
         self.panel_chat.stop_loading()
 
+    def on_chat_done(self, text: str | None, provider: str, trace: dict):
+        """Fin d'une réponse reçue en flux"""
+        if not self.panel_chat.streamed and text:
+            self.panel_chat.begin_stream()
+        self.panel_chat.end_stream(text if text is not None else self.panel_chat.streamed, provider, trace)
+        self.panel_chat.status.setText(f"OK ({trace.get('provider', provider)})")
+        self.panel_chat.stop_loading()
+
     def on_chat_error(self, error: str):
         """Erreur chat"""
         self.panel_chat.status.setText(f"Erreur: {error}")
@@ -758,6 +841,14 @@ class ElyonDesktopPremium(QMainWindow):
                 if msg_type == "reply":
                     reply, provider, trace = data
                     self.on_chat_reply(reply, provider, trace)
+                elif msg_type == "start":
+                    self.panel_chat.begin_stream()
+                    self.panel_chat.status.setText("Réception...")
+                elif msg_type == "delta":
+                    self.panel_chat.append_stream(data[0])
+                elif msg_type == "done":
+                    reply, provider, trace = data
+                    self.on_chat_done(reply, provider, trace)
                 elif msg_type == "error":
                     error = data[0]
                     self.on_chat_error(error)
@@ -41,6 +41,12 @@ try:
 except Exception:
     httpx = None  # fallback sans httpx → on simulera
 
+try:
+    from api.core import http_pool, latency
+except ImportError:  # pragma: no cover - service lancé sans le paquet api
+    http_pool = None
+    latency = None
+
 # ===============================
 # Config & État
 # ===============================
@@ -291,9 +297,18 @@ class CloudFallback:
         last_exc: Exception | None = None
         for attempt in range(tries):
             try:
-                with httpx.Client(timeout=60.0) as client:
-                    r = client.post(f"{self.cfg.openai_base_url}/chat/completions", headers=headers, json=payload)
-                r.raise_for_status()
+                url = f"{self.cfg.openai_base_url}/chat/completions"
+                if http_pool is not None and latency is not None:
+                    # délai dérivé du p99 observé pour cette taille de prompt (60 s sans mesures)
+                    size = latency.prompt_size(payload["messages"])
+                    timeout = latency.timeout("openai", size, 60.0)
+                    with latency.measure("openai", size):
+                        r = http_pool.client("openai").post(url, headers=headers, json=payload, timeout=timeout)
+                        r.raise_for_status()
+                else:
+                    with httpx.Client(timeout=60.0) as client:
+                        r = client.post(url, headers=headers, json=payload)
+                    r.raise_for_status()
                 data = r.json()
                 txt = data.get("choices", [{}])[0].get("message", {}).get("content", "")
                 return txt or "[Cloud GPT‑5] (vide)"
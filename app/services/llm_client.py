@@ -1,4 +1,7 @@
 from __future__ import annotations
+import asyncio
+import contextlib
+import json
 import os
 try:
     import httpx
@@ -9,7 +12,14 @@ except Exception:
         requests = _requests
     except Exception:
         requests = None
-from typing import List
+from typing import AsyncGenerator, AsyncIterator, List, Optional
+
+try:
+    from api.core import circuit_breaker, http_pool, latency
+except ImportError:  # pragma: no cover - client autonome sans le paquet api
+    circuit_breaker = None
+    http_pool = None
+    latency = None
 
 DEFAULT_ALLOW_CLOUD = os.getenv("ALLOW_CLOUD", "false").lower() in ("1", "true", "yes")
 DEFAULT_OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
@@ -18,6 +28,8 @@ DEFAULT_GPT5_MODEL = os.getenv("GPT5_MODEL", "gpt-5")
 
 DEFAULT_LM_URL = os.getenv("LMSTUDIO_URL", "http://localhost:1234/v1/chat/completions")
 DEFAULT_LM_MODEL = os.getenv("LMSTUDIO_MODEL", "mistral-7b-instruct-v0.1")
+# Attente maximale entre deux fragments d'un flux (le premier suit le délai adaptatif du backend).
+STREAM_GAP_TIMEOUT = 6.0
 
 
 def _allow_cloud() -> bool:
@@ -49,15 +61,32 @@ def _lm_model() -> str:
 SYSTEM_PROMPT = "Tu es Élyôn EU. Style public-secteur, clair, sobre."
 
 def _chat_payload(model: str, prompt: str, context: List[str]):
-    return {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": "Contexte:\n- " + "\n- ".join(context)},
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": 0.3,
-    }
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if context:
+        messages.append({"role": "user", "content": "Contexte:\n- " + "\n- ".join(context)})
+    messages.append({"role": "user", "content": prompt})
+    return {"model": model, "messages": messages, "temperature": 0.3}
+
+def _guard(backend: str):
+    # disjoncteur du backend : échec immédiat (BreakerOpenError) tant qu'il est ouvert
+    return circuit_breaker.guard(backend) if circuit_breaker is not None else contextlib.nullcontext()
+
+def _read_timeout(backend: str, payload: dict, default: float) -> float:
+    # délai de réponse dérivé du p99 observé pour ce prompt et cette réponse (``default`` sans mesures)
+    if latency is None:
+        return default
+    return latency.timeout_for(backend, payload["messages"], default, payload.get("max_tokens"))
+
+def _timeout(backend: str, payload: dict, default: float, connect: float = 3.0):
+    read = _read_timeout(backend, payload, default)
+    if httpx is None:
+        return read
+    return httpx.Timeout(max(8.0, read), connect=connect, read=read)
+
+def _measure(backend: str, payload: dict):
+    if latency is None:
+        return contextlib.nullcontext()
+    return latency.measure(backend, latency.prompt_size(payload["messages"]), payload.get("max_tokens"))
 
 def call_local(prompt: str, context: List[str]) -> str:
     lm_model = _lm_model()
@@ -65,22 +94,131 @@ def call_local(prompt: str, context: List[str]) -> str:
     lm_url = _lm_url()
     timeout_err = RuntimeError("Serveur LM Studio indisponible ou lent (timeout)")
     if httpx is not None:
+        with _guard("lmstudio"):
+            try:
+                timeout = _timeout("lmstudio", payload, 6.0)
+                with _measure("lmstudio", payload):
+                    if http_pool is not None:
+                        r = http_pool.client("lmstudio").post(lm_url, json=payload, timeout=timeout)
+                    else:
+                        with httpx.Client(timeout=timeout) as c:
+                            r = c.post(lm_url, json=payload)
+                    r.raise_for_status()
+                return r.json()["choices"][0]["message"]["content"]
+            except httpx.TimeoutException as exc:
+                raise timeout_err from exc
+    if requests is not None:
+        with _guard("lmstudio"):
+            try:
+                r = requests.post(lm_url, json=payload, timeout=(3.0, _read_timeout("lmstudio", payload, 8.0)))
+                r.raise_for_status()
+                return r.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+            except requests.Timeout as exc:  # type: ignore[attr-defined]
+                raise timeout_err from exc
+    # fallback simulé
+    return "[local-simulé] " + prompt[:120]
+
+async def acall_local(prompt: str, context: List[str]) -> str:
+    """Variante asynchrone de ``call_local`` : n'occupe pas la boucle d'événements pendant la génération."""
+    if httpx is None:
+        return await asyncio.to_thread(call_local, prompt, context)
+    payload = _chat_payload(_lm_model(), prompt, context)
+    lm_url = _lm_url()
+    timeout = _timeout("lmstudio", payload, 6.0)
+    with _guard("lmstudio"):
         try:
-            with httpx.Client(timeout=httpx.Timeout(8.0, connect=3.0, read=6.0)) as c:
-                r = c.post(lm_url, json=payload)
-            r.raise_for_status()
+            with _measure("lmstudio", payload):
+                if http_pool is not None:
+                    r = await http_pool.async_client("lmstudio").post(lm_url, json=payload, timeout=timeout)
+                else:
+                    async with httpx.AsyncClient(timeout=timeout) as c:
+                        r = await c.post(lm_url, json=payload)
+                r.raise_for_status()
             return r.json()["choices"][0]["message"]["content"]
         except httpx.TimeoutException as exc:
-            raise timeout_err from exc
-    if requests is not None:
+            raise RuntimeError("Serveur LM Studio indisponible ou lent (timeout)") from exc
+
+async def _raw_deltas(response) -> AsyncGenerator[str, None]:
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
         try:
-            r = requests.post(lm_url, json=payload, timeout=8)
-            r.raise_for_status()
-            return r.json().get("choices", [{}])[0].get("message", {}).get("content", "")
-        except requests.Timeout as exc:  # type: ignore[attr-defined]
-            raise timeout_err from exc
-    # fallback simulé
-    return "[local-simulé] " + prompt[:120]
+            chunk = json.loads(data)
+        except ValueError:
+            continue
+        choice = (chunk.get("choices") or [{}])[0]
+        delta = (choice.get("delta") or choice.get("message") or {}).get("content")
+        if delta:
+            yield delta
+
+async def aiter_deltas(
+    response, first_timeout: Optional[float] = None, gap_timeout: float = STREAM_GAP_TIMEOUT
+) -> AsyncIterator[str]:
+    """
+    Fragments de texte d'une réponse ``stream: true`` au format OpenAI (lignes SSE ``data: {...}``).
+    Avec ``first_timeout``, le premier fragment a ce délai pour arriver (traitement du prompt),
+    chacun des suivants ``gap_timeout`` ; au-delà, ``httpx.ReadTimeout``.
+    """
+    deltas = _raw_deltas(response)
+    if first_timeout is None:
+        async for delta in deltas:
+            yield delta
+        return
+    wait = first_timeout
+    try:
+        while True:
+            try:
+                delta = await asyncio.wait_for(deltas.__anext__(), wait)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError as exc:
+                if httpx is None:
+                    raise
+                raise httpx.ReadTimeout(f"aucun fragment reçu en {wait:.1f}s") from exc
+            wait = gap_timeout
+            yield delta
+    finally:
+        await deltas.aclose()
+
+def stream_timeout(first: float):
+    """
+    Délais de transport d'un flux : ``first`` pour le premier fragment (au moins l'écart
+    admis entre deux fragments, que ``aiter_deltas`` borne ensuite).
+    """
+    read = max(first, STREAM_GAP_TIMEOUT)
+    if httpx is None:
+        return read
+    return httpx.Timeout(max(8.0, first), connect=3.0, read=read)
+
+async def astream_local(prompt: str, context: List[str]) -> AsyncIterator[str]:
+    """Génération LM Studio en flux (``stream: true``) : fragments de texte au fil de l'eau."""
+    if httpx is None:
+        yield await asyncio.to_thread(call_local, prompt, context)
+        return
+    payload = _chat_payload(_lm_model(), prompt, context)
+    payload["stream"] = True
+    # premier fragment : délai dérivé du p99 observé pour cette taille de prompt
+    first = _read_timeout("lmstudio", payload, 6.0)
+    timeout = stream_timeout(first)
+    owned = None
+    if http_pool is not None:
+        client = http_pool.async_client("lmstudio")
+    else:
+        client = owned = httpx.AsyncClient(timeout=timeout)
+    try:
+        with _guard("lmstudio"), _measure("lmstudio", payload):
+            async with client.stream("POST", _lm_url(), json=payload, timeout=timeout) as r:
+                r.raise_for_status()
+                async for delta in aiter_deltas(r, first_timeout=first):
+                    yield delta
+    except httpx.TimeoutException as exc:
+        raise RuntimeError("Serveur LM Studio indisponible ou lent (timeout)") from exc
+    finally:
+        if owned is not None:
+            await owned.aclose()
 
 def call_gpt5(prompt: str, context: List[str]) -> str:
     if not (_allow_cloud() and _openai_api_key()):
@@ -88,8 +226,14 @@ def call_gpt5(prompt: str, context: List[str]) -> str:
     payload = _chat_payload(_gpt5_model(), prompt, context)
     headers = {"Authorization": f"Bearer {_openai_api_key()}"}
     if httpx is not None:
-        with httpx.Client(timeout=60.0) as c:
-            r = c.post(f"{_openai_base().rstrip('/')}/chat/completions", headers=headers, json=payload)
+        url = f"{_openai_base().rstrip('/')}/chat/completions"
+        timeout = _timeout("openai", payload, 60.0, connect=10.0)
+        with _guard("openai"), _measure("openai", payload):
+            if http_pool is not None:
+                r = http_pool.client("openai").post(url, headers=headers, json=payload, timeout=timeout)
+            else:
+                with httpx.Client(timeout=timeout) as c:
+                    r = c.post(url, headers=headers, json=payload)
             r.raise_for_status()
             return r.json()["choices"][0]["message"]["content"]
     if requests is not None:
@@ -98,6 +242,25 @@ def call_gpt5(prompt: str, context: List[str]) -> str:
         return r.json().get("choices", [{}])[0].get("message", {}).get("content", "")
     raise RuntimeError("Aucun client HTTP disponible pour appeler le cloud.")
 
+async def acall_gpt5(prompt: str, context: List[str]) -> str:
+    """Variante asynchrone de ``call_gpt5``."""
+    if httpx is None:
+        return await asyncio.to_thread(call_gpt5, prompt, context)
+    if not (_allow_cloud() and _openai_api_key()):
+        raise RuntimeError("Cloud non autorisé ou clé absente.")
+    payload = _chat_payload(_gpt5_model(), prompt, context)
+    headers = {"Authorization": f"Bearer {_openai_api_key()}"}
+    url = f"{_openai_base().rstrip('/')}/chat/completions"
+    timeout = _timeout("openai", payload, 60.0, connect=10.0)
+    with _guard("openai"), _measure("openai", payload):
+        if http_pool is not None:
+            r = await http_pool.async_client("openai").post(url, headers=headers, json=payload, timeout=timeout)
+        else:
+            async with httpx.AsyncClient(timeout=timeout) as c:
+                r = await c.post(url, headers=headers, json=payload)
+        r.raise_for_status()
+        return r.json()["choices"][0]["message"]["content"]
+
 def generate(prompt: str, context: List[str], prefer_cloud: bool=False) -> tuple[str,str]:
     """
     Retourne (texte, source) où source = 'local' ou 'cloud'
@@ -109,3 +272,23 @@ def generate(prompt: str, context: List[str], prefer_cloud: bool=False) -> tuple
             pass
     # défaut : local d’abord
     return call_local(prompt, context), "local"
+
+async def agenerate(prompt: str, context: List[str], prefer_cloud: bool=False) -> tuple[str,str]:
+    """
+    Variante asynchrone de ``generate`` (même ordre local / cloud)
+    """
+    if prefer_cloud:
+        try:
+            return await acall_gpt5(prompt, context), "cloud"
+        except Exception:
+            pass
+    if latency is None or not (_allow_cloud() and _openai_api_key()):
+        return await acall_local(prompt, context), "local"
+    # hedging : sans réponse locale au p95 observé, la même requête part vers le cloud
+    size = latency.prompt_size(_chat_payload(_lm_model(), prompt, context)["messages"])
+    text, hedge_won = await latency.hedged(
+        lambda: acall_local(prompt, context),
+        lambda: acall_gpt5(prompt, context),
+        latency.hedge_delay("lmstudio", size),
+    )
+    return text, "cloud" if hedge_won else "local"
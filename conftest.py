@@ -0,0 +1,28 @@
+"""
+Fixtures partagées des tests unitaires : index documentaire isolé dans un dossier
+temporaire, sans serveur ni index dense.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import corpus_ingest, dense_index, near_dup, vector_index  # noqa: E402
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    directory = tmp_path / "index"
+    monkeypatch.setattr(vector_index, "INDEX_DIR", directory)
+    monkeypatch.setattr(vector_index, "INDEX_FILE", directory / "index.json")
+    monkeypatch.setattr(vector_index, "CORPUS_MANIFEST_FILE", directory / "corpus_manifest.json")
+    monkeypatch.setattr(dense_index, "EMBEDDINGS_URL", "")
+    monkeypatch.setattr(near_dup, "MODE", "link")
+    monkeypatch.setattr(corpus_ingest, "CHUNK_MODE", "size")
+    monkeypatch.setattr(corpus_ingest, "CHUNK_SIZE", 200)
+    monkeypatch.setattr(corpus_ingest, "CHUNK_OVERLAP", 0)
+    vector_index.reset()
+    yield vector_index
+    vector_index.reset()
@@ -0,0 +1,105 @@
+"""
+Banc de concurrence /chat : N requêtes en parallèle doivent durer ~1 génération, pas N.
+
+Avec --fake-delay, un faux LM Studio (réponse après DELAY secondes) écoute sur
+--fake-port ; l'API doit alors être lancée avec
+    LMSTUDIO_URL=http://127.0.0.1:<fake-port>/v1/chat/completions
+Pendant le banc, /health est interrogé en continu : sa latence mesure le blocage
+de la boucle d'événements.
+
+    python scripts/bench_chat_concurrency.py --fake-delay 2 --wait 20 -n 8
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def start_fake_lmstudio(port, delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(delay)
+            body = json.dumps({"choices": [{"message": {"content": "réponse simulée"}}]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def post_chat(api, i):
+    payload = {"messages": [{"role": "user", "content": f"Question de charge numéro {i} sur la gouvernance"}],
+               "session_id": f"bench-{i}"}
+    req = urllib.request.Request(api + "/chat", data=json.dumps(payload).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=120) as resp:
+        provider = json.loads(resp.read().decode("utf-8")).get("provider")
+    return time.perf_counter() - start, provider
+
+
+def poll_health(api, stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            urllib.request.urlopen(api + "/health", timeout=30).read()
+            samples.append(time.perf_counter() - start)
+        except Exception:
+            pass
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("-n", type=int, default=8, help="requêtes /chat simultanées")
+    parser.add_argument("--fake-delay", type=float, default=0.0, help="démarre un faux LM Studio (secondes par réponse)")
+    parser.add_argument("--fake-port", type=int, default=1235)
+    parser.add_argument("--wait", type=float, default=0.0, help="attente avant le banc (lancement de l'API)")
+    args = parser.parse_args()
+
+    if args.fake_delay > 0:
+        start_fake_lmstudio(args.fake_port, args.fake_delay)
+        print(f"faux LM Studio : http://127.0.0.1:{args.fake_port}/v1/chat/completions ({args.fake_delay}s)")
+    if args.wait:
+        time.sleep(args.wait)
+
+    post_chat(args.api, -1)  # échauffement (chargement de l'index, du pool HTTP)
+
+    stop = threading.Event()
+    health: list = []
+    poller = threading.Thread(target=poll_health, args=(args.api, stop, health), daemon=True)
+    poller.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.n) as pool:
+        results = list(pool.map(lambda i: post_chat(args.api, i), range(args.n)))
+    wall = time.perf_counter() - start
+    stop.set()
+    poller.join()
+
+    latencies = sorted(lat for lat, _ in results)
+    print(f"{args.n} /chat simultanés : {wall:.2f}s au total, "
+          f"latence min {latencies[0]:.2f}s / max {latencies[-1]:.2f}s")
+    print("providers :", sorted({provider for _, provider in results}))
+    if args.fake_delay > 0:
+        serial = args.n * args.fake_delay
+        print(f"exécution en série : ~{serial:.2f}s -> accélération x{serial / wall:.1f}")
+    if health:
+        health.sort()
+        print(f"/health pendant le banc : {len(health)} appels, médiane {health[len(health) // 2] * 1000:.0f} ms, "
+              f"max {health[-1] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
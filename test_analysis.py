@@ -0,0 +1,41 @@
+"""
+Tests unitaires de l'analyse de texte (api.core.analysis) : repli des accents,
+mots vides et racinisation légère du français.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import analysis  # noqa: E402
+
+
+def test_fold_removes_accents_ligatures_and_case():
+    """Accents, ligatures et majuscules sont repliés avant l'indexation."""
+    assert analysis.fold("Résumé des ÉLÈVES") == "resume des eleves"
+    assert analysis.fold("Œuvre, cœur, Æsop") == "oeuvre, coeur, aesop"
+    assert analysis.fold("") == ""
+
+
+def test_stem_merges_plural_and_derived_forms():
+    """Pluriels et suffixes courants mènent au même terme ; mots courts et nombres intacts."""
+    assert set(analysis.tokenize("gouvernance gouvernances gouverner")) == {"gouvern"}
+    assert set(analysis.tokenize("harcèlement harcelements")) == {"harcel"}
+    assert analysis.tokenize("élève élèves ELEVES") == ["elev"] * 3
+    assert analysis.stem("vote") == "vote"  # trop court pour être racinisé
+    assert analysis.stem("2024") == "2024"
+    assert analysis.stem("ees") == "ees"  # jamais de racine plus courte que _MIN_STEM
+
+
+def test_stop_words_and_short_words_are_dropped():
+    """Mots vides (même accentués) et mots d'une lettre ne sont pas indexés."""
+    assert analysis.tokenize("Le budget est voté et a été adopté") == ["budget", "vote", "adopt"]
+    assert analysis.term("Les") is None
+    assert analysis.term("été") is None
+    assert analysis.term("a") is None
+    assert analysis.term("Élèves") == "elev"
+
+
+def test_surface_keeps_the_written_form():
+    """``surface`` associe le mot tel qu'écrit (en minuscules) à son terme indexé."""
+    assert analysis.surface("Les Élèves du collège") == [("élèves", "elev"), ("collège", "colleg")]
@@ -0,0 +1,153 @@
+"""
+Tests unitaires du disjoncteur par backend (api.core.circuit_breaker) :
+closed -> open -> half_open -> closed / open, avec une horloge simulée.
+"""
+import sys
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import circuit_breaker  # noqa: E402
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"HTTP {status_code}")
+        self.response = type("Response", (), {"status_code": status_code})()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", fake)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(circuit_breaker, "WINDOW", 30.0)
+    monkeypatch.setattr(circuit_breaker, "MIN_CALLS", 2)
+    monkeypatch.setattr(circuit_breaker, "FAILURE_RATE", 0.5)
+    monkeypatch.setattr(circuit_breaker, "OPEN_SECONDS", 10.0)
+    return fake
+
+
+def _fail(backend: str, times: int = 1) -> None:
+    for _ in range(times):
+        with pytest.raises(TimeoutError):
+            with circuit_breaker.guard(backend):
+                raise TimeoutError("délai dépassé")
+
+
+def test_opens_after_failures_and_rejects_calls(clock):
+    """Au-delà de MIN_CALLS échecs sur la fenêtre, le disjoncteur s'ouvre et refuse les appels."""
+    _fail("lmstudio")
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.CLOSED
+    _fail("lmstudio")
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.OPEN
+    with pytest.raises(circuit_breaker.BreakerOpenError):
+        with circuit_breaker.guard("lmstudio"):
+            pytest.fail("appel exécuté malgré le disjoncteur ouvert")
+    assert circuit_breaker.snapshot()["lmstudio"]["trips"] == 1
+
+
+def test_half_open_trial_success_closes(clock):
+    """Après OPEN_SECONDS, un seul appel d'essai passe ; son succès referme le disjoncteur."""
+    _fail("lmstudio", 2)
+    clock.now += 10.0
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.HALF_OPEN
+    assert circuit_breaker.allow("lmstudio")
+    assert not circuit_breaker.allow("lmstudio")  # un seul essai à la fois
+    circuit_breaker.record("lmstudio", True)
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.CLOSED
+    assert circuit_breaker.allow("lmstudio")
+
+
+def test_half_open_trial_failure_reopens(clock):
+    """L'échec de l'appel d'essai rouvre le disjoncteur pour une nouvelle période."""
+    _fail("lmstudio", 2)
+    clock.now += 10.0
+    _fail("lmstudio")
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.OPEN
+    clock.now += 5.0
+    assert not circuit_breaker.allow("lmstudio")
+    clock.now += 5.0
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.HALF_OPEN
+    assert circuit_breaker.snapshot()["lmstudio"]["trips"] == 2
+
+
+def test_abandoned_trial_allows_a_new_one(clock):
+    """Un appel d'essai abandonné (sans verdict) libère la place pour un autre essai."""
+    _fail("lmstudio", 2)
+    clock.now += 10.0
+    assert circuit_breaker.allow("lmstudio")
+    circuit_breaker.record("lmstudio", None)
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.HALF_OPEN
+    assert circuit_breaker.allow("lmstudio")
+
+
+def test_client_errors_and_old_failures_do_not_trip(clock):
+    """Les réponses 4xx ne comptent pas comme échecs, ni les échecs sortis de la fenêtre."""
+    for _ in range(3):
+        with pytest.raises(_HTTPError):
+            with circuit_breaker.guard("openai"):
+                raise _HTTPError(400)
+    assert circuit_breaker.state("openai") == circuit_breaker.CLOSED
+
+    _fail("openai")
+    clock.now += 31.0
+    _fail("openai")
+    assert circuit_breaker.state("openai") == circuit_breaker.CLOSED
+    with pytest.raises(_HTTPError):
+        with circuit_breaker.guard("openai"):
+            raise _HTTPError(503)
+    assert circuit_breaker.state("openai") == circuit_breaker.OPEN
+
+
+def test_backends_are_independent(clock):
+    """Chaque backend a son propre disjoncteur."""
+    _fail("lmstudio", 2)
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.OPEN
+    assert circuit_breaker.state("OpenAI") == circuit_breaker.CLOSED
+    with circuit_breaker.guard("openai"):
+        pass
+
+
+class _ProbeClient:
+    def __init__(self) -> None:
+        self.status_code: Optional[int] = 200  # None : backend injoignable
+
+    def get(self, url: str, timeout: float = 0.0):
+        if self.status_code is None:
+            raise ConnectionError("connexion refusée")
+        return type("Response", (), {"status_code": self.status_code})()
+
+
+def test_probe_failures_share_the_failure_window(clock, monkeypatch):
+    """Disjoncteur fermé, une sonde en échec compte comme un appel : seule, elle ne l'ouvre pas."""
+    probe = _ProbeClient()
+    monkeypatch.setattr(circuit_breaker.http_pool, "client", lambda name: probe)
+    with circuit_breaker._LOCK:
+        circuit_breaker._get_locked("lmstudio").probe_url = "http://lmstudio/v1/models"
+
+    probe.status_code = None
+    circuit_breaker._probe_once()
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.CLOSED
+    assert circuit_breaker.snapshot()["lmstudio"]["failures"] == 1
+    _fail("lmstudio")  # un appel en échec de plus : seuil atteint
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.OPEN
+
+    probe.status_code = 503
+    circuit_breaker._probe_once()
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.OPEN
+    probe.status_code = 200
+    circuit_breaker._probe_once()
+    assert circuit_breaker.state("lmstudio") == circuit_breaker.CLOSED
+    assert circuit_breaker.snapshot()["lmstudio"]["healthy"] is True
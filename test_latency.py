@@ -0,0 +1,123 @@
+"""
+Tests unitaires des latences observées (api.core.latency) : délai adaptatif par tranche
+de prompt et de réponse, mesures censurées des timeouts et requêtes couvertes (hedging).
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import latency  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def samples(monkeypatch):
+    monkeypatch.setattr(latency, "_samples", {})
+    monkeypatch.setattr(latency, "_floors", {})
+    monkeypatch.setattr(latency, "_hedges", {"fired": 0, "won": 0})
+    monkeypatch.setattr(latency, "MIN_SAMPLES", 5)
+    monkeypatch.setattr(latency, "TIMEOUT_FACTOR", 2.0)
+    monkeypatch.setattr(latency, "TIMEOUT_MIN", 1.0)
+    monkeypatch.setattr(latency, "TIMEOUT_MAX", 60.0)
+
+
+def test_timeout_follows_p99_once_enough_samples():
+    """Le délai par défaut tient jusqu'à MIN_SAMPLES mesures, puis vaut p99 x facteur, borné."""
+    for _ in range(4):
+        latency.record("lmstudio", 500, 3.0)
+    assert latency.timeout("lmstudio", 500, 6.0) == 6.0
+    latency.record("lmstudio", 500, 4.0)
+    assert latency.timeout("lmstudio", 500, 6.0) == 8.0
+    assert latency.timeout("lmstudio", 20000, 6.0) == 6.0  # autre tranche de prompt : sans mesures
+
+    for _ in range(5):
+        latency.record("openai", 500, 0.1)
+        latency.record("cloud", 500, 50.0)
+    assert latency.timeout("openai", 500, 6.0) == 1.0
+    assert latency.timeout("cloud", 500, 6.0) == 60.0
+
+
+def test_timeout_is_scaled_by_expected_output_length():
+    """Les réponses longues (max_tokens) ont leurs propres mesures, donc leur propre délai."""
+    for _ in range(5):
+        latency.record("lmstudio", 500, 1.0, max_tokens=128)
+        latency.record("lmstudio", 500, 10.0, max_tokens=2048)
+    assert latency.timeout("lmstudio", 500, 6.0, max_tokens=200) == 2.0
+    assert latency.timeout("lmstudio", 500, 6.0, max_tokens=4000) == 20.0
+    assert latency.timeout("lmstudio", 500, 6.0) == 6.0
+
+
+def test_timeouts_are_censored_samples_and_back_off():
+    """Un timeout compte comme mesure minorante et relève le délai jusqu'au prochain succès."""
+    for _ in range(5):
+        latency.record("lmstudio", 500, 0.5)
+    assert latency.timeout("lmstudio", 500, 6.0) == 1.0
+
+    latency.record_timeout("lmstudio", 500, 1.0)
+    assert latency.timeout("lmstudio", 500, 6.0) == 2.0
+    latency.record_timeout("lmstudio", 500, 2.0)
+    assert latency.timeout("lmstudio", 500, 6.0) == 4.0  # chaque timeout consécutif allonge le délai
+
+    latency.record("lmstudio", 500, 0.5)
+    assert latency.timeout("lmstudio", 500, 6.0) == 4.0  # p99 des mesures censurées : 2 s x 2
+
+
+def test_measure_records_timeouts_but_not_other_errors():
+    """``measure`` garde les timeouts (censurés) mais ignore les échecs immédiats."""
+    with pytest.raises(ConnectionError):
+        with latency.measure("lmstudio", 500):
+            raise ConnectionError("connexion refusée")
+    assert latency._samples == {}
+
+    with pytest.raises(TimeoutError):
+        with latency.measure("lmstudio", 500):
+            raise TimeoutError("délai dépassé")
+    assert len(latency._samples[("lmstudio", "<1k/-")]) == 1
+    assert latency.timeout("lmstudio", 500, 0.0) > 0.0  # plancher posé par le timeout
+
+
+def _answer(value, seconds, fail=False):
+    async def call():
+        await asyncio.sleep(seconds)
+        if fail:
+            raise RuntimeError(value)
+        return value
+
+    return call
+
+
+def test_hedged_primary_answers_before_delay():
+    """Réponse avant le délai : pas de requête de secours."""
+    result = asyncio.run(latency.hedged(_answer("local", 0.0), _answer("cloud", 0.0), 0.5))
+    assert result == ("local", False)
+    assert latency.snapshot()["hedges"] == {"fired": 0, "won": 0}
+
+
+def test_hedged_secondary_wins_when_primary_is_slow():
+    """Sans réponse au délai, le secours part ; le premier arrivé l'emporte."""
+    result = asyncio.run(latency.hedged(_answer("local", 1.0), _answer("cloud", 0.0), 0.01))
+    assert result == ("cloud", True)
+    assert latency.snapshot()["hedges"] == {"fired": 1, "won": 1}
+
+
+def test_hedged_survives_one_failure_and_raises_when_both_fail():
+    """L'échec d'un des deux appels est ignoré ; l'erreur ne remonte que si les deux échouent."""
+    result = asyncio.run(latency.hedged(_answer("local", 0.05), _answer("cloud", 0.0, fail=True), 0.01))
+    assert result == ("local", False)
+    with pytest.raises(RuntimeError):
+        asyncio.run(latency.hedged(_answer("local", 0.05, fail=True), _answer("cloud", 0.0, fail=True), 0.01))
+
+
+def test_hedged_without_delay_only_calls_primary():
+    """Hedging désactivé ou sans mesures (``delay`` à ``None``) : seul l'appel principal part."""
+    calls = []
+
+    async def secondary():
+        calls.append("cloud")
+        return "cloud"
+
+    assert asyncio.run(latency.hedged(_answer("local", 0.0), secondary, None)) == ("local", False)
+    assert calls == []
@@ -0,0 +1,50 @@
+"""
+Tests unitaires de la mémoire conversationnelle (api.core.memory) : LRU borné des
+sessions, relecture d'une session évincée et sessions en cours d'utilisation.
+"""
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import memory  # noqa: E402
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    directory = tmp_path / "_memory"
+    monkeypatch.setattr(memory, "MEMORY_DIR", directory)
+    monkeypatch.setattr(memory, "MEMORY_FILE", directory / "conversation_state.json")
+    monkeypatch.setattr(memory, "SESSIONS_DIR", directory / "sessions")
+    monkeypatch.setattr(memory, "_sessions", OrderedDict())
+    monkeypatch.setattr(memory, "MAX_SESSIONS", 2)
+    return memory._sessions
+
+
+def test_least_recently_used_session_is_evicted_then_reloaded(sessions):
+    """Au-delà de MAX_SESSIONS, la session la moins récente sort du LRU ; son journal la restitue."""
+    memory.remember_interaction("Qui contacter ?", "La vie scolaire.", session_id="a")
+    memory.remember_interaction("Horaires ?", "8 h - 17 h.", session_id="b")
+    memory.get_history("a")  # "a" redevient la plus récente
+    memory.remember_interaction("Menus ?", "Affichés le lundi.", session_id="c")
+    assert list(sessions) == ["a", "c"]
+
+    history = memory.get_history("b")
+    assert [item["user"] for item in history] == ["Horaires ?"]
+    assert list(sessions) == ["c", "b"]
+
+
+def test_session_in_use_is_never_evicted(sessions):
+    """Une session en cours d'utilisation reste dans le LRU (pas de seconde copie du journal)."""
+    with memory._session("a") as session:
+        for other in ("b", "c", "d"):
+            memory.remember_interaction("Question", "Réponse", session_id=other)
+        assert list(sessions) == ["a", "d"]  # "a", la plus ancienne, est épargnée
+        with memory._session("b"), memory._session("c"):
+            assert list(sessions) == ["a", "b", "c"]  # dépassement toléré tant que toutes sont utilisées
+        assert list(sessions) == ["a", "b"]  # ramené à MAX_SESSIONS dès la libération
+    memory.get_history("a")
+    assert sessions["a"] is session
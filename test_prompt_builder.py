@@ -0,0 +1,78 @@
+"""
+Tests unitaires de l'assemblage du prompt sous budget (api.core.prompt_builder) :
+priorités, troncature, sections écartées et doublons.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import prompt_builder  # noqa: E402
+from api.core.prompt_builder import PromptBuilder, estimate_tokens  # noqa: E402
+
+SYSTEM = "Tu es ÉlyonEU, IA locale gouvernance."
+LONG = " ".join(f"Phrase numéro {i} du règlement intérieur du collège." for i in range(200))
+
+
+def test_everything_fits_in_order_of_addition():
+    """Sous le budget, toutes les sections sont gardées dans l'ordre d'ajout, pas de priorité."""
+    builder = PromptBuilder(500)
+    builder.add("system", SYSTEM, priority=0)
+    builder.add("memory", "Contexte récent : la famille a déjà écrit à la vie scolaire.", priority=4)
+    builder.add("message_0", "Que faire en cas de harcèlement ?", priority=1, role="user")
+    messages, report = builder.build()
+    assert [m["role"] for m in messages] == ["system", "system", "user"]
+    assert messages[0]["content"] == SYSTEM
+    assert report["sections"] == {"system": "kept", "message_0": "kept", "memory": "kept"}
+    assert report["used"] == sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def test_low_priority_sections_are_truncated_then_dropped():
+    """Une section tronquable qui déborde est coupée au reliquat ; sans reliquat suffisant, elle est écartée."""
+    builder = PromptBuilder(200)
+    builder.add("system", SYSTEM, priority=0)
+    builder.add("rag", LONG, priority=2, truncate="head")
+    builder.add("history", LONG, priority=10, truncate="tail")
+    messages, report = builder.build()
+    assert report["sections"] == {"system": "kept", "rag": "truncated", "history": "dropped"}
+    used, dropped = report["used"], report["dropped"]
+    assert isinstance(used, int) and isinstance(dropped, int)
+    assert used <= 200 and dropped > estimate_tokens(LONG)
+    rag = builder.kept("rag")
+    assert rag is not None and rag.startswith("Phrase numéro 0") and rag.endswith("[…]")
+    assert builder.kept("history") is None
+    assert len(messages) == 2
+
+
+def test_tail_truncation_keeps_the_end_of_the_message():
+    """``truncate="tail"`` garde la fin du texte (la question d'un long message utilisateur)."""
+    builder = PromptBuilder(prompt_builder.MIN_TRUNCATED_TOKENS + 20)
+    builder.add("message_0", LONG + " Ma question : qui prévenir ?", priority=1, role="user", truncate="tail")
+    messages, report = builder.build()
+    assert report["sections"] == {"message_0": "truncated"}
+    assert messages[0]["content"].startswith("[…]") and messages[0]["content"].endswith("qui prévenir ?")
+    assert estimate_tokens(messages[0]["content"]) <= builder.budget
+
+
+def test_untruncatable_section_over_budget_is_dropped_whole():
+    """Une section non tronquable qui déborde est écartée, pas coupée."""
+    builder = PromptBuilder(100)
+    builder.add("system", SYSTEM, priority=0)
+    builder.add("intent", LONG, priority=3)
+    messages, report = builder.build()
+    assert report["sections"] == {"system": "kept", "intent": "dropped"}
+    assert messages == [{"role": "system", "content": SYSTEM}]
+
+
+def test_duplicates_of_higher_priority_sections_are_removed():
+    """Lignes et messages déjà présents dans une section plus prioritaire ne sont pas répétés."""
+    question = "Comment signaler un cas de harcèlement au collège ?"
+    builder = PromptBuilder(500)
+    builder.add("memory", f"Résumé :\n{question}\nRéponse : prévenir la vie scolaire.", priority=4)
+    builder.add("message_0", question, priority=1, role="user")
+    messages, report = builder.build()
+    sections = report["sections"]
+    assert isinstance(sections, dict) and sections["message_0"] == "kept"
+    memory = builder.kept("memory")
+    assert memory is not None and question not in memory
+    assert messages[-1] == {"role": "user", "content": question}
@@ -0,0 +1,153 @@
+"""
+Tests unitaires de la recherche (api.core.vector_index.search) : fonctions de classement
+(fixture ``index`` : voir conftest.py).
+"""
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import near_dup, vector_index  # noqa: E402
+
+
+def _ids(hits):
+    return [hit["doc_id"] for hit in hits]
+
+
+def _scores(hits):
+    return {hit["doc_id"]: hit["score"] for hit in hits}
+
+
+def test_scorer_base_class_is_abstract(index, monkeypatch):
+    """``Scorer`` ne s'instancie pas ; une sous-classe enregistrée est utilisable par ``search``."""
+    with pytest.raises(TypeError):
+        vector_index.Scorer()  # type: ignore[abstract]
+
+    class FirstTerm(vector_index.Scorer):
+        name = "first_term"
+
+        def score(self, index, query_freq, options):
+            term = next(iter(query_freq))
+            return {doc_id: float(count) for doc_id, count in index["postings"].get(term, {}).items()}
+
+    monkeypatch.setitem(vector_index._SCORERS, "first_term", FirstTerm())
+    index.ingest("budget du collège", doc_id="a")
+    index.ingest("budget budget budget", doc_id="b")
+    assert _ids(index.search("budget", scorer="first_term")) == ["b", "a"]
+    with pytest.raises(ValueError):
+        index.search("budget", scorer="inconnu")
+
+
+def test_bm25_term_frequency_saturates_and_length_normalizes(index):
+    """BM25 : plus d'occurrences classe plus haut ; à fréquence égale, le document court l'emporte si b > 0."""
+    index.ingest("budget budget budget du conseil", doc_id="many")
+    index.ingest("budget du conseil et vote des élèves", doc_id="once")
+    index.ingest("menus de la cantine", doc_id="other")
+    assert _ids(index.search("budget", top_k=3, scorer="bm25")) == ["many", "once"]
+
+    index.ingest("charte informatique", doc_id="short")
+    index.ingest("charte informatique signée par les élèves, les familles et les personnels", doc_id="long")
+    hits = _scores(index.search("charte", top_k=2, scorer="bm25"))
+    assert hits["short"] > hits["long"]
+    flat = _scores(index.search("charte", top_k=2, scorer="bm25", b=0.0))
+    assert flat["short"] == flat["long"]
+
+
+def test_bm25f_field_boosts_rank_title_matches(index):
+    """BM25F : un terme du titre compte selon ``field_boosts`` ; boost nul, le champ est ignoré."""
+    index.ingest("Le conseil vote en juin.", doc_id="titled", metadata={"title": "Budget annuel"})
+    index.ingest("Le budget est présenté au conseil puis voté.", doc_id="body")
+
+    assert set(_ids(index.search("budget", top_k=2, scorer="bm25"))) == {"titled", "body"}
+    assert _ids(index.search("budget", top_k=2, scorer="bm25", field_boosts={"title": 10.0}))[0] == "titled"
+    assert _ids(index.search("budget", top_k=2, scorer="bm25", field_boosts={"title": 0.0})) == ["body"]
+    assert _ids(index.search("budget", top_k=2, scorer="tfidf")) == ["body"]  # TF-IDF : corps seul
+
+
+def test_query_cache_hits_until_the_index_generation_changes(index, monkeypatch):
+    """Une requête répétée sort du cache ; toute modification de l'index l'invalide."""
+    monkeypatch.setattr(vector_index, "_query_cache", OrderedDict())
+    monkeypatch.setattr(vector_index, "_query_cache_stats", {"hits": 0, "misses": 0})
+    index.ingest("budget du conseil", doc_id="a")
+
+    first = index.search("budget conseil")
+    assert index.search("conseil budget") == first  # même multiensemble de termes
+    assert vector_index._query_cache_stats == {"hits": 1, "misses": 1}
+
+    first[0]["score"] = -1.0  # les résultats rendus sont des copies
+    assert index.search("budget conseil")[0]["score"] > 0
+
+    index.ingest("budget de la cantine", doc_id="b")
+    assert sorted(_ids(index.search("budget conseil", top_k=5))) == ["a", "b"]
+    assert vector_index._query_cache_stats["misses"] == 2
+
+
+def test_metadata_filters_and_fields_or_values(index):
+    """Filtres : ET entre champs, OU entre valeurs, ``None`` accepte l'absence du champ."""
+    index.ingest("protocole harcèlement", doc_id="staff", metadata={"source": "corpus", "roles": ["enseignant", "cpe"]})
+    index.ingest("protocole harcèlement élèves", doc_id="pupils", metadata={"source": "corpus", "roles": "eleve"})
+    index.ingest("protocole harcèlement familles", doc_id="open", metadata={"source": "upload"})
+
+    def found(filters):
+        return sorted(_ids(index.search("protocole harcèlement", top_k=5, filters=filters)))
+
+    assert found(None) == ["open", "pupils", "staff"]
+    assert found({"roles": "cpe"}) == ["staff"]
+    assert found({"roles": ["cpe", "eleve"]}) == ["pupils", "staff"]
+    assert found({"roles": ["eleve", None]}) == ["open", "pupils"]
+    assert found({"source": "corpus", "roles": "eleve"}) == ["pupils"]
+    assert found({"source": "upload", "roles": "eleve"}) == []
+    assert found({"roles": "direction"}) == []
+
+    index.ingest("protocole harcèlement élèves", doc_id="pupils", metadata={"source": "upload"})
+    assert found({"roles": "eleve"}) == []  # valeurs retirées avec l'ancienne version
+    assert found({"source": "upload"}) == ["open", "pupils"]
+
+
+def test_mmr_diversity_demotes_redundant_results(index, monkeypatch):
+    """MMR : sans diversité, l'ordre suit la pertinence ; avec, un quasi-doublon cède sa place."""
+    monkeypatch.setattr(near_dup, "MODE", "off")  # garder les deux versions proches
+    index.ingest("budget budget conseil vote annuel", doc_id="budget_1")
+    index.ingest("budget budget conseil vote annuel juin", doc_id="budget_2")
+    index.ingest("budget cantine menus", doc_id="canteen")
+
+    relevance = _ids(index.search("budget", top_k=2))
+    assert relevance == _ids(index.search("budget", top_k=2, diversity=0.0))
+    assert set(relevance) == {"budget_1", "budget_2"}
+
+    diverse = _ids(index.search("budget", top_k=2, diversity=0.7))
+    assert diverse[0] == relevance[0]  # le plus pertinent reste en tête
+    assert diverse[1] == "canteen"
+    assert len(_ids(index.search("budget", top_k=3, diversity=1.0))) == 3
+
+
+def test_suggest_completes_titles_then_vocabulary(index, monkeypatch):
+    """Autocomplétion : titres commençant par la saisie, puis dernier mot complété par le vocabulaire."""
+    monkeypatch.setattr(vector_index, "_suggest_index", {"generation": -1, "terms": None, "titles": None, "surfaces": {}})
+    index.ingest("Signaler les harcèlements : le harcèlement scolaire", doc_id="h", metadata={"title": "Protocole harcèlement"})
+    index.ingest("Le harcèlement en ligne", doc_id="h2", metadata={"title": "Harcèlement en ligne"})
+    index.ingest("Le projet d'établissement", doc_id="p", metadata={"title": "Projet d'établissement"})
+
+    assert index.suggest("harc") == [
+        {"text": "Harcèlement en ligne", "kind": "title", "weight": 1},
+        {"text": "harcèlement", "kind": "term", "weight": 2},  # forme écrite la plus fréquente
+    ]
+    assert index.suggest("proto") == [{"text": "Protocole harcèlement", "kind": "title", "weight": 1}]
+    assert index.suggest("que faire en cas de harce") == [
+        {"text": "que faire en cas de harcèlement", "kind": "term", "weight": 2}
+    ]
+    assert len(index.suggest("harc", limit=1)) == 1
+    assert index.suggest("zz") == index.suggest("") == index.suggest("harc", limit=0) == []
+
+
+def test_misspelled_query_terms_are_corrected_before_scoring(index):
+    """Les termes inconnus de la requête sont corrigés vers le vocabulaire de l'index."""
+    index.ingest("La gouvernance du collège et le harcèlement scolaire", doc_id="a")
+    index.ingest("Les menus de la cantine", doc_id="b")
+    terms, corrections = index.correct_terms(["gouvernn", "harcelemnt", "cantin"])
+    assert terms == ["gouvern", "harcel", "cantin"]
+    assert corrections == {"gouvernn": "gouvern", "harcelemnt": "harcel"}
+    assert _ids(index.search("gouvernnance harcelemnt")) == ["a"]
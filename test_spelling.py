@@ -0,0 +1,64 @@
+"""
+Tests unitaires de la correction orthographique des requêtes (api.core.spelling) :
+distance de Damerau-Levenshtein, suppressions symétriques et suffixes mal orthographiés.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import analysis, spelling  # noqa: E402
+
+VOCABULARY = {"gouvern": 3, "harcel": 5, "regl": 2, "budget": 4, "bulletin": 1, "scolair": 2}
+
+
+@pytest.fixture
+def vocabulary(monkeypatch):
+    monkeypatch.setattr(spelling, "_state", spelling._empty())
+    monkeypatch.setattr(spelling, "_staged", None)
+    monkeypatch.setattr(spelling, "MAX_DISTANCE", 2)
+    spelling.rebuild(VOCABULARY)
+    return dict(VOCABULARY)
+
+
+def test_distance_counts_adjacent_transpositions_once():
+    """Transposition adjacente = 1 ; au-delà de ``limit``, la distance est plafonnée à ``limit + 1``."""
+    assert spelling.distance("budget", "budget", 2) == 0
+    assert spelling.distance("bugdet", "budget", 2) == 1
+    assert spelling.distance("budgt", "budget", 2) == 1
+    assert spelling.distance("bulletin", "budget", 2) == 3
+
+
+def test_unknown_terms_are_corrected_to_the_closest_known_term(vocabulary):
+    """Terme inconnu : candidat le plus proche ; termes connus, courts ou trop éloignés : ``None``."""
+    assert spelling.correct("bugdet", vocabulary) == "budget"
+    assert spelling.correct("gouvernn", vocabulary) == "gouvern"  # 8 caractères : deux fautes tolérées
+    assert spelling.correct("scolari", vocabulary) == "scolair"
+    assert spelling.correct("budget", vocabulary) is None
+    assert spelling.correct("bdg", vocabulary) is None  # trop court
+    assert spelling.correct("cantine", vocabulary) is None
+
+
+def test_misspelled_suffix_falls_back_to_the_known_stem(vocabulary):
+    """Une faute dans le suffixe empêche la racinisation : le terme est ramené à sa racine connue."""
+    term = analysis.tokenize("harcelemnt")[0]
+    assert term == "harcelemnt"
+    assert spelling.correct(term, vocabulary) == "harcel"
+
+
+def test_vocabulary_updates_and_staged_rebuild(vocabulary):
+    """Termes ajoutés ou retirés un à un ; une table préparée ne sert qu'après ``publish``."""
+    vocabulary["cantin"] = 1
+    spelling.update(added=["cantin"])
+    assert spelling.correct("cantni", vocabulary) == "cantin"
+    spelling.update(removed=["budget"])
+    del vocabulary["budget"]
+    assert spelling.correct("bugdet", vocabulary) is None
+
+    spelling.stage()
+    spelling.update(added=["budget"])
+    assert spelling.correct("cantni", vocabulary) == "cantin"  # table courante jusqu'à la publication
+    spelling.publish()
+    assert spelling.stats()["terms"] == 1
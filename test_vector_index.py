@@ -0,0 +1,250 @@
+"""
+Tests unitaires de l'index documentaire (api.core.vector_index) : segments, rechargement,
+synchronisation, passages et quasi-doublons (fixture ``index`` : voir conftest.py).
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api.core import index_segment, near_dup  # noqa: E402
+
+GOVERNANCE = (
+    "Le conseil d'administration du collège vote le budget annuel, adopte le règlement intérieur "
+    "et valide le projet d'établissement après consultation des représentants des familles."
+)
+HARASSMENT = (
+    "Tout élève témoin de harcèlement scolaire doit prévenir sans attendre un adulte de confiance, "
+    "qui informe la direction et déclenche le protocole de prise en charge prévu par l'établissement."
+)
+CANTEEN = (
+    "La cantine accueille les demi-pensionnaires de midi à quatorze heures ; les menus de la semaine "
+    "sont affichés chaque lundi dans le hall et publiés sur l'espace numérique de travail."
+)
+
+
+def _ids(hits):
+    return [hit["doc_id"] for hit in hits]
+
+
+def test_segment_round_trip(tmp_path):
+    """Un segment relu restitue textes, métadonnées, fréquences et DF ; l'ancienne génération est supprimée."""
+    docs = [
+        ("a", "premier texte", {"title": "A"}, 2, {"premi": 1, "text": 1}),
+        ("b", "", {}, 0, {}),
+        ("c", "texte accentué é", {"tags": ["x", "y"]}, 2, {"text": 1, "accentu": 1}),
+    ]
+    refs = index_segment.write_segment(tmp_path, docs, analyzer=7)
+    assert [ref.read() for ref in refs] == ["premier texte", "", "texte accentué é"]
+
+    segment = index_segment.read_segment(tmp_path)
+    assert segment is not None
+    assert segment["analyzer"] == 7
+    assert segment["df"] == {"premi": 1, "text": 2, "accentu": 1}
+    for doc_id, text, metadata, length, term_freq in docs:
+        stored = segment["docs"][doc_id]
+        ref = stored.get("text_ref")
+        assert ref is not None and ref.read() == text
+        assert stored["metadata"] == metadata
+        assert stored["length"] == length
+        assert stored["term_freq"] == term_freq
+
+    index_segment.write_segment(tmp_path, docs[:1])
+    manifest = index_segment.read_manifest(tmp_path)
+    assert manifest is not None and manifest["generation"] == 2
+    assert not list(tmp_path.glob("*.1.bin"))
+    segment = index_segment.read_segment(tmp_path)
+    assert segment is not None and list(segment["docs"]) == ["a"]
+
+
+def test_delta_segments_are_applied_then_merged(tmp_path, monkeypatch):
+    """Les deltas ajoutent, remplacent et retirent des documents ; au-delà de MAX_DELTAS, on fusionne."""
+    monkeypatch.setattr(index_segment, "MAX_DELTAS", 2)
+    index_segment.write_segment(tmp_path, [("a", "alpha", {}, 1, {"alpha": 1}), ("b", "beta", {}, 1, {"beta": 1})])
+    refs = index_segment.write_delta(tmp_path, [("a", "gamma", {"v": 2}, 1, {"gamma": 1})], deleted=["b"])
+    assert refs is not None and [ref.read() for ref in refs] == ["gamma"]
+    assert index_segment.write_delta(tmp_path, [("c", "alpha", {}, 1, {"alpha": 1})], deleted=[]) is not None
+    assert index_segment.write_delta(tmp_path, [], deleted=["c"]) is None  # trop de deltas : fusion
+
+    segment = index_segment.read_segment(tmp_path)
+    assert segment is not None
+    assert sorted(segment["docs"]) == ["a", "c"]
+    assert segment["docs"]["a"]["metadata"] == {"v": 2}
+    assert segment["df"] == {"gamma": 1, "alpha": 1}
+
+    index_segment.write_segment(tmp_path, [("c", "alpha", {}, 1, {"alpha": 1})])
+    assert not list(tmp_path.glob(index_segment.DELTA_PREFIX + "*"))
+    segment = index_segment.read_segment(tmp_path)
+    assert segment is not None and list(segment["docs"]) == ["c"]
+
+
+def test_index_survives_reload(index):
+    """L'index persisté est rechargé depuis le segment avec les mêmes résultats de recherche."""
+    index.ingest(GOVERNANCE, doc_id="gov", metadata={"title": "Gouvernance"})
+    index.ingest(HARASSMENT, doc_id="har")
+    before = index.search("budget du conseil d'administration", top_k=2)
+    index.load()
+    assert index.stats()["doc_count"] == 2
+    assert _ids(index.search("budget du conseil d'administration", top_k=2)) == _ids(before)
+    assert index.snapshot()["docs"]["gov"]["metadata"] == {"title": "Gouvernance"}
+
+
+def test_small_ingest_writes_a_delta_instead_of_the_whole_segment(index):
+    """Une ingestion ponctuelle n'écrit qu'un delta ; retraits et remplacements survivent au rechargement."""
+    index.ingest(GOVERNANCE, doc_id="gov")
+    index.ingest(HARASSMENT, doc_id="har")
+    index.ingest(CANTEEN, doc_id="can")
+    manifest = index_segment.read_manifest(index.INDEX_DIR)
+    assert manifest is not None and [doc["id"] for doc in manifest["docs"]] == ["gov"]
+    assert len(list(index.INDEX_DIR.glob(index_segment.DELTA_PREFIX + "*"))) == 2
+
+    index.ingest(
+        "Le foyer des élèves ouvre le mercredi après-midi avec des ateliers de théâtre et de musique.",
+        doc_id="har",
+    )
+    index.ingest_many([{"text": CANTEEN, "doc_id": "can", "chunk": True}])  # "can" remplacé par "can#0"
+    assert len(list(index.INDEX_DIR.glob(index_segment.DELTA_PREFIX + "*"))) == 4
+    index.load()
+    assert sorted(index.snapshot()["docs"]) == ["can#0", "gov", "har"]
+    assert _ids(index.search("ateliers de théâtre", top_k=1)) == ["har"]
+    assert index.search("harcèlement scolaire") == []
+
+
+def test_sync_adds_updates_and_removes(index, tmp_path):
+    """La synchronisation n'indexe que les fichiers nouveaux ou modifiés et retire les fichiers disparus."""
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "gouvernance.txt").write_text(GOVERNANCE, encoding="utf-8")
+    (corpus / "harcelement.txt").write_text(HARASSMENT, encoding="utf-8")
+
+    summary = index.sync_corpus(corpus)
+    assert sorted(summary["added"]) == ["gouvernance", "harcelement"]
+    assert summary["unchanged"] == 0
+    assert index.search("harcèlement scolaire", top_k=1)[0]["metadata"]["parent_id"] == "harcelement"
+
+    summary = index.sync_corpus(corpus)
+    assert summary["added"] == summary["updated"] == summary["removed"] == []
+    assert summary["unchanged"] == 2
+
+    (corpus / "harcelement.txt").write_text(CANTEEN, encoding="utf-8")
+    (corpus / "gouvernance.txt").unlink()
+    summary = index.sync_corpus(corpus)
+    assert summary["updated"] == ["harcelement"]
+    assert summary["removed"] == ["gouvernance"]
+    docs = index.snapshot()["docs"]
+    assert all(doc["metadata"]["parent_id"] == "harcelement" for doc in docs.values())
+    assert index.search("budget du conseil d'administration") == []
+    assert index.search("harcèlement scolaire") == []
+    assert index.search("menus de la cantine", top_k=1)[0]["metadata"]["parent_id"] == "harcelement"
+
+
+def test_reindex_counts_documents_and_passages_separately(index, tmp_path):
+    """La réindexation complète compte les fichiers sources et, à part, les passages indexés."""
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "guide.txt").write_text(" ".join([GOVERNANCE, HARASSMENT, CANTEEN]), encoding="utf-8")
+    (corpus / "gouvernance.txt").write_text(GOVERNANCE.replace("budget annuel", "compte financier"), encoding="utf-8")
+
+    totals = index.reindex_corpus(corpus)
+    assert totals["documents"] == 2
+    assert totals["passages"] == index.stats()["doc_count"] > 2
+    assert index.reindex_corpus(tmp_path / "absent") == {"documents": 0, "passages": 0}
+
+
+def test_reingested_document_replaces_its_passages(index):
+    """Un document ré-ingéré (découpé ou entier) remplace tous ses anciens passages."""
+    long_text = " ".join([GOVERNANCE, HARASSMENT, CANTEEN])
+    report = index.ingest_many([{"text": long_text, "doc_id": "guide", "chunk": True}])
+    assert len(report.doc_ids) > 1
+    assert report.documents(report.doc_ids) == ["guide"]
+
+    index.ingest_many([{"text": CANTEEN, "doc_id": "guide", "chunk": True}])
+    docs = index.snapshot()["docs"]
+    assert sorted(docs) == ["guide#0"]
+    assert index.search("harcèlement scolaire") == []
+
+    index.ingest(GOVERNANCE, doc_id="guide")
+    docs = index.snapshot()["docs"]
+    assert sorted(docs) == ["guide"]
+    assert index.stats()["doc_count"] == 1
+    assert index.search("menus de la cantine") == []
+
+
+def test_near_duplicate_is_linked_then_restored(index):
+    """Un quasi-doublon est rattaché sans être indexé, puis ré-indexé quand son canonique change."""
+    assert index.ingest(GOVERNANCE, doc_id="original") == "original"
+    report = index.ingest_many([{"text": GOVERNANCE + " Copie.", "doc_id": "copie"}])
+    assert report.doc_ids == []
+    assert report.linked == {"copie": "original"}
+    assert "copie" not in index.snapshot()["docs"]
+    assert index.duplicate_clusters() == [
+        {"canonical": "original", "duplicates": ["copie"], "passages": 1, "min_similarity": pytest.approx(1.0, abs=0.2)}
+    ]
+
+    report = index.ingest_many([{"text": CANTEEN, "doc_id": "original"}])
+    assert report.restored == ["copie"]
+    assert sorted(index.snapshot()["docs"]) == ["copie", "original"]
+    assert index.duplicate_clusters() == []
+    assert _ids(index.search("budget du conseil d'administration", top_k=1)) == ["copie"]
+
+
+def test_reingested_duplicate_is_unlinked(index):
+    """Un doublon ré-ingéré avec un texte différent quitte son rattachement et est indexé."""
+    index.ingest(GOVERNANCE, doc_id="original")
+    assert index.ingest(GOVERNANCE, doc_id="copie") is None
+    assert index.ingest(HARASSMENT, doc_id="copie") == "copie"
+    assert index.duplicate_clusters() == []
+    assert sorted(index.snapshot()["docs"]) == ["copie", "original"]
+
+
+def test_duplicate_of_removed_file_is_restored_by_sync(index, tmp_path):
+    """Quand le fichier canonique disparaît, la synchronisation ré-indexe son doublon."""
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "b.txt").write_text(GOVERNANCE, encoding="utf-8")
+    index.sync_corpus(corpus)
+    (corpus / "a.txt").write_text(GOVERNANCE, encoding="utf-8")
+    index.sync_corpus(corpus)
+    assert "a#0" not in index.snapshot()["docs"]
+
+    (corpus / "b.txt").unlink()
+    summary = index.sync_corpus(corpus)
+    assert summary["removed"] == ["b"]
+    assert summary["restored"] == ["a#0"]
+    assert sorted(index.snapshot()["docs"]) == ["a#0"]
+
+
+def test_old_snapshot_reader_cannot_refill_replaced_weights(index, monkeypatch):
+    """Un lecteur d'un ancien snapshot ne réinjecte pas les poids d'une version remplacée."""
+    monkeypatch.setattr(index, "DF_TOLERANCE", 1000.0)
+    index.ingest(GOVERNANCE, doc_id="gov")
+    index.ingest(HARASSMENT, doc_id="har")
+    index.ingest(CANTEEN, doc_id="x")
+    old = index.snapshot()
+    index.ingest("Le gymnase rouvre ; gymnase et vestiaires rénovés.", doc_id="x")
+    # requête en cours sur l'ancien snapshot : remplit son cache avec l'ancien texte de "x"
+    index._SCORERS["tfidf"].score(old, {"cantin": 1}, {})
+    assert old["weights"] is not index.snapshot()["weights"]
+    assert _ids(index.search("gymnase", top_k=1)) == ["x"]
+
+
+def test_duplicate_text_is_persisted_by_reference_and_appended(index):
+    """Le texte d'un doublon est écrit sur disque (référence en mémoire) ; les sauvegardes ajoutent au journal."""
+    index.ingest(GOVERNANCE, doc_id="original")
+    index.ingest(GOVERNANCE + " Copie.", doc_id="copie", metadata={"title": "Copie"})
+    record = near_dup._state["links"]["copie"]
+    assert "text" not in record and record["offset"] >= 0
+    ids_file = index.INDEX_DIR / near_dup.IDS_FILE
+    lines = ids_file.read_text(encoding="utf-8").splitlines()
+
+    index.ingest(HARASSMENT, doc_id="har")
+    assert ids_file.read_text(encoding="utf-8").splitlines()[: len(lines)] == lines  # ajout, pas réécriture
+
+    index.load()
+    assert index.duplicate_clusters()[0]["duplicates"] == ["copie"]
+    report = index.ingest_many([{"text": CANTEEN, "doc_id": "original"}])
+    assert report.restored == ["copie"]
+    assert index.snapshot()["docs"]["copie"]["metadata"] == {"title": "Copie"}
+    assert _ids(index.search("budget du conseil d'administration", top_k=1)) == ["copie"]